@@ -1,33 +1,386 @@
 from abc import ABC, abstractmethod
+import asyncio
+from concurrent.futures import Future
+from contextlib import contextmanager
 import heapq
 import math
+import numpy as np
+import threading
 import time
 from typing import List
-from shot_verifier import verifyShotReachable
+from shot_verifier import verifyShotsReachable
 
 from Box2D.Box2D import b2Vec2
 
-from pool import Ball, Complexity, PoolBoard, Shot, random_float, PoolPlayer, PoolState, Pool
+from board import Ball, Complexity, PoolBoard, Shot, random_float, PoolPlayer, PoolState
+from world import PoolWorld, DEFAULT_WORLD_POOL
 from constants import Constants, Weights
+from shot_evaluator import ParallelShotEvaluator
+from search_profile import NO_PROFILE, SearchProfile
+from simulation_cache import SimulationCache
+from decision_log import DecisionLog
+
+class SearchCancelled(Exception):
+    pass
+
+# The shot a decision settled on, how long it took, the board it is predicted to leave
+# and how many of the reachable candidate shots were evaluated before it settled. The
+# heuristic and complexity are the ones the search scored the shot with, without
+# looking ahead
+class ShotDecision:
+
+    def __init__(self, shot : Shot, time : float, outcome : PoolBoard, evaluated : int = 0, candidates : int = 0, robustness : "RobustShot" = None, heuristic : float = None, complexity : Complexity = None):
+        self.shot = shot
+        self.time = time
+        self.outcome = outcome
+        self.evaluated = evaluated
+        self.candidates = candidates
+        self.heuristic = heuristic
+        self.complexity = complexity
+        # How the shot did when it was hit with errors, if the AI was given an ExecutionNoise
+        self.robustness = robustness
+
+    def coverage(self) -> float:
+        return self.evaluated / self.candidates if self.candidates > 0 else 1.0
+
+    def __str__(self):
+        return f"{self.shot} in {self.time:.2f} s, {self.coverage():.0%} of the shots evaluated"
+
+# How far off players hit the shots they aim for. The errors are normally distributed,
+# angle_error in degrees and magnitude_error as a fraction of the magnitude. The best
+# finalists shots of a decision are each simulated samples times with errors, and the
+# one with the best expected heuristic is taken. Every finalist is hit with the same
+# errors, so the finalists are compared on the same luck
+class ExecutionNoise:
+
+    def __init__(self, samples : int = 32, angle_error : float = 0.3, magnitude_error : float = 0.03, finalists : int = 5, seed : int = 0):
+        self.samples = samples
+        self.angle_error = angle_error
+        self.magnitude_error = magnitude_error
+        self.finalists = finalists
+        self.seed = seed
+
+# A finalist scored under ExecutionNoise. A sample succeeds when the shooter wins or
+# keeps the table
+class RobustShot:
+
+    def __init__(self, shot : "ComparableShot", heuristics : np.ndarray, successes : np.ndarray):
+        self.shot = shot
+        self.samples = len(heuristics)
+        self.expected_heuristic = float(heuristics.mean())
+        self.heuristic_deviation = float(heuristics.std())
+        self.success_probability = float(successes.mean())
+
+    def __str__(self):
+        return f"{self.shot.shot}: expected heuristic {self.expected_heuristic:.2f} +- {self.heuristic_deviation:.2f}, success {self.success_probability:.0%} over {self.samples} samples"
+
+# A decision running on a thread of its own, started by PoolAI.request_shot. result
+# waits for it like a concurrent.futures.Future, and cancel stops the search at the
+# next shot it would simulate, after which result raises SearchCancelled. With an
+# evaluator the chunks of shots waiting for a worker process are dropped, but the ones
+# already running in a worker finish first (see ParallelShotEvaluator.collect)
+class ShotSearch:
+
+    def __init__(self, ai : "PoolAI", board : PoolBoard):
+        self.future : Future = Future()
+        self.cancelled = threading.Event()
+        # Daemon, so an abandoned search does not keep the program alive
+        self.thread = threading.Thread(target=self.run, args=(ai, board), daemon=True)
+        self.thread.start()
+
+    def run(self, ai : "PoolAI", board : PoolBoard):
+        if not self.future.set_running_or_notify_cancel():
+            return
+        try:
+            decision = ai.decide(board, self.cancelled)
+        except BaseException as e:
+            self.future.set_exception(e)
+        else:
+            self.future.set_result(decision)
+
+    # Raises TimeoutError if the decision is not made within timeout seconds
+    def result(self, timeout : float = None) -> ShotDecision:
+        return self.future.result(timeout)
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    def cancel(self):
+        self.cancelled.set()
+        self.future.cancel()
 
 class PoolAI(ABC):
 
-    def __init__(self, player : PoolPlayer, magnitudes=[75.0, 100.0, 125.0], angles=range(0, 360)):
+    def __init__(self, player : PoolPlayer, magnitudes=[75.0, 100.0, 125.0], angles=range(0, 360), evaluator : ParallelShotEvaluator = None, world : PoolWorld = None, cache : SimulationCache = None, profiling : bool = False, time_budget : float = None, noise : ExecutionNoise = None):
         self.player = player
         self.magnitudes = magnitudes
         self.angles = angles
+        # When an evaluator is given the candidate shots are split across its worker processes
+        self.evaluator = evaluator
+        # The world shots are simulated in. Without one a world is checked out of
+        # DEFAULT_WORLD_POOL for every search, so searches can run at the same time
+        self.world = world
+        # When a cache is given shots that were already simulated from the same board
+        # are not simulated again
+        self.cache = cache
+        # With profiling on, every decision starts a new SearchProfile in profile. Shots
+        # evaluated by an evaluator are not profiled, they run in other processes
+        self.profiling = profiling
+        self.profile = NO_PROFILE
+        # Set while a ShotSearch runs, the search stops once it is set. An AI decides on
+        # one shot at a time
+        self.cancelled : threading.Event = None
+        # With a time budget a decision tries the most promising shots first, stops
+        # evaluating shots once it has taken time_budget seconds and settles on the best
+        # shot found so far. deadline is when the current decision runs out of time
+        self.time_budget = time_budget
+        self.deadline : float = None
+        # The reachable candidate shots of the current decision and how many of them
+        # were evaluated
+        self.shots_candidates = 0
+        self.shots_evaluated = 0
+        # With noise the finalists of a decision are compared by how they do when hit
+        # with errors, robust_shots holds them best first
+        self.noise = noise
+        self.robust_shots : List[RobustShot] = []
+        # The shot the current decision settled on, as its search scored it
+        self.chosen : ComparableShot = None
+        # Every decision is appended to decision_log when it is set
+        self.decision_log : DecisionLog = None
+        self.pockets = PoolWorld.create_pockets()
+
+    def __getstate__(self):
+        # The evaluator owns the worker processes and Box2D worlds cannot be pickled,
+        # so neither is sent to the workers, which use worlds of their own. The cache
+        # is not sent either, the workers would only fill copies of it
+        state = self.__dict__.copy()
+        state["evaluator"] = None
+        state["world"] = None
+        state["cache"] = None
+        state["profile"] = NO_PROFILE
+        state["cancelled"] = None
+        state["decision_log"] = None
+        return state
+
+    @contextmanager
+    def simulation_world(self):
+        if self.world is not None:
+            yield self.world
+        else:
+            with DEFAULT_WORLD_POOL.checkout() as world:
+                yield world
 
     def take_shot(self, board : PoolBoard, queue : List ):
-        t0 = time.time()
-        s = self.shot_handler(board, self.magnitudes, self.angles)
-        t1 = time.time()
-        t = t1 - t0
-        queue.append((s, t))
+        decision = self.decide(board)
+        queue.append((decision.shot, decision.time))
+
+    # Decides on a shot from board. The search stops with SearchCancelled once cancelled
+    # is set
+    def decide(self, board : PoolBoard, cancelled : threading.Event = None) -> ShotDecision:
+        self.cancelled = cancelled
+        self.start_decision()
+        try:
+            t0 = time.time()
+            shot = self.shot_handler(board, self.magnitudes, self.angles)
+            t1 = time.time()
+            chosen = self.chosen if self.chosen is not None and self.chosen.shot is shot else None
+            if chosen is None:
+                # Shots that were not searched for, like a fixed break, are simulated and
+                # scored on their own
+                with self.simulation_world() as world:
+                    outcome, complexity = self.simulate_shot(shot, board, world)
+                    chosen = self.score_shot(shot, board, outcome, complexity)
+        finally:
+            self.cancelled = None
+        robustness = next((robust for robust in self.robust_shots if robust.shot.shot is shot), None)
+        decision = ShotDecision(shot, t1 - t0, chosen.board, self.shots_evaluated, self.shots_candidates, robustness, chosen.heuristic, chosen.complexity)
+        if self.decision_log is not None:
+            self.decision_log.append(self, board, decision)
+        return decision
+
+    # Starts deciding on a shot from board in the background
+    def request_shot(self, board : PoolBoard) -> ShotSearch:
+        return ShotSearch(self, board)
+
+    # Decides on a shot from board without blocking the event loop. The search is
+    # cancelled if it takes longer than timeout or the awaiting task is cancelled
+    async def decide_async(self, board : PoolBoard, timeout : float = None) -> ShotDecision:
+        search = self.request_shot(board)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(search.future), timeout)
+        except BaseException:
+            search.cancel()
+            raise
+
+    def check_cancelled(self):
+        if self.cancelled is not None and self.cancelled.is_set():
+            raise SearchCancelled("The search was cancelled")
 
     @abstractmethod
     def shot_handler(self, board : PoolBoard) -> Shot:
         pass
 
+    # Called at the start of every decision
+    def start_decision(self):
+        self.profile = SearchProfile() if self.profiling else NO_PROFILE
+        self.deadline = time.time() + self.time_budget if self.time_budget is not None else None
+        self.shots_candidates = 0
+        self.shots_evaluated = 0
+        self.robust_shots = []
+        self.chosen = None
+
+    def out_of_time(self) -> bool:
+        return self.deadline is not None and time.time() >= self.deadline
+
+    # Sorts shots so that the ones aimed closest to a ball the player should hit come
+    # first, which are the shots most likely to be good
+    def order_shots(self, board : PoolBoard, shots : List[Shot]) -> List[Shot]:
+        if board.turn == PoolPlayer.PLAYER1:
+            numbers = range(1, 8) if board.player1_pocketed < 7 else [8]
+        else:
+            numbers = range(9, 16) if board.player2_pocketed < 7 else [8]
+        targets = [ball.position for ball in board.balls if not ball.pocketed and ball.number in numbers]
+        if len(targets) == 0 or len(shots) == 0:
+            return shots
+        targets = np.array([(position[0], position[1]) for position in targets])
+        positions = np.array([(shot.cue_ball_position[0], shot.cue_ball_position[1]) for shot in shots])
+        angles = np.array([shot.angle for shot in shots])
+        offsets = targets[None, :, :] - positions[:, None, :]
+        target_angles = np.degrees(np.arctan2(offsets[:, :, 1], offsets[:, :, 0]))
+        misses = np.abs((angles[:, None] - target_angles + 180) % 360 - 180).min(axis=1)
+        return [shots[i] for i in np.argsort(misses, kind="stable")]
+
+    # Returns best, or when no shot could be reached or there was no time to evaluate
+    # any, the most promising of shots, since any shot is better than none
+    def best_or_fallback(self, board : PoolBoard, shots : List[Shot], best : List["ComparableShot"]) -> List["ComparableShot"]:
+        if len(best) > 0 or len(shots) == 0:
+            return best
+        return [self.compute_shot_heuristic(self.order_shots(board, shots)[0], board)]
+
+    # Simulates shot from board in world and returns the board it came to rest in and
+    # its complexity, or takes them from the cache if it was already simulated
+    def simulate_shot(self, shot : Shot, board : PoolBoard, world : PoolWorld):
+        self.check_cancelled()
+        profile = self.profile
+        if self.cache is not None:
+            result = self.cache.get(board, shot, world.settings_key())
+            if result is not None:
+                profile.count("cache_hits")
+                return result
+        with profile.phase("load_board"):
+            world.load_board(board)
+        world.profile = profile
+        if profile.enabled:
+            steps = world.stats.total_steps
+            contacts = world.stats.total_contacts
+        with profile.phase("physics"):
+            world.shoot(shot)
+            world.simulate_until_still(Constants.TIME_STEP, Constants.VEL_ITERS, Constants.POS_ITERS)
+        if profile.enabled:
+            profile.count("simulations")
+            profile.count("steps", world.stats.total_steps - steps)
+            profile.count("contacts", world.stats.total_contacts - contacts)
+        with profile.phase("board_state"):
+            result = (world.get_board_state(), world.complexity)
+        if self.cache is not None:
+            self.cache.put(board, shot, world.settings_key(), *result)
+        return result
+
+    # Returns where the cue ball will be shot from, placing it randomly if it was pocketed
+    def place_cue_ball(self, board : PoolBoard):
+        position = board.cue_ball.position
+        if board.cue_ball.pocketed:
+            while True:
+                x = random_float(Constants.BALL_RADIUS + 0.5, Constants.TABLE_WIDTH - Constants.BALL_RADIUS - 0.5)
+                y = random_float(Constants.BALL_RADIUS + 0.5, Constants.TABLE_HEIGHT - Constants.BALL_RADIUS - 0.5)
+                position = b2Vec2(x, y)
+                if Shot.test_cue_ball_position(position, board.balls):
+                    break
+        return position
+
+    # Scores every reachable shot, one after another or across the evaluator's
+    # worker processes, and returns the best length shots sorted from best to worst
+    def evaluate_best_shots(self, board : PoolBoard, shots : List[Shot], length=10) -> List["ComparableShot"]:
+        if self.deadline is not None:
+            shots = self.order_shots(board, shots)
+        if self.evaluator is not None:
+            return self.evaluator.evaluate(self, board, shots, length)
+        return heapq.nsmallest(length, self.evaluate_shots(board, shots))
+
+    # Scores the board shot from original_board came to rest in, AIs without a
+    # heuristic score every shot the same
+    def score_shot(self, shot : Shot, original_board : PoolBoard, current_board : PoolBoard, complexity : Complexity) -> "ComparableShot":
+        return ComparableShot(shot, 0.0, current_board, complexity)
+
+    # Scores every shot in shots in the order given, whether it can be reached or not
+    def score_shots(self, board : PoolBoard, shots : List[Shot]) -> List["ComparableShot"]:
+        if self.evaluator is not None:
+            return self.evaluator.score(self, board, shots)
+        with self.simulation_world() as world:
+            return [self.compute_shot_heuristic(shot, board, world) for shot in shots]
+
+    # Simulates every finalist under the same noise.samples errors, all of them as one
+    # job, and returns them as RobustShots sorted by expected heuristic
+    def score_robustness(self, board : PoolBoard, finalists : List["ComparableShot"], noise : ExecutionNoise) -> List[RobustShot]:
+        random = np.random.default_rng(noise.seed)
+        angle_errors = random.normal(0.0, noise.angle_error, noise.samples)
+        magnitude_errors = random.normal(0.0, noise.magnitude_error, noise.samples)
+        shots = []
+        for finalist in finalists:
+            shot = finalist.shot
+            for angle_error, magnitude_error in zip(angle_errors, magnitude_errors):
+                shots.append(Shot((shot.angle + angle_error) % 360, shot.magnitude * (1 + magnitude_error), shot.cue_ball_position))
+        with self.profile.phase("robustness"):
+            scored = self.score_shots(board, shots)
+        robust_shots = []
+        for i, finalist in enumerate(finalists):
+            samples = scored[i * noise.samples:(i + 1) * noise.samples]
+            heuristics = np.array([sample.heuristic for sample in samples])
+            successes = np.array([self.shot_succeeded(sample.board, board.turn) for sample in samples])
+            robust_shots.append(RobustShot(finalist, heuristics, successes))
+        robust_shots.sort(key=lambda robust: robust.expected_heuristic, reverse=True)
+        return robust_shots
+
+    # Returns the best of shots, which are sorted from best to worst. With noise the best
+    # finalists are compared by how they do when hit with errors
+    def robust_best(self, board : PoolBoard, shots : List["ComparableShot"]) -> "ComparableShot":
+        if self.noise is None or len(shots) < 2:
+            self.chosen = shots[0]
+        else:
+            self.robust_shots = self.score_robustness(board, shots[:self.noise.finalists], self.noise)
+            self.chosen = self.robust_shots[0].shot
+        return self.chosen
+
+    @staticmethod
+    def shot_succeeded(board : PoolBoard, shooter : PoolPlayer) -> bool:
+        state = board.get_state()
+        if state == PoolState.ONGOING:
+            return board.turn == shooter
+        return state == (PoolState.PLAYER1_WIN if shooter == PoolPlayer.PLAYER1 else PoolState.PLAYER2_WIN)
+
+    # Returns the shots that can be reached, checking every shot taken from the same
+    # cue ball position at once
+    def reachable_shots(self, board : PoolBoard, shots : List[Shot]) -> List[Shot]:
+        positions = {}
+        for i, shot in enumerate(shots):
+            positions.setdefault(tuple(shot.cue_ball_position), []).append(i)
+        reachable = [False] * len(shots)
+        with self.profile.phase("verify"):
+            for position, indices in positions.items():
+                mask = verifyShotsReachable(position, board.balls, [shots[i].angle for i in indices])
+                for i, keep in zip(indices, mask):
+                    reachable[i] = keep
+        shots = [shot for shot, keep in zip(shots, reachable) if keep]
+        self.shots_candidates += len(shots)
+        self.profile.count("shots_considered", len(reachable))
+        self.profile.count("shots_verified", len(shots))
+        self.profile.count("shots_rejected", len(reachable) - len(shots))
+        return shots
+
+    # Returns a ComparableShot for every shot in shots that can be reached
+    def evaluate_shots(self, board : PoolBoard, shots : List[Shot]) -> List["ComparableShot"]:
+        return []
+
     @abstractmethod
     def name(self) -> str:
         pass
@@ -37,8 +390,8 @@ class RandomAI(PoolAI):
     def name(self) -> str:
         return "random"
 
-    def shot_handler(self, board: PoolBoard) -> Shot:
-        shot = Shot(random_float(0, 360), random_float(100, 150))
+    def shot_handler(self, board: PoolBoard, magnitudes=None, angles=None) -> Shot:
+        shot = Shot(random_float(0, 360), random_float(100, 150), board.cue_ball.position)
         if board.cue_ball.pocketed:
             x = -1.0
             y = -1.0
@@ -52,6 +405,8 @@ class RandomAI(PoolAI):
 
 class ComparableShot:
 
+    __slots__ = ("shot", "heuristic", "board", "complexity")
+
     def __init__(self, shot : Shot, heuristic : float, board : PoolBoard, complexity : Complexity = Complexity()):
         self.shot = shot
         self.heuristic = heuristic
@@ -71,42 +426,39 @@ class SimpleAI(PoolAI):
 
     def shot_handler(self, board: PoolBoard, magnitudes, angles) -> Shot:
         shots = self.compute_best_shots(board, magnitudes, angles)
-        return shots[0].shot
+        return self.robust_best(board, shots).shot
 
     # returns the 10 best shots sorted from best to worst
     def compute_best_shots(self, board : PoolBoard, magnitudes, angles, length=10) -> List[ComparableShot]:
-        position = board.cue_ball.position
-        if board.cue_ball.pocketed:
-            while True:
-                x = random_float(Constants.BALL_RADIUS + 0.5, Constants.TABLE_WIDTH - Constants.BALL_RADIUS - 0.5)
-                y = random_float(Constants.BALL_RADIUS + 0.5, Constants.TABLE_HEIGHT - Constants.BALL_RADIUS - 0.5)
-                position = b2Vec2(x, y)
-                if Shot.test_cue_ball_position(position, board.balls):
-                    break
+        position = self.place_cue_ball(board)
+        shots = [Shot(angle, magnitude, position) for angle in angles for magnitude in magnitudes]
+        return self.best_or_fallback(board, shots, self.evaluate_best_shots(board, shots, length))
+
+    def evaluate_shots(self, board : PoolBoard, shots : List[Shot]) -> List[ComparableShot]:
         queue : List[ComparableShot] = []
-        for angle in angles:
-            for magnitude in magnitudes:
+        with self.simulation_world() as world:
+            for shot in self.reachable_shots(board, shots):
+                if self.out_of_time():
+                    break
                 if len(queue) % 50 == 0:
                     print(f"Shots generated: {len(queue)}")
-                shot = Shot(angle, magnitude, position)
-                
-                if verifyShotReachable(shot, board.balls):
-                    heapq.heappush(queue, self.compute_shot_heuristic(shot, board))
-        shots = []
-        for _ in range(length):
-            shots.append(heapq.heappop(queue))
-        return shots
-
-    def compute_shot_heuristic(self, shot : Shot, board : PoolBoard) -> ComparableShot:
-        Pool.WORLD.load_board(board)
-        Pool.WORLD.shoot(shot)
-        Pool.WORLD.simulate_until_still(Constants.TIME_STEP, Constants.VEL_ITERS, Constants.POS_ITERS)
-        the_board = Pool.WORLD.get_board_state()
-        heuristic = self.compute_heuristic(the_board, board.turn)
-
-        if board.turn == PoolPlayer.PLAYER2:
+                queue.append(self.compute_shot_heuristic(shot, board, world))
+        self.shots_evaluated += len(queue)
+        return queue
+
+    def compute_shot_heuristic(self, shot : Shot, board : PoolBoard, world : PoolWorld = None) -> ComparableShot:
+        if world is None:
+            with self.simulation_world() as world:
+                return self.compute_shot_heuristic(shot, board, world)
+        the_board, complexity = self.simulate_shot(shot, board, world)
+        with self.profile.phase("scoring"):
+            return self.score_shot(shot, board, the_board, complexity)
+
+    def score_shot(self, shot : Shot, original_board : PoolBoard, current_board : PoolBoard, complexity : Complexity) -> ComparableShot:
+        heuristic = self.compute_heuristic(current_board)
+        if original_board.turn == PoolPlayer.PLAYER2:
             heuristic *= -1.0
-        return ComparableShot(shot, heuristic, the_board)
+        return ComparableShot(shot, heuristic, current_board, complexity)
 
     # Computes the heuristic of a given board. This is computed in terms of
     # player 1 where a higher score means a better board for player 1.
@@ -151,7 +503,7 @@ class SimpleAI(PoolAI):
 
     def distance_to_closest_pocket(self, ball : Ball):
         closest = 999.0
-        for pocket in Pool.WORLD.pockets:
+        for pocket in self.pockets:
             x2 = ball.position[0] - pocket.x
             y2 = ball.position[1] - pocket.y
             dist = x2 * x2 + y2 * y2
@@ -163,6 +515,12 @@ class SimpleAI(PoolAI):
 
 class RealisticAI(PoolAI):
 
+    def __init__(self, player : PoolPlayer, magnitudes=[75.0, 100.0, 125.0], angles=range(0, 360), evaluator : ParallelShotEvaluator = None, world : PoolWorld = None, cache : SimulationCache = None, search_budget : int = None, profiling : bool = False, time_budget : float = None, noise : ExecutionNoise = None):
+        super().__init__(player, magnitudes, angles, evaluator, world, cache, profiling, time_budget, noise)
+        # When a search budget is given compute_best_shots searches coarse to fine and
+        # tries at most that many shots, instead of every third of a degree
+        self.search_budget = search_budget
+
     def name(self) -> str:
         return "realistic"
     def generate_easy_shots(self, board: PoolBoard):
@@ -202,73 +560,145 @@ class RealisticAI(PoolAI):
         print("distance before contact" + str(shots[i].complexity.distance_before_contact))
         print("cue ball pocketed: " + str(board.cue_ball.pocketed))
 
-        return shots[0].shot
+        return self.robust_best(board, shots).shot
 
 
     # returns the 10 best shots sorted from best to worst
     def compute_best_shots(self, board : PoolBoard, magnitudes, angles, length=10) -> List[ComparableShot]:
-        position = board.cue_ball.position
-        if board.cue_ball.pocketed:
-            while True:
-                x = random_float(Constants.BALL_RADIUS + 0.5, Constants.TABLE_WIDTH - Constants.BALL_RADIUS - 0.5)
-                y = random_float(Constants.BALL_RADIUS + 0.5, Constants.TABLE_HEIGHT - Constants.BALL_RADIUS - 0.5)
-                position = b2Vec2(x, y)
-                if Shot.test_cue_ball_position(position, board.balls):
-                    break
-        queue : List[ComparableShot] = []
-        
-        easy_shots : List[float] = self.generate_easy_shots(board)
-               
-        for angle in range(360*3):  
+        position = self.place_cue_ball(board)
+        if self.search_budget is not None:
+            best = self.search_best_shots(board, magnitudes, position, length)
+            coarse = [angle * Constants.COARSE_ANGLE_STEP for angle in range(int(360 / Constants.COARSE_ANGLE_STEP))]
+            return self.best_or_fallback(board, [Shot(angle, magnitude, position) for angle in coarse for magnitude in magnitudes], best)
+        shots = []
+        for angle in range(360*3):
             angle = angle / 3;
             for magnitude in magnitudes:
+                shots.append(Shot(angle, magnitude, position))
+        return self.best_or_fallback(board, shots, self.evaluate_best_shots(board, shots, length))
+
+    # Sweeps every COARSE_ANGLE_STEP degrees and the easy shots, then keeps trying the
+    # angles and magnitudes next to the best length shots found so far, halving the
+    # steps every round, until search_budget shots have been tried or nothing new is left
+    def search_best_shots(self, board : PoolBoard, magnitudes, position, length=10) -> List[ComparableShot]:
+        magnitudes = sorted(float(magnitude) for magnitude in magnitudes)
+        angle_step = Constants.COARSE_ANGLE_STEP
+        gaps = [b - a for a, b in zip(magnitudes, magnitudes[1:])]
+        magnitude_step = min(gaps) / 2 if gaps else 0.0
+        finest_magnitude_step = min(magnitude_step, Constants.FINEST_MAGNITUDE_STEP)
+
+        tried = set()
+        budget = self.search_budget
+        best : List[ComparableShot] = []
+
+        def evaluate(candidates):
+            nonlocal best, budget
+            shots = []
+            for angle, magnitude in candidates:
+                angle %= 360
+                key = (round(angle, 6), round(magnitude, 6))
+                if key in tried or len(shots) >= budget:
+                    continue
+                tried.add(key)
+                shots.append(Shot(angle, magnitude, position))
+            budget -= len(shots)
+            if shots:
+                best = heapq.nsmallest(length, best + self.evaluate_best_shots(board, shots, length))
+            return len(shots)
+
+        coarse = [angle * angle_step for angle in range(int(360 / angle_step))] + self.generate_easy_shots(board)
+        evaluate([(angle, magnitude) for angle in coarse for magnitude in magnitudes])
+
+        while budget > 0 and not self.out_of_time():
+            angle_step = max(angle_step / 2, Constants.FINEST_ANGLE_STEP)
+            magnitude_step = max(magnitude_step / 2, finest_magnitude_step)
+            candidates = []
+            for comparable in best:
+                angle = comparable.shot.angle
+                magnitude = comparable.shot.magnitude
+                candidates.append((angle - angle_step, magnitude))
+                candidates.append((angle + angle_step, magnitude))
+                if magnitude_step > 0:
+                    if magnitude - magnitude_step >= magnitudes[0]:
+                        candidates.append((angle, magnitude - magnitude_step))
+                    if magnitude + magnitude_step <= magnitudes[-1]:
+                        candidates.append((angle, magnitude + magnitude_step))
+            if evaluate(candidates) == 0 and angle_step == Constants.FINEST_ANGLE_STEP:
+                break
+        return best
+
+    def evaluate_shots(self, board : PoolBoard, shots : List[Shot]) -> List[ComparableShot]:
+        queue : List[ComparableShot] = []
+
+        easy_shots : List[float] = self.generate_easy_shots(board)
+
+        with self.simulation_world() as world:
+            for shot in self.reachable_shots(board, shots):
+                if self.out_of_time():
+                    break
                 if len(queue) % 50 == 0:
                     print(f"Shots generated: {len(queue)}")
-                shot = Shot(angle, magnitude, position)
-            
-                
-                if verifyShotReachable(shot, board.balls):
-                    shot = self.compute_shot_heuristic(shot, board)
-                    for easy_angle in easy_shots:
-                        great_shot_lower, great_shot_higher = easy_angle - 0.5, easy_angle + 0.5
-                        good_shot_lower, good_shot_higher = easy_angle - 1, easy_angle + 1
-                        
-                        if angle > great_shot_lower and angle < great_shot_higher:
-                            shot.heuristic += Weights.GREAT_SHOT
-                            break     
-                        elif angle > good_shot_lower and angle < good_shot_higher:
-                            shot.heuristic += Weights.GOOD_SHOT
-                            break              
-                    heapq.heappush(queue, shot)
-        shots = []
-        for _ in range(length):
-            shots.append(heapq.heappop(queue))
-        return shots
 
-    def compute_shot_heuristic(self, shot : Shot, original_board : PoolBoard) -> ComparableShot:
-        Pool.WORLD.load_board(original_board)
-        Pool.WORLD.shoot(shot)
-        Pool.WORLD.simulate_until_still(Constants.TIME_STEP, Constants.VEL_ITERS, Constants.POS_ITERS)
-        current_board = Pool.WORLD.get_board_state()
-        complexity = Pool.WORLD.complexity
+                shot = self.compute_shot_heuristic(shot, board, world)
+                self.add_easy_shot_bonus(shot, easy_shots)
+                queue.append(shot)
+        self.shots_evaluated += len(queue)
+        return queue
+
+    # Scores shots like evaluate_shots does, easy shot bonus included, so that robust
+    # scores can be compared with the scores of the search
+    def score_shots(self, board : PoolBoard, shots : List[Shot]) -> List[ComparableShot]:
+        if self.evaluator is not None:
+            # The workers score the shots with this method, bonus and all
+            return self.evaluator.score(self, board, shots)
+        scored = super().score_shots(board, shots)
+        easy_shots = self.generate_easy_shots(board)
+        for shot in scored:
+            self.add_easy_shot_bonus(shot, easy_shots)
+        return scored
+
+    def add_easy_shot_bonus(self, shot : ComparableShot, easy_shots : List[float]):
+        angle = shot.shot.angle
+        for easy_angle in easy_shots:
+            great_shot_lower, great_shot_higher = easy_angle - 0.5, easy_angle + 0.5
+            good_shot_lower, good_shot_higher = easy_angle - 1, easy_angle + 1
+            
+            if angle > great_shot_lower and angle < great_shot_higher:
+                shot.heuristic += Weights.GREAT_SHOT
+                break     
+            elif angle > good_shot_lower and angle < good_shot_higher:
+                shot.heuristic += Weights.GOOD_SHOT
+                break              
+
+    def compute_shot_heuristic(self, shot : Shot, original_board : PoolBoard, world : PoolWorld = None) -> ComparableShot:
+        if world is None:
+            with self.simulation_world() as world:
+                return self.compute_shot_heuristic(shot, original_board, world)
+        current_board, complexity = self.simulate_shot(shot, original_board, world)
+        with self.profile.phase("scoring"):
+            return self.score_shot(shot, original_board, current_board, complexity)
+
+    # Scores the board a shot came to rest in, however it was simulated
+    def score_shot(self, shot : Shot, original_board : PoolBoard, current_board : PoolBoard, complexity : Complexity) -> ComparableShot:
+        first_hit = current_board.previous_board.first_hit
         simplicity_heuristic = complexity.compute_complexity_heuristic(current_board)
         heuristic = self.compute_heuristic(current_board, original_board.turn)
         
         if original_board.turn == PoolPlayer.PLAYER1:
             heuristic += (simplicity_heuristic)
             # calc scratches
-            if original_board.first_hit == None:
+            if first_hit == None:
                 heuristic -= Weights.SCRATCH
-            elif original_board.first_hit.number > 7:
+            elif first_hit.number > 7:
                 heuristic -= Weights.SCRATCH
             elif original_board.cue_ball.pocketed:
                 heuristic -= Weights.SCRATCH
         else:
             heuristic -= (simplicity_heuristic)
             # calc scratches
-            if original_board.first_hit == None:
+            if first_hit == None:
                 heuristic += Weights.SCRATCH
-            elif original_board.first_hit.number < 9:
+            elif first_hit.number < 9:
                 heuristic += Weights.SCRATCH
             elif original_board.cue_ball.pocketed:
                 heuristic += Weights.SCRATCH
@@ -327,7 +757,7 @@ class RealisticAI(PoolAI):
 
     def distance_to_closest_pocket(self, ball : Ball):
         closest = 999.0
-        for pocket in Pool.WORLD.pockets:
+        for pocket in self.pockets:
             x2 = ball.position[0] - pocket.x
             y2 = ball.position[1] - pocket.y
             dist = x2 * x2 + y2 * y2
@@ -336,40 +766,86 @@ class RealisticAI(PoolAI):
         return math.sqrt(closest)
 
 
+# Looks depth shots ahead. Every board is searched like SimpleAI does, and only the
+# beam_width best shots of it are looked into further, assuming that both players take
+# their best shot. Branches that cannot change the decision are cut (alpha-beta), and
+# with a time budget boards that are reached after it is spent are only scored.
+# With an evaluator the first shot of the root is searched here and the others are
+# searched at the same time in the evaluator's worker processes.
 class DepthAI(SimpleAI):
 
+    def __init__(self, player : PoolPlayer, magnitudes=[75.0, 100.0, 125.0], angles=range(0, 360), evaluator : ParallelShotEvaluator = None, world : PoolWorld = None, cache : SimulationCache = None, profiling : bool = False, time_budget : float = None, depth : int = 2, beam_width : int = 5, reply_magnitudes=None, reply_angles=None, noise : ExecutionNoise = None):
+        super().__init__(player, magnitudes, angles, evaluator, world, cache, profiling, time_budget, noise)
+        self.depth = depth
+        self.beam_width = beam_width
+        # The shots searched on the boards after the first shot, by default the same as
+        # on the first board
+        self.reply_magnitudes = reply_magnitudes
+        self.reply_angles = reply_angles
+
     def name(self) -> str:
         return "depth"
 
     def shot_handler(self, board: PoolBoard, magnitudes, angles) -> Shot:
-        shots = self.compute_best_shots(board, length=5)
-        for shot in shots:
-            if shot.board.get_state() == PoolState.ONGOING:
-                theory_shot = self.compute_best_shots(shot.board, magnitudes, angles, 1)[0]
-                if shot.board.turn != self.player:
-                    theory_shot.heuristic *= -1.0
-                shot.heuristic = theory_shot.heuristic
+        shots = self.compute_best_shots(board, magnitudes, angles, length=self.beam_width)
+        if self.depth <= 1 or len(shots) == 1:
+            return self.robust_best(board, shots).shot
+
+        # The first shot is searched on its own so that the others can be cut against it
         best_shot = shots[0]
-        for shot in shots[1:]:
-            if shot.heuristic > best_shot.heuristic:
-                best_shot = shot
-        return best_shot.shot
+        best_value = self.search(best_shot.board, self.depth - 1, -math.inf, math.inf)
+        others = shots[1:]
+        if self.evaluator is not None:
+            values = self.evaluator.search(self, [shot.board for shot in others], self.depth - 1, best_value, math.inf)
+        else:
+            values = []
+            for shot in others:
+                values.append(self.search(shot.board, self.depth - 1, max([best_value] + values), math.inf))
+        # The root shots are ranked by their look ahead values, and with noise the best
+        # of them are compared by how the shot itself does when hit with errors. The
+        # values of the shots that were cut are only bounds, so they are ranked below
+        # the best one but only roughly among themselves
+        values = [best_value] + values
+        order = sorted(range(len(shots)), key=lambda i: -values[i])
+        return self.robust_best(board, [shots[i] for i in order]).shot
+
+    # The value of board to this AI when both players take their best shot for the next
+    # depth shots. Values at or below alpha or at or above beta are only bounds, the
+    # branch does not change the decision either way
+    def search(self, board : PoolBoard, depth : int, alpha : float, beta : float) -> float:
+        if depth == 0 or board.get_state() != PoolState.ONGOING or self.out_of_time():
+            return self.board_value(board)
+        magnitudes = self.reply_magnitudes if self.reply_magnitudes is not None else self.magnitudes
+        angles = self.reply_angles if self.reply_angles is not None else self.angles
+        shots = self.compute_best_shots(board, magnitudes, angles, length=self.beam_width)
+        maximizing = board.turn == self.player
+        value = -math.inf if maximizing else math.inf
+        for i, shot in enumerate(shots):
+            if depth == 1:
+                # The heuristic already scores the board the shot leaves for the shooter
+                shot_value = shot.heuristic if maximizing else -shot.heuristic
+            else:
+                shot_value = self.search(shot.board, depth - 1, alpha, beta)
+            if maximizing:
+                value = max(value, shot_value)
+                alpha = max(alpha, value)
+            else:
+                value = min(value, shot_value)
+                beta = min(beta, value)
+            if alpha >= beta:
+                self.profile.count("branches_pruned", len(shots) - i - 1)
+                break
+        return value
 
-class NerfedDepthAI(SimpleAI):
+    def board_value(self, board : PoolBoard) -> float:
+        heuristic = self.compute_heuristic(board)
+        return heuristic if self.player == PoolPlayer.PLAYER1 else -heuristic
+
+# DepthAI looking two shots ahead, with a smaller search for the second shot
+class NerfedDepthAI(DepthAI):
+
+    def __init__(self, player : PoolPlayer, magnitudes=[75.0, 100.0, 125.0], angles=range(0, 360), evaluator : ParallelShotEvaluator = None, world : PoolWorld = None, cache : SimulationCache = None, profiling : bool = False, time_budget : float = None, noise : ExecutionNoise = None):
+        super().__init__(player, magnitudes, angles, evaluator, world, cache, profiling, time_budget, depth=2, beam_width=5, reply_magnitudes=[115], reply_angles=range(0, 360, 2), noise=noise)
 
     def name(self) -> str:
         return "nerfed depth"
-
-    def shot_handler(self, board: PoolBoard, magnitudes, angles) -> Shot:
-        shots = self.compute_best_shots(board, magnitudes, angles, length=5)
-        for shot in shots:
-            if shot.board.get_state() == PoolState.ONGOING:
-                theory_shot = self.compute_best_shots(shot.board, [115], range(0, 360, 2), 1)[0]
-                if shot.board.turn != self.player:
-                    theory_shot.heuristic *= -1.0
-                shot.heuristic = theory_shot.heuristic
-        best_shot = shots[0]
-        for shot in shots[1:]:
-            if shot.heuristic > best_shot.heuristic:
-                best_shot = shot
-        return best_shot.shot
@@ -0,0 +1,595 @@
+import copy
+import math
+from typing import List
+
+from Box2D.Box2D import b2_linearSleepTolerance, b2_linearSlop, b2_maxSubSteps, b2_timeToSleep, b2_velocityThreshold
+import numpy as np
+
+from constants import Constants
+from board import Ball, Complexity, CueBall, PoolBoard, PreviousBoard, Shot
+from world import PoolWorld
+
+# Simulates many shots taken from the same board at once, for experiments with
+# searches that sweep thousands of shots.
+#
+# Every candidate shot is one row of a set of NumPy arrays with one column per ball
+# still on the table, so every ball of every candidate is moved by the same few array operations.
+# All rows take the same fixed steps as Box2D: velocities are damped by
+# 1 / (1 + h * c), then the balls move in straight lines for the rest of the step.
+# Inside a step the earliest ball-ball or ball-cushion hit of every row is solved for
+# like Box2D's time of impact, every row that has one is moved up to it and the hit
+# is resolved, and this repeats for the rows that still have hits left in the step.
+# Pockets are checked at the end of every step, like the Box2D pocket sensors.
+# The collision response copies what Box2D does for the same fixtures: restitution
+# is ignored below b2_velocityThreshold, friction is limited by the normal impulse, a
+# cushion contact gets the same push as in PoolWorld.BeginContact, and a ball goes to
+# sleep once it has been slower than b2_linearSleepTolerance for b2_timeToSleep
+# seconds. Rows drop out of the batch once all of their balls have come to rest.
+#
+# This only approximates Box2D. At the magnitudes the AIs use
+# (75 to 125), the same balls end up pocketed as with Box2D in only 13 to 50% of
+# shots, and the cue ball hits the same ball first in 67 to 90%. The speedup depends
+# on how many shots there are. A full sweep of 3240 shots ran about 3 times faster
+# than Box2D, and batches of around 150 shots no faster at all. No AI scores shots
+# with it, it is only for measuring how far searches could go with a batched engine.
+
+# Every pair of the columns of a batch
+class BallPairs:
+
+    def __init__(self, count : int):
+        # The two columns of each pair, first < second
+        self.first, self.second = np.triu_indices(count, 1)
+        self.count = len(self.first)
+        # The pair of two columns
+        self.index = np.full((count, count), -1)
+        self.index[self.first, self.second] = np.arange(self.count)
+        self.index[self.second, self.first] = np.arange(self.count)
+        # True above the diagonal, the ordered pairs that are kept
+        self.upper = np.triu(np.ones((count, count), dtype=bool), 1)
+        # The pairs each column is part of
+        self.of_ball = np.array([[self.index[i, j] for j in range(count) if j != i] for i in range(count)], dtype=int).reshape(count, count - 1)
+
+# Event types
+_BALL = 0
+_WALL = 1
+_CORNER = 2
+
+_EPSILON = 1e-9
+# Balls that approach each other or a cushion slower than this are treated as resting
+# against it, like Box2D does for a pile of resting contacts
+_RESTING_SPEED = b2_linearSleepTolerance
+# Balls closer than this are in contact
+_CONTACT_DISTANCE = 2 * Constants.BALL_RADIUS + b2_linearSlop
+# The size of the cells of BatchSimulator.clearance
+_CELL_SIZE = 0.1
+
+# How many steps the neighbors of a row are used for before they are rebuilt
+_NEIGHBOR_STEPS = 8
+
+# The arrays of BatchResult with one row per candidate
+_ARRAYS = (
+    "candidates", "x", "y", "vx", "vy", "alive", "steps",
+    "neighbor_age", "touching", "wall_touching", "wall_nx", "wall_ny", "slow_time",
+    "total_collisions", "collisions_with_table", "collisions_by_ball", "wall_collisions_by_ball",
+    "distance_by_ball", "prev_x", "prev_y", "distance_before_contact", "first_hit", "first_hit_x", "first_hit_y",
+)
+
+class BatchResult:
+
+    def __init__(self, board : PoolBoard, shots : List[Shot]):
+        self.board = board
+        self.shots = shots
+        count = len(shots)
+        # Only the balls on the table get a column, the cue ball is always the first
+        self.numbers = [Constants.CUE_BALL] + [ball.number for ball in board.balls if not ball.pocketed]
+        self.pairs = BallPairs(len(self.numbers))
+        shape = (count, len(self.numbers))
+
+        # The index in shots of each row
+        self.candidates = np.arange(count)
+        self.x = np.zeros(shape)
+        self.y = np.zeros(shape)
+        self.vx = np.zeros(shape)
+        self.vy = np.zeros(shape)
+        # False for the balls that have been pocketed
+        self.alive = np.ones(shape, dtype=bool)
+        # The number of steps each candidate took to come to rest
+        self.steps = np.zeros(count, dtype=int)
+
+        # The number of steps since the neighbors of each row were found, see
+        # BatchSimulator.update_neighbors
+        self.neighbor_age = np.full(count, _NEIGHBOR_STEPS)
+
+        # Which balls and cushions each ball is resting against, and for how long it
+        # has been slow enough to sleep
+        self.touching = np.zeros((count, self.pairs.count), dtype=bool)
+        self.wall_touching = np.zeros(shape, dtype=bool)
+        self.wall_nx = np.zeros(shape)
+        self.wall_ny = np.zeros(shape)
+        self.slow_time = np.zeros(shape)
+
+        # The same values as Complexity
+        self.initial_cue_ball_pos = (board.cue_ball.position[0], board.cue_ball.position[1])
+        self.total_collisions = np.zeros(count, dtype=int)
+        self.collisions_with_table = np.zeros(count, dtype=int)
+        self.collisions_by_ball = np.zeros(shape, dtype=int)
+        self.wall_collisions_by_ball = np.zeros(shape, dtype=int)
+        self.distance_by_ball = np.zeros(shape)
+        self.prev_x = np.zeros(shape)
+        self.prev_y = np.zeros(shape)
+        self.distance_before_contact = np.zeros(count)
+        # The column of the first ball the cue ball hit, -1 if it hit none
+        self.first_hit = np.full(count, -1)
+        self.first_hit_x = np.zeros(count)
+        self.first_hit_y = np.zeros(count)
+
+    def __len__(self):
+        return len(self.candidates)
+
+    # Returns a copy of the given rows
+    def take(self, rows) -> "BatchResult":
+        part = copy.copy(self)
+        for name in _ARRAYS:
+            setattr(part, name, getattr(self, name)[rows])
+        return part
+
+    # Copies every row of part back to the row of the same candidate
+    def store(self, part : "BatchResult"):
+        for name in _ARRAYS:
+            getattr(self, name)[part.candidates] = getattr(part, name)
+
+    # Returns the board candidate index came to rest in, the same as
+    # PoolWorld.get_board_state would after simulating it
+    def get_board_state(self, index : int) -> PoolBoard:
+        first_hit = int(self.first_hit[index])
+        previous_board = PreviousBoard(self.board, None if first_hit < 0 else Ball((self.first_hit_x[index], self.first_hit_y[index]), self.numbers[first_hit]))
+        x = self.x[index].tolist()
+        y = self.y[index].tolist()
+        alive = self.alive[index].tolist()
+        cue_ball = CueBall((x[0], y[0]), not alive[0], self.board.cue_ball.angle)
+        balls = []
+        column = 1
+        for ball in self.board.balls:
+            if ball.pocketed:
+                balls.append(ball)
+            else:
+                balls.append(Ball((x[column], y[column]), ball.number, not alive[column], ball.angle))
+                column += 1
+        return PoolBoard(cue_ball, balls, previous_board)
+
+    # Returns the complexity of candidate index, the same as PoolWorld.complexity
+    # would be after simulating it
+    def get_complexity(self, index : int) -> Complexity:
+        complexity = Complexity(self.initial_cue_ball_pos[0], self.initial_cue_ball_pos[1])
+        complexity.set_ball_pos(self.board)
+        complexity.total_collisions = int(self.total_collisions[index])
+        complexity.collisions_with_table = int(self.collisions_with_table[index])
+        complexity.distance_before_contact = float(self.distance_before_contact[index])
+        values = zip(self.numbers, self.collisions_by_ball[index].tolist(), self.wall_collisions_by_ball[index].tolist(),
+                     self.distance_by_ball[index].tolist(), self.prev_x[index].tolist(), self.prev_y[index].tolist())
+        for number, collisions, wall_collisions, distance, x, y in values:
+            complexity.collisions_by_ball[number] = collisions
+            complexity.wall_collisions_by_ball[number] = wall_collisions
+            complexity.distance_by_ball[number] = distance
+            complexity.prev_pos[number] = (x, y)
+        return complexity
+
+class BatchSimulator:
+
+    def __init__(self):
+        self.pockets = np.array([pocket.to_tuple() for pocket in PoolWorld.create_pockets()])
+        segments = []
+        corners = set()
+        for vertices in PoolWorld.create_walls(PoolWorld.create_pockets()):
+            for i in range(len(vertices) - 1):
+                ax, ay = vertices[i]
+                bx, by = vertices[i + 1]
+                length = math.hypot(bx - ax, by - ay)
+                if length == 0:
+                    continue
+                dx = (bx - ax) / length
+                dy = (by - ay) / length
+                segments.append((ax, ay, dx, dy, length, -dy, dx))
+                corners.add((ax, ay))
+        # One row per value of a cushion edge: start point, unit direction, length and unit normal
+        self.segments = np.array(segments).T
+        corners = np.array(sorted(corners))
+        self.corner_x = corners[:, 0]
+        self.corner_y = corners[:, 1]
+
+        # A grid over the table holding, for every cushion edge and then every corner,
+        # the closest any point of each cell gets to it. Balls only check the edges and
+        # corners they could reach from their cell
+        ax, ay, dx, dy, length, _, _ = self.segments
+        self.grid_x = min(ax.min(), (ax + dx * length).min()) - 1
+        self.grid_y = min(ay.min(), (ay + dy * length).min()) - 1
+        x = np.arange(self.grid_x, max(ax.max(), (ax + dx * length).max()) + 1, _CELL_SIZE)[:, None, None] + _CELL_SIZE / 2
+        y = np.arange(self.grid_y, max(ay.max(), (ay + dy * length).max()) + 1, _CELL_SIZE)[None, :, None] + _CELL_SIZE / 2
+        along = np.clip((x - ax) * dx + (y - ay) * dy, 0, length)
+        edges = np.hypot(x - ax - dx * along, y - ay - dy * along)
+        corners = np.hypot(x - self.corner_x, y - self.corner_y)
+        self.distances = np.concatenate((edges, corners), axis=2) - _CELL_SIZE * math.sqrt(2) / 2
+        self.clearance = self.distances.min(axis=2)
+
+    # Simulates every shot in shots from board and returns where each one comes to rest
+    def simulate(self, board : PoolBoard, shots : List[Shot], time_step : float = Constants.TIME_STEP, max_seconds : float = 15) -> BatchResult:
+        result = BatchResult(board, shots)
+        if len(result) == 0:
+            return result
+
+        balls = [ball for ball in board.balls if not ball.pocketed]
+        result.x[:, 1:] = [ball.position[0] for ball in balls]
+        result.y[:, 1:] = [ball.position[1] for ball in balls]
+        if board.cue_ball.pocketed:
+            result.x[:, Constants.CUE_BALL] = [shot.cue_ball_position[0] for shot in shots]
+            result.y[:, Constants.CUE_BALL] = [shot.cue_ball_position[1] for shot in shots]
+        else:
+            result.x[:, Constants.CUE_BALL] = result.initial_cue_ball_pos[0]
+            result.y[:, Constants.CUE_BALL] = result.initial_cue_ball_pos[1]
+        result.prev_x[:] = result.x
+        result.prev_y[:] = result.y
+        result.prev_x[:, Constants.CUE_BALL] = result.initial_cue_ball_pos[0]
+        result.prev_y[:, Constants.CUE_BALL] = result.initial_cue_ball_pos[1]
+
+        # Box2D applies the force of the shot over the first step, the damping of
+        # that step is applied with every other step below
+        radians = np.radians([shot.angle for shot in shots])
+        magnitudes = np.array([shot.magnitude for shot in shots])
+        mass = Constants.BALL_DENSITY * math.pi * Constants.BALL_RADIUS * Constants.BALL_RADIUS
+        result.vx[:, Constants.CUE_BALL] = np.cos(radians) * magnitudes * time_step / mass
+        result.vy[:, Constants.CUE_BALL] = np.sin(radians) * magnitudes * time_step / mass
+
+        # Balls which touch before the shot already have a contact, and the cue ball
+        # touching a ball counts as hitting it
+        pairs = result.pairs
+        dx = result.x[:, pairs.second] - result.x[:, pairs.first]
+        dy = result.y[:, pairs.second] - result.y[:, pairs.first]
+        result.touching = dx * dx + dy * dy <= _CONTACT_DISTANCE * _CONTACT_DISTANCE
+        cue_pairs = result.touching[:, pairs.index[Constants.CUE_BALL, 1:]]
+        hit = cue_pairs.any(axis=1)
+        if hit.any():
+            self.record_first_hit(result, np.nonzero(hit)[0], np.argmax(cue_pairs[hit], axis=1) + 1)
+
+        damping = 1 / (1 + time_step * Constants.LINEAR_DAMPING)
+        batch = result.take(slice(None))
+        batch.neighbor_rows = np.zeros(0, dtype=int)
+        batch.neighbor_first = np.zeros(0, dtype=int)
+        batch.neighbor_second = np.zeros(0, dtype=int)
+        for _ in range(int(max_seconds / time_step)):
+            batch.vx *= damping
+            batch.vy *= damping
+            self.update_neighbors(batch, time_step)
+            self.move(batch, time_step)
+            self.pocket_balls(batch)
+            self.end_contacts(batch)
+            self.update_sleep(batch, time_step)
+            batch.steps += 1
+            moving = ((batch.vx != 0) | (batch.vy != 0)).any(axis=1)
+            if not moving.all():
+                # Rows that have come to rest leave the batch
+                result.store(batch.take(~moving))
+                kept = moving[batch.neighbor_rows]
+                rows = np.cumsum(moving) - 1
+                batch = batch.take(moving)
+                batch.neighbor_rows = rows[batch.neighbor_rows[kept]]
+                batch.neighbor_first = batch.neighbor_first[kept]
+                batch.neighbor_second = batch.neighbor_second[kept]
+                if len(batch) == 0:
+                    break
+        result.store(batch)
+        return result
+
+    # Moves every ball of the batch through one step, resolving the hits on the way
+    def move(self, batch : BatchResult, time_step : float):
+        rows = np.arange(len(batch))
+        remaining = np.full(len(batch), time_step)
+        # Box2D also gives up on the hits left after b2_maxSubSteps
+        for substep in range(b2_maxSubSteps):
+            # After the first hit the neighbours of a row are out of date
+            neighbors = (batch.neighbor_rows, batch.neighbor_first, batch.neighbor_second) if substep == 0 else None
+            times, types, first, second = self.next_events(batch, rows, remaining, neighbors)
+            hit = times <= remaining
+            dt = np.where(hit, times, remaining)[:, None]
+            batch.x[rows] += batch.vx[rows] * dt
+            batch.y[rows] += batch.vy[rows] * dt
+            if not hit.any():
+                return
+            remaining = remaining[hit] - dt[hit, 0]
+            rows = rows[hit]
+            types = types[hit]
+            first = first[hit]
+            second = second[hit]
+            batch.neighbor_age[rows] = _NEIGHBOR_STEPS
+            balls = types == _BALL
+            if balls.any():
+                self.collide_balls(batch, rows[balls], first[balls], second[balls])
+            walls = ~balls
+            if walls.any():
+                self.collide_walls(batch, rows[walls], types[walls], first[walls], second[walls])
+        batch.x[rows] += batch.vx[rows] * remaining[:, None]
+        batch.y[rows] += batch.vy[rows] * remaining[:, None]
+
+    # Finds the earliest hit of each of the given rows within the remaining time of its
+    # step. Returns its time (inf if there is none), its type, and either the two ball
+    # columns of a ball hit or the ball column and cushion edge or corner of a wall hit.
+    # Only the given neighbors are checked for ball hits if there are any
+    def next_events(self, batch : BatchResult, rows : np.ndarray, remaining : np.ndarray, neighbors = None):
+        count = len(rows)
+        everything = np.arange(count)
+        x = batch.x[rows]
+        y = batch.y[rows]
+        vx = batch.vx[rows]
+        vy = batch.vy[rows]
+        alive = batch.alive[rows]
+        radius = Constants.BALL_RADIUS
+        # How far each ball can move in what is left of the step, nothing further
+        # away than that can be hit
+        reach = np.sqrt(vx * vx + vy * vy) * remaining[:, None]
+
+        # Ball hits, only between the pairs that are close enough to meet within the step
+        if neighbors is None:
+            row, first, second = self.close_pairs(x, y, reach, alive, batch.pairs.upper)
+        else:
+            row, first, second = neighbors
+            both = alive[row, first] & alive[row, second]
+            row = row[both]
+            first = first[both]
+            second = second[both]
+        pair = batch.pairs.index[first, second]
+        dx = x[row, second] - x[row, first]
+        dy = y[row, second] - y[row, first]
+        dvx = vx[row, second] - vx[row, first]
+        dvy = vy[row, second] - vy[row, first]
+        distance_squared = dx * dx + dy * dy
+        times = self.solve_hits(dvx * dvx + dvy * dvy, dx * dvx + dy * dvy, distance_squared - 4 * radius * radius, distance_squared, remaining[row])
+        pair_times = np.full((count, batch.pairs.count), np.inf)
+        pair_times[row, pair] = times
+        best_pair = np.argmin(pair_times, axis=1)
+        pair_time = pair_times[everything, best_pair]
+
+        # Cushion hits, only of the balls that can reach a cushion within the step. Balls
+        # that have left the grid are put on its edge, which is far from every cushion
+        cell_x = np.clip(((x - self.grid_x) / _CELL_SIZE).astype(int), 0, self.clearance.shape[0] - 1)
+        cell_y = np.clip(((y - self.grid_y) / _CELL_SIZE).astype(int), 0, self.clearance.shape[1] - 1)
+        row, ball = np.nonzero((reach > 0) & (self.clearance[cell_x, cell_y] <= reach + radius))
+        near = self.distances[cell_x[row, ball], cell_y[row, ball]] <= (reach[row, ball] + radius)[:, None]
+        entry, feature = np.nonzero(near)
+        row = row[entry]
+        ball = ball[entry]
+        bx = x[row, ball]
+        by = y[row, ball]
+        bvx = vx[row, ball]
+        bvy = vy[row, ball]
+        left = remaining[row]
+        feature_times = np.empty(len(entry))
+
+        edge = feature < len(self.segments[0])
+        ax, ay, dx, dy, length, nx, ny = self.segments[:, feature[edge]]
+        ex = bx[edge] - ax
+        ey = by[edge] - ay
+        evx = bvx[edge]
+        evy = bvy[edge]
+        distance = nx * ex + ny * ey
+        normal_speed = nx * evx + ny * evy
+        front = distance >= 0
+        approaching = np.where(front, normal_speed < -_RESTING_SPEED, normal_speed > _RESTING_SPEED)
+        wall_times = np.maximum(0.0, (np.where(front, radius, -radius) - distance) / np.where(approaching, normal_speed, 1.0))
+        along = dx * (ex + evx * wall_times) + dy * (ey + evy * wall_times)
+        feature_times[edge] = np.where(approaching & (along >= 0) & (along <= length) & (wall_times <= left[edge]), wall_times, np.inf)
+
+        corner = ~edge
+        corners = feature[corner] - len(self.segments[0])
+        cx = bx[corner] - self.corner_x[corners]
+        cy = by[corner] - self.corner_y[corners]
+        cvx = bvx[corner]
+        cvy = bvy[corner]
+        distance_squared = cx * cx + cy * cy
+        feature_times[corner] = self.solve_hits(cvx * cvx + cvy * cvy, cx * cvx + cy * cvy, distance_squared - radius * radius, distance_squared, left[corner])
+
+        # The earliest hit of each ball
+        key = row * x.shape[1] + ball
+        order = np.lexsort((feature_times, key))
+        earliest = order[np.concatenate(([True], key[order][1:] != key[order][:-1]))] if len(order) else order
+        ball_times = np.full(x.shape, np.inf)
+        ball_times[row[earliest], ball[earliest]] = feature_times[earliest]
+        ball_features = np.zeros(x.shape, dtype=int)
+        ball_features[row[earliest], ball[earliest]] = feature[earliest]
+        best_ball = np.argmin(ball_times, axis=1)
+        ball_time = ball_times[everything, best_ball]
+
+        wall = ball_time < pair_time
+        times = np.where(wall, ball_time, pair_time)
+        best_feature = ball_features[everything, best_ball]
+        corner = best_feature >= len(self.segments[0])
+        types = np.where(wall, np.where(corner, _CORNER, _WALL), _BALL)
+        first = np.where(wall, best_ball, batch.pairs.first[best_pair])
+        second = np.where(wall, np.where(corner, best_feature - len(self.segments[0]), best_feature), batch.pairs.second[best_pair])
+        return times, types, first, second
+
+    # Rebuilds the neighbors of the rows whose neighbors are out of date. The neighbors
+    # of a row are the pairs of balls that could meet within the next _NEIGHBOR_STEPS
+    # steps, speeds only go down until the next hit so no other pair can meet before
+    # then. Checking them is much cheaper than checking every pair every step.
+    def update_neighbors(self, batch : BatchResult, time_step : float):
+        batch.neighbor_age += 1
+        stale = batch.neighbor_age >= _NEIGHBOR_STEPS
+        if not stale.any():
+            return
+        rows = np.nonzero(stale)[0]
+        vx = batch.vx[rows]
+        vy = batch.vy[rows]
+        reach = np.sqrt(vx * vx + vy * vy) * (_NEIGHBOR_STEPS * time_step)
+        row, first, second = self.close_pairs(batch.x[rows], batch.y[rows], reach, batch.alive[rows], batch.pairs.upper)
+        kept = ~stale[batch.neighbor_rows]
+        batch.neighbor_rows = np.concatenate((batch.neighbor_rows[kept], rows[row]))
+        batch.neighbor_first = np.concatenate((batch.neighbor_first[kept], first))
+        batch.neighbor_second = np.concatenate((batch.neighbor_second[kept], second))
+        batch.neighbor_age[rows] = 0
+
+    # Returns the row and columns of every pair of balls on the table that are
+    # close enough to meet if each ball moves at most its reach
+    @staticmethod
+    def close_pairs(x : np.ndarray, y : np.ndarray, reach : np.ndarray, alive : np.ndarray, upper : np.ndarray):
+        # Broadcasting over every ordered pair is faster than gathering the pairs
+        dx = x[:, None, :] - x[:, :, None]
+        dy = y[:, None, :] - y[:, :, None]
+        pair_reach = reach[:, :, None] + reach[:, None, :]
+        limit = pair_reach + 2 * Constants.BALL_RADIUS
+        close = (dx * dx + dy * dy <= limit * limit) & (pair_reach > 0) & upper
+        close &= alive[:, :, None]
+        close &= alive[:, None, :]
+        return np.nonzero(close)
+
+    # Solves |offset + velocity * t| = distance for the first t in [0, remaining]
+    # given a = |velocity|^2, b = offset . velocity and c = |offset|^2 - distance^2,
+    # inf where there is none
+    @staticmethod
+    def solve_hits(a, b, c, distance_squared, remaining):
+        discriminant = b * b - a * c
+        approaching = (b < -_RESTING_SPEED * np.sqrt(distance_squared)) & (discriminant >= 0) & (a > _EPSILON * _EPSILON)
+        times = np.where(c <= 0, 0.0, (-b - np.sqrt(np.maximum(discriminant, 0.0))) / np.where(approaching, a, 1.0))
+        times = np.maximum(times, 0.0)
+        return np.where(approaching & (times <= remaining), times, np.inf)
+
+    # Does the same bookkeeping as BeginContact for a ball that starts a contact
+    @staticmethod
+    def record_contact(batch : BatchResult, rows : np.ndarray, columns : np.ndarray):
+        batch.collisions_by_ball[rows, columns] += 1
+        x = batch.x[rows, columns]
+        y = batch.y[rows, columns]
+        batch.distance_by_ball[rows, columns] += np.hypot(x - batch.prev_x[rows, columns], y - batch.prev_y[rows, columns])
+        batch.prev_x[rows, columns] = x
+        batch.prev_y[rows, columns] = y
+
+    @staticmethod
+    def record_first_hit(batch : BatchResult, rows : np.ndarray, columns : np.ndarray):
+        batch.first_hit[rows] = columns
+        batch.first_hit_x[rows] = batch.x[rows, columns]
+        batch.first_hit_y[rows] = batch.y[rows, columns]
+        # calculate the distance before the first hit
+        cue_x = batch.x[rows, Constants.CUE_BALL] - batch.initial_cue_ball_pos[0]
+        cue_y = batch.y[rows, Constants.CUE_BALL] - batch.initial_cue_ball_pos[1]
+        batch.distance_before_contact[rows] = np.hypot(cue_x, cue_y)
+
+    # Each row has one hit, so no row appears twice in rows
+    def collide_balls(self, batch : BatchResult, rows : np.ndarray, first : np.ndarray, second : np.ndarray):
+        pairs = batch.pairs.index[first, second]
+        new = ~batch.touching[rows, pairs]
+        batch.touching[rows, pairs] = True
+        if new.any():
+            new_rows = rows[new]
+            batch.total_collisions[new_rows] += 1
+            self.record_contact(batch, new_rows, first[new])
+            self.record_contact(batch, new_rows, second[new])
+            # first < second, so only first can be the cue ball
+            cue = (first[new] == Constants.CUE_BALL) & (batch.first_hit[new_rows] < 0)
+            if cue.any():
+                self.record_first_hit(batch, new_rows[cue], second[new][cue])
+
+        nx = batch.x[rows, second] - batch.x[rows, first]
+        ny = batch.y[rows, second] - batch.y[rows, first]
+        length = np.maximum(np.hypot(nx, ny), _EPSILON)
+        nx /= length
+        ny /= length
+        vx1 = batch.vx[rows, first]
+        vy1 = batch.vy[rows, first]
+        vx2 = batch.vx[rows, second]
+        vy2 = batch.vy[rows, second]
+        normal_speed = (vx2 - vx1) * nx + (vy2 - vy1) * ny
+        restitution = np.where(-normal_speed > b2_velocityThreshold, Constants.BALL_RESTITUTION, 0.0)
+        # Equal masses, so each ball takes half of the normal impulse
+        impulse = np.where(normal_speed < 0, (1 + restitution) * normal_speed / 2, 0.0)
+        vx1 += impulse * nx
+        vy1 += impulse * ny
+        vx2 -= impulse * nx
+        vy2 -= impulse * ny
+        # Friction, a solid disc spinning up takes two thirds of the tangential impulse
+        tangent_speed = -(vx2 - vx1) * ny + (vy2 - vy1) * nx
+        friction = np.minimum(np.abs(tangent_speed) / 6, -Constants.FRICTION * impulse) * np.sign(tangent_speed)
+        vx1 -= friction * ny
+        vy1 += friction * nx
+        vx2 += friction * ny
+        vy2 -= friction * nx
+        batch.vx[rows, first] = vx1
+        batch.vy[rows, first] = vy1
+        batch.vx[rows, second] = vx2
+        batch.vy[rows, second] = vy2
+
+    def collide_walls(self, batch : BatchResult, rows : np.ndarray, types : np.ndarray, balls : np.ndarray, indices : np.ndarray):
+        x = batch.x[rows, balls]
+        y = batch.y[rows, balls]
+        # The normal points from the cushion towards the ball
+        ax, ay, _, _, _, nx, ny = self.segments
+        wall = types == _WALL
+        edges = np.where(wall, indices, 0)
+        side = np.where(nx[edges] * (x - ax[edges]) + ny[edges] * (y - ay[edges]) >= 0, 1.0, -1.0)
+        corners = np.where(wall, 0, indices)
+        cx = x - self.corner_x[corners]
+        cy = y - self.corner_y[corners]
+        length = np.maximum(np.hypot(cx, cy), _EPSILON)
+        nx = np.where(wall, nx[edges] * side, cx / length)
+        ny = np.where(wall, ny[edges] * side, cy / length)
+
+        # Like Box2D, a ball that is still resting against the cushion does not start a new contact
+        new = ~batch.wall_touching[rows, balls]
+        batch.wall_touching[rows, balls] = True
+        batch.wall_nx[rows, balls] = nx
+        batch.wall_ny[rows, balls] = ny
+        if new.any():
+            new_rows = rows[new]
+            new_balls = balls[new]
+            batch.total_collisions[new_rows] += 1
+            self.record_contact(batch, new_rows, new_balls)
+            not_cue = new_balls != Constants.CUE_BALL
+            batch.wall_collisions_by_ball[new_rows[not_cue], new_balls[not_cue]] += 1
+            batch.collisions_with_table[new_rows[batch.first_hit[new_rows] < 0]] += 1
+
+        vx = batch.vx[rows, balls]
+        vy = batch.vy[rows, balls]
+        # Same push away from zero that PoolWorld.BeginContact gives a ball hitting a wall
+        vx += np.where(new, np.where(vx < 0, -0.1, 0.1), 0.0)
+        vy += np.where(new, np.where(vy < 0, -0.1, 0.1), 0.0)
+        normal_speed = vx * nx + vy * ny
+        restitution = np.where(-normal_speed > b2_velocityThreshold, Constants.WALL_RESTITUTION, 0.0)
+        impulse = np.where(normal_speed < 0, (1 + restitution) * normal_speed, 0.0)
+        vx -= impulse * nx
+        vy -= impulse * ny
+        tangent_speed = -vx * ny + vy * nx
+        friction = np.minimum(np.abs(tangent_speed) / 3, -Constants.FRICTION * impulse) * np.sign(tangent_speed)
+        vx += friction * ny
+        vy -= friction * nx
+        batch.vx[rows, balls] = vx
+        batch.vy[rows, balls] = vy
+
+    # Pockets every moving ball whose centre is over a pocket
+    def pocket_balls(self, batch : BatchResult):
+        row, ball = np.nonzero(batch.alive & ((batch.vx != 0) | (batch.vy != 0)))
+        dx = batch.x[row, ball][:, None] - self.pockets[:, 0]
+        dy = batch.y[row, ball][:, None] - self.pockets[:, 1]
+        pocketed = (dx * dx + dy * dy < Constants.POCKET_RADIUS * Constants.POCKET_RADIUS).any(axis=1)
+        if not pocketed.any():
+            return
+        row = row[pocketed]
+        ball = ball[pocketed]
+        self.record_contact(batch, row, ball)
+        batch.alive[row, ball] = False
+        batch.vx[row, ball] = 0.0
+        batch.vy[row, ball] = 0.0
+        batch.wall_touching[row, ball] = False
+        batch.touching[row[:, None], batch.pairs.of_ball[ball]] = False
+
+    # Ends the contacts of balls that have moved apart or away from a cushion
+    def end_contacts(self, batch : BatchResult):
+        row, pair = np.nonzero(batch.touching)
+        dx = batch.x[row, batch.pairs.second[pair]] - batch.x[row, batch.pairs.first[pair]]
+        dy = batch.y[row, batch.pairs.second[pair]] - batch.y[row, batch.pairs.first[pair]]
+        apart = dx * dx + dy * dy > _CONTACT_DISTANCE * _CONTACT_DISTANCE
+        batch.touching[row[apart], pair[apart]] = False
+        batch.wall_touching &= batch.vx * batch.wall_nx + batch.vy * batch.wall_ny <= _EPSILON
+
+    def update_sleep(self, batch : BatchResult, time_step : float):
+        slow = batch.vx * batch.vx + batch.vy * batch.vy < b2_linearSleepTolerance * b2_linearSleepTolerance
+        batch.slow_time = np.where(slow, batch.slow_time + time_step, 0.0)
+        asleep = batch.slow_time >= b2_timeToSleep
+        batch.vx[asleep] = 0.0
+        batch.vy[asleep] = 0.0
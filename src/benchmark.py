@@ -0,0 +1,206 @@
+import argparse
+from contextlib import redirect_stdout
+from datetime import datetime
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+import ai
+from board import Ball, CueBall, PoolBoard, Shot
+from constants import Constants
+from pool import Pool
+from shot_verifier import verifyShotReachable, verifyShotsReachable
+from world import DEFAULT_WORLD_POOL, PoolWorld
+
+# Measures how fast the physics, the shot verifier and the AIs are on a fixed set of
+# seeded boards, and reports the results as JSON so runs can be compared over time:
+#
+#   python benchmark.py --output ../logs/benchmarks.jsonl
+#
+# appends one line per run with the commit it was run on. --quick runs fewer shots
+# and smaller searches, for checking a change before a full run.
+
+AI_TYPES = {
+    "simple": ai.SimpleAI,
+    "realistic": ai.RealisticAI,
+    "depth": ai.DepthAI,
+    "nerfed_depth": ai.NerfedDepthAI,
+}
+
+# Places the balls numbered numbers randomly on the table without overlapping each
+# other or the cue ball, every other ball is pocketed
+def random_board(numbers : List[int], cue_ball : CueBall) -> PoolBoard:
+    placed = [cue_ball.position]
+    balls = []
+    margin = Constants.POCKET_RADIUS + Constants.BALL_RADIUS
+    for number in numbers:
+        while True:
+            position = (random.uniform(margin, Constants.TABLE_WIDTH - margin), random.uniform(margin, Constants.TABLE_HEIGHT - margin))
+            if all(math.dist(position, other) > 2.5 * Constants.BALL_RADIUS for other in placed):
+                break
+        placed.append(position)
+        balls.append(Ball(position, number))
+    for number in range(1, 16):
+        if number not in numbers:
+            balls.append(Ball([0, 0], number, True))
+    board = PoolBoard(cue_ball, balls)
+    # Past the break, which RealisticAI does not search for
+    board.turn_number = 2
+    return board
+
+# The same boards for the same seed
+def benchmark_boards(seed : int) -> Dict[str, PoolBoard]:
+    random.seed(seed)
+    pool = Pool(graphics=False)
+    readme = pool.generate_board_from_list([Ball([2, 2], 1), Ball([3, 3], 8), Ball([6, 3.7], 9), Ball([2.7, 3.6], 11)], CueBall([2.5, 2.5]))
+    readme.turn_number = 2
+    return {
+        "break": pool.generate_normal_board(),
+        "readme": readme,
+        "midgame": random_board([1, 3, 4, 6, 8, 9, 10, 13, 15], CueBall([4.5, 1.8])),
+        "endgame": random_board([5, 8, 12], CueBall([1.5, 1.2])),
+    }
+
+def random_shots(board : PoolBoard, count : int) -> List[Shot]:
+    return [Shot(random.uniform(0, 360), random.uniform(20, 125), board.cue_ball.position) for _ in range(count)]
+
+def benchmark_simulation(name : str, board : PoolBoard, world : PoolWorld, shots : List[Shot]) -> dict:
+    steps = world.stats.total_steps
+    t0 = time.perf_counter()
+    for shot in shots:
+        world.load_board(board)
+        world.shoot(shot)
+        world.simulate_until_still(Constants.TIME_STEP, Constants.VEL_ITERS, Constants.POS_ITERS)
+    t1 = time.perf_counter()
+    return {
+        "benchmark": "simulate_until_still",
+        "board": name,
+        "shots": len(shots),
+        "seconds": t1 - t0,
+        "shots_per_second": len(shots) / (t1 - t0),
+        "mean_steps": (world.stats.total_steps - steps) / len(shots),
+    }
+
+def benchmark_load_board(name : str, board : PoolBoard, world : PoolWorld, count : int) -> dict:
+    t0 = time.perf_counter()
+    for _ in range(count):
+        world.load_board(board)
+    t1 = time.perf_counter()
+    return {
+        "benchmark": "load_board",
+        "board": name,
+        "calls": count,
+        "seconds": t1 - t0,
+        "microseconds_per_call": (t1 - t0) / count * 1e6,
+    }
+
+def benchmark_verifier(name : str, board : PoolBoard, angles : List[float]) -> List[dict]:
+    position = board.cue_ball.position
+    shots = [Shot(angle, 100.0, position) for angle in angles]
+    t0 = time.perf_counter()
+    for shot in shots:
+        verifyShotReachable(shot, board.balls)
+    t1 = time.perf_counter()
+    verifyShotsReachable(position, board.balls, angles)
+    t2 = time.perf_counter()
+    return [
+        {
+            "benchmark": "verifyShotReachable",
+            "board": name,
+            "calls": len(shots),
+            "seconds": t1 - t0,
+            "calls_per_second": len(shots) / (t1 - t0),
+        },
+        {
+            "benchmark": "verifyShotsReachable",
+            "board": name,
+            "angles": len(angles),
+            "seconds": t2 - t1,
+            "angles_per_second": len(angles) / (t2 - t1),
+        },
+    ]
+
+def benchmark_decision(ai_type : str, name : str, board : PoolBoard, magnitudes, angles) -> dict:
+    player = AI_TYPES[ai_type](board.turn, magnitudes, angles, profiling=True)
+    result = {"benchmark": "decision", "ai": ai_type, "board": name}
+    # The AIs place a pocketed cue ball randomly
+    random.seed(0)
+    player.start_decision()
+    t0 = time.perf_counter()
+    try:
+        shot = player.shot_handler(board, magnitudes, angles)
+        result["shot"] = {"angle": shot.angle, "magnitude": shot.magnitude}
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = time.perf_counter() - t0
+    result["profile"] = player.profile.to_dict()
+    return result
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(seed : int = 0, quick : bool = False, ais : List[str] = list(AI_TYPES.keys()), boards : List[str] = None) -> dict:
+    shot_count = 20 if quick else 200
+    load_count = 200 if quick else 2000
+    magnitudes = [100.0] if quick else [75.0, 100.0, 125.0]
+    angles = range(0, 360, 10) if quick else range(0, 360, 2)
+
+    results = []
+    # The AIs and worlds print as they go, the report is the only thing written to stdout
+    with redirect_stdout(sys.stderr):
+        all_boards = benchmark_boards(seed)
+        for name, board in all_boards.items():
+            if boards is not None and name not in boards:
+                continue
+            start = len(results)
+            random.seed(seed)
+            # The kind of world the AIs search in
+            with DEFAULT_WORLD_POOL.checkout() as world:
+                results.append(benchmark_simulation(name, board, world, random_shots(board, shot_count)))
+                results.append(benchmark_load_board(name, board, world, load_count))
+            results.extend(benchmark_verifier(name, board, [i / 10 for i in range(3600)]))
+            for ai_type in ais:
+                # RealisticAI takes a fixed shot on the break without searching, which
+                # says nothing about its search
+                if ai_type == "realistic" and board.turn_number == 0:
+                    continue
+                results.append(benchmark_decision(ai_type, name, board, magnitudes, angles))
+            for result in results[start:]:
+                print(json.dumps(result))
+
+    return {
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+        "seed": seed,
+        "quick": quick,
+        "results": results,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures the speed of the physics, shot verifier and AIs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--quick", action="store_true", help="fewer shots and smaller searches")
+    parser.add_argument("--ai", nargs="*", choices=AI_TYPES.keys(), default=list(AI_TYPES.keys()), help="AIs whose decisions are timed")
+    parser.add_argument("--board", nargs="*", choices=["break", "readme", "midgame", "endgame"], help="boards to run on, all of them by default")
+    parser.add_argument("--output", help="append the report to this file as one JSON line instead of printing it")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.seed, args.quick, args.ai, args.board)
+    if args.output is not None:
+        with open(args.output, "a") as file:
+            file.write(json.dumps(report) + "\n")
+    else:
+        print(json.dumps(report, indent=2))
@@ -0,0 +1,377 @@
+from Box2D.Box2D import b2Body, b2Vec2
+from enum import IntEnum
+import math
+import random
+from typing import List, Tuple
+import numpy as np
+from constants import Bias, Colors, Constants, Weights
+
+# The board model shared by the game, the worlds and the AIs. Only Box2D is imported
+# here so that headless searches never load pygame.
+
+def random_float(bottom, top):
+    return random.random() * (top - bottom) + bottom
+
+class Point:
+    def __init__(self, x:int, y:int):
+        self.x = x
+        self.y = y
+
+    def __getitem__(self, n):
+        if n == 0:
+            return self.x
+        elif n == 1:
+            return self.y
+        else:
+            raise IndexError
+
+    def to_tuple(self):
+        return (self.x, self.y)
+
+class Shot:
+
+    __slots__ = ("angle", "magnitude", "cue_ball_position")
+
+    def __init__(self, angle:float, magnitude:float, cue_ball_position: Tuple[float, float] = None):
+        self.angle = angle
+        self.magnitude = magnitude
+        self.cue_ball_position = cue_ball_position
+
+    def calculate_force(self):
+        rads = math.radians(self.angle)
+        return b2Vec2(math.cos(rads) * self.magnitude, math.sin(rads) * self.magnitude)
+
+    def __str__(self):
+        return f"Angle: {self.angle} degrees, magnitude: {self.magnitude} N"
+
+    # b2Vec2 cannot be pickled, so positions are sent to worker processes as tuples
+    def __getstate__(self):
+        position = None if self.cue_ball_position is None else (self.cue_ball_position[0], self.cue_ball_position[1])
+        return self.angle, self.magnitude, position
+
+    def __setstate__(self, state):
+        self.angle, self.magnitude, position = state
+        self.cue_ball_position = None if position is None else b2Vec2(position[0], position[1])
+
+    @staticmethod
+    def test_cue_ball_position(cue_ball_position, balls : List["Ball"]) -> bool:
+        r_squared = Constants.BALL_RADIUS * Constants.BALL_RADIUS
+        cue_x = cue_ball_position[0]
+        cue_y = cue_ball_position[1]
+        for ball in balls:
+            if ball.pocketed:
+                continue
+            dist_x = cue_x - ball.position[0]
+            dist_y = cue_y - ball.position[1]
+            if dist_x * dist_x + dist_y * dist_y <= r_squared:
+                return False
+        return True
+
+# Ball class, contains the color, number, starting position, and whether the
+# ball has been pocketed or not. Searches keep thousands of boards alive, so balls
+# only store what cannot be worked out from their number
+class Ball:
+
+    __slots__ = ("position", "number", "pocketed", "angle")
+
+    COLORS = [Colors.YELLOW, Colors.BLUE, Colors.RED, Colors.PURPLE, Colors.ORANGE, Colors.GREEN, Colors.BURGUNDY, Colors.BLACK]
+
+    def __init__(self, position, number, pocketed = False, angle = 0.0):
+        self.position = b2Vec2(position[0], position[1])
+        self.number = number
+        self.pocketed = pocketed
+        self.angle = angle
+
+    @property
+    def color(self):
+        if self.number == Constants.CUE_BALL:
+            return Colors.WHITE
+        return Ball.COLORS[(self.number - 1) % 8]
+
+    def __str__(self):
+        return f"Ball {self.number}: [x: {self.position[0]:.3f}, y: {self.position[1]:.3f}], pocketed: {self.pocketed}, color: {self.color}"
+
+    def __getstate__(self):
+        return (self.position[0], self.position[1]), self.number, self.pocketed, self.angle
+
+    def __setstate__(self, state):
+        position, self.number, self.pocketed, self.angle = state
+        self.position = b2Vec2(position[0], position[1])
+
+    @staticmethod
+    def from_b2_body(body : b2Body):
+        if body.userData.number == Constants.CUE_BALL:
+            return CueBall(body.position, body.userData.pocketed, body.angle)
+        else:
+            return Ball(body.position, body.userData.number, body.userData.pocketed, body.angle)
+
+class CueBall(Ball):
+
+    __slots__ = ()
+
+    def __init__(self, position, pocketed = False, angle = 0.0):
+        super().__init__(position, Constants.CUE_BALL, pocketed, angle)
+
+class PoolState(IntEnum):
+    ONGOING = 0
+    PLAYER1_WIN = 1
+    PLAYER2_WIN = 2
+
+class PoolPlayer(IntEnum):
+    PLAYER1 = 1
+    PLAYER2 = 2
+
+# What a board needs to know about the board before it: whose turn it was, what the
+# cue ball hit first and how many balls each player had pocketed. Boards keep this
+# instead of the whole previous board, so a game or a search does not keep every
+# board it went through alive
+class PreviousBoard:
+
+    __slots__ = ("turn", "turn_number", "first_hit", "player1_pocketed", "player2_pocketed")
+
+    def __init__(self, board : "PoolBoard", first_hit : Ball = None):
+        self.turn = board.turn
+        self.turn_number = board.turn_number
+        self.first_hit = first_hit
+        self.player1_pocketed = board.player1_pocketed
+        self.player2_pocketed = board.player2_pocketed
+
+    def __getstate__(self):
+        return self.turn, self.turn_number, self.first_hit, self.player1_pocketed, self.player2_pocketed
+
+    def __setstate__(self, state):
+        self.turn, self.turn_number, self.first_hit, self.player1_pocketed, self.player2_pocketed = state
+
+# Represents a board state, contains position and data of balls and the cue ball.
+# pocketed has bit n set when ball n is pocketed, bit 0 being the cue ball
+class PoolBoard:
+
+    __slots__ = ("shot_ready", "shot", "cue_ball", "balls", "previous_board", "first_hit", "player1_pocketed", "player2_pocketed", "pocketed", "eight_ball", "turn_number", "turn")
+
+    def __init__(self, cue_ball:CueBall, balls:List[Ball], previous_board:"PoolBoard | PreviousBoard" = None):
+        self.shot_ready = False
+        self.shot = -180
+        self.cue_ball = cue_ball
+        self.balls = balls
+        if isinstance(previous_board, PoolBoard):
+            previous_board = PreviousBoard(previous_board, previous_board.first_hit)
+        self.previous_board : PreviousBoard = previous_board
+        self.first_hit : Ball = None
+        self.player1_pocketed = 0
+        self.player2_pocketed = 0
+        self.pocketed = 1 if cue_ball.pocketed else 0
+        self.eight_ball : Ball = None
+        self.turn_number = 0 if previous_board is None else previous_board.turn_number + 1
+        for ball in self.balls:
+            if ball.pocketed:
+                self.pocketed |= 1 << ball.number
+            if ball.number == 8:
+                self.eight_ball = ball
+            elif ball.pocketed and ball.number != Constants.CUE_BALL:
+                if ball.number < 8:
+                    self.player1_pocketed += 1
+                else:
+                    self.player2_pocketed += 1
+        self.turn = self._get_turn()
+
+    # Shares the balls, like copy.copy did before boards had slots
+    def __copy__(self):
+        board = PoolBoard.__new__(PoolBoard)
+        for name in PoolBoard.__slots__:
+            setattr(board, name, getattr(self, name))
+        return board
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in PoolBoard.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(PoolBoard.__slots__, state):
+            setattr(self, name, value)
+
+    def _get_turn(self) -> PoolPlayer:
+        if self.turn_number == 0:
+            return PoolPlayer.PLAYER1
+        elif self.turn_number == 1:
+            if self.previous_board.turn == PoolPlayer.PLAYER1:
+                return PoolPlayer.PLAYER1 if not self.cue_ball.pocketed else PoolPlayer.PLAYER2
+            else:
+                return PoolPlayer.PLAYER2 if not self.cue_ball.pocketed else PoolPlayer.PLAYER1
+        first_hit = self.previous_board.first_hit
+        if self.previous_board.turn == PoolPlayer.PLAYER1:
+            if self.cue_ball.pocketed or first_hit is None or first_hit.number > 7 or (first_hit.number == 8 and self.previous_board.player1_pocketed != 7) or self.player1_pocketed <= self.previous_board.player1_pocketed:
+                return PoolPlayer.PLAYER2
+            else:
+                return PoolPlayer.PLAYER1
+        else:
+            if self.cue_ball.pocketed or first_hit is None or first_hit.number < 9 or (first_hit.number == 8 and self.previous_board.player2_pocketed != 7) or self.player2_pocketed <= self.previous_board.player2_pocketed:
+                return PoolPlayer.PLAYER1
+            else:
+                return PoolPlayer.PLAYER2
+
+    def get_state(self) -> PoolState:
+        if self.eight_ball.pocketed:
+            if self.cue_ball.pocketed:
+                if self.previous_board.turn == PoolPlayer.PLAYER1:
+                    return PoolState.PLAYER2_WIN
+                else:
+                    return PoolState.PLAYER1_WIN
+            elif self.previous_board.turn == PoolPlayer.PLAYER1:
+                if self.previous_board.first_hit is not None:
+                    if self.previous_board.first_hit.number > 8:
+                        return PoolState.PLAYER2_WIN
+                else:
+                    return PoolState.PLAYER2_WIN
+                if self.previous_board.player1_pocketed == 7:
+                    return PoolState.PLAYER1_WIN
+                else:
+                    return PoolState.PLAYER2_WIN
+            else:
+                if self.previous_board.first_hit is not None:
+                    if self.previous_board.first_hit.number < 8:
+                        return PoolState.PLAYER1_WIN
+                if self.previous_board.player2_pocketed == 7:
+                    return PoolState.PLAYER2_WIN
+                else:
+                    return PoolState.PLAYER1_WIN
+        return PoolState.ONGOING
+
+    def __str__(self):
+        ls = [f"Turn number: {self.turn_number}"]
+        if self.previous_board is not None:
+            ls.append(f"Prev board first hit: {self.previous_board.first_hit}")
+        ls.append(f"Cue ball:\n{self.cue_ball}\nBalls:")
+        for ball in self.balls:
+            ls.append(str(ball))
+        return "\n".join(ls)
+
+# The balls of a board in one array indexed by ball number, 0 being the cue ball, with
+# the columns x, y, angle, x velocity, y velocity and pocketed, for code that keeps or
+# works on many boards at a time instead of on Ball objects. Box2D keeps 32 bit floats,
+# and so does the array. order is the order of board.balls
+class BoardSnapshot:
+
+    __slots__ = ("data", "present", "order")
+
+    def __init__(self):
+        self.data = np.zeros((16, 6), dtype=np.float32)
+        self.present = np.zeros(16, dtype=bool)
+        self.order : List[int] = []
+
+    @property
+    def positions(self) -> np.ndarray:
+        return self.data[:, 0:2]
+
+    @property
+    def angles(self) -> np.ndarray:
+        return self.data[:, 2]
+
+    @property
+    def velocities(self) -> np.ndarray:
+        return self.data[:, 3:5]
+
+    @property
+    def pocketed(self) -> np.ndarray:
+        return self.data[:, 5] != 0
+
+    # Overwrites the snapshot with rows of (number, x, y, angle, x velocity, y velocity,
+    # pocketed), one for every ball of the board
+    def write(self, rows : List[tuple]):
+        numbers = [row[0] for row in rows]
+        self.data[numbers] = [row[1:] for row in rows]
+        self.present.fill(False)
+        self.present[numbers] = True
+        self.order = [number for number in numbers if number != Constants.CUE_BALL]
+
+    def copy(self) -> "BoardSnapshot":
+        snapshot = BoardSnapshot.__new__(BoardSnapshot)
+        snapshot.data = self.data.copy()
+        snapshot.present = self.present.copy()
+        snapshot.order = list(self.order)
+        return snapshot
+
+    def to_board(self, previous_board : "PoolBoard | PreviousBoard" = None) -> PoolBoard:
+        rows = self.data.tolist()
+        x, y, angle, _, _, pocketed = rows[Constants.CUE_BALL]
+        cue_ball = CueBall((x, y), pocketed != 0, angle)
+        balls = []
+        for number in self.order:
+            x, y, angle, _, _, pocketed = rows[number]
+            balls.append(Ball((x, y), number, pocketed != 0, angle))
+        return PoolBoard(cue_ball, balls, previous_board)
+
+    @staticmethod
+    def from_board(board : PoolBoard) -> "BoardSnapshot":
+        snapshot = BoardSnapshot()
+        snapshot.write([(ball.number, ball.position[0], ball.position[1], ball.angle, 0.0, 0.0, ball.pocketed) for ball in [board.cue_ball] + board.balls])
+        return snapshot
+
+    # Pickled as raw bytes, which is a fraction of the size of pickled arrays
+    def __getstate__(self):
+        return self.data.tobytes(), self.present.tobytes(), bytes(self.order)
+
+    def __setstate__(self, state):
+        data, present, order = state
+        self.data = np.frombuffer(data, dtype=np.float32).reshape(16, 6).copy()
+        self.present = np.frombuffer(present, dtype=bool).copy()
+        self.order = list(order)
+
+class Complexity():
+
+    __slots__ = ("total_collisions", "collisions_with_table", "collisions_by_ball", "distance_by_ball", "wall_collisions_by_ball", "prev_pos", "pocketed_ball_collisions", "pocketed_wall_collisions", "distance_before_contact", "initial_cue_ball_pos")
+
+    def __init__(self, cue_ball_pos_x = 0, cue_ball_pos_y = 0) -> None:
+        self.total_collisions = 0
+        self.collisions_with_table = 0
+        self.collisions_by_ball = [0 for x in range(16)]
+        self.distance_by_ball = [0 for x in range(16)]
+        self.wall_collisions_by_ball = [0 for x in range(16)]
+        self.prev_pos = [0 for x in range(16)]
+        self.pocketed_ball_collisions = []
+        self.pocketed_wall_collisions = []
+        self.distance_before_contact = 0
+        self.initial_cue_ball_pos = (cue_ball_pos_x, cue_ball_pos_y)
+        
+
+    def set_ball_pos(self, poolBoard : PoolBoard):
+        for ball in poolBoard.balls:
+            self.prev_pos[ball.number] = (ball.position.x, ball.position.y)
+        self.prev_pos[0] = (poolBoard.cue_ball.position.x, poolBoard.cue_ball.position.y)
+        
+    def calc_collisions_before_pocketed(self, poolBoard : PoolBoard):
+        for ball in poolBoard.balls:
+            if ball.pocketed and self.collisions_by_ball[ball.number] > 0:
+                collisions = self.collisions_by_ball[ball.number]
+                self.pocketed_ball_collisions.append(collisions)
+            if ball.pocketed and self.collisions_by_ball[ball.number] > 0:
+                collisions = self.wall_collisions_by_ball[ball.number]
+                self.pocketed_wall_collisions.append(collisions)
+                
+    def calc_total_distances(self, poolBoard : PoolBoard):
+        for ball in poolBoard.balls:
+            x1, y1 = ball.position
+            x2, y2 = self.prev_pos[ball.number]
+            distance = calc_distance(x1, y1, x2, y2)
+            self.distance_by_ball[ball.number] += distance
+        x1, y1 = poolBoard.cue_ball.position
+        x2, y2 = self.prev_pos[0]
+        distance = calc_distance(x1, y1, x2, y2)
+        self.distance_by_ball[0] += distance
+        
+    def compute_complexity_heuristic(self, poolBoard : PoolBoard):
+
+        A = -(self.total_collisions * Weights.TOTAL_COLLISIONS) + Bias.TOTAL_COLLISIONS
+        B = -(self.distance_before_contact * Weights.DISTANCE_BEFORE_CONTACT)
+        C = -pow(self.collisions_with_table, Weights.WALL_EXPONENT) * Weights.COLLISIONS_WITH_TABLE
+        self.calc_collisions_before_pocketed(poolBoard)
+        D = -(sum(self.pocketed_ball_collisions) * Weights.POCKETED_BALL_COLLISIONS) + Bias.POCKETED_BALL_COLLISIONS
+        E = -(sum( map(lambda x: pow(x, Weights.WALL_EXPONENT), self.pocketed_wall_collisions)) * Weights.POCKETED_WALL_COLLISIONS) + Bias.POCKETED_BALL_COLLISIONS
+        self.calc_total_distances(poolBoard)
+        F = -(sum( map(lambda x: x * x, self.distance_by_ball)) * Weights.DISTANCE_PER_BALL)
+        return (A + B + C + D + E + F)
+   
+def calc_distance(x1, y1, x2, y2):
+        x = x1 - x2
+        y = y1 - y2
+        distance = math.sqrt(pow(x,2) + pow(y,2))
+        return distance
+
@@ -1,3 +1,6 @@
+import math
+import os
+
 class Constants:
  
     # 28.575 MM POOL BALL RADIUS
@@ -20,6 +23,30 @@ class Constants:
     WIDTH = HEIGHT * TABLE_RATIO
     CUE_BALL = 0
     MAX_REACH = 3.5
+    BALL_DENSITY = 1.0
+    BALL_RESTITUTION = 0.804
+    WALL_RESTITUTION = 1.0
+    # Box2D's default fixture friction, used by both the balls and the walls
+    FRICTION = 0.2
+    LINEAR_DAMPING = 0.8
+    # simulate_until_still stops once the kinetic energy of the balls still moving is
+    # below this, which is one ball moving at Box2D's sleep tolerance of 0.01 m/s.
+    # Such a ball rolls at most 0.01 / LINEAR_DAMPING m further
+    REST_ENERGY = 0.5 * BALL_DENSITY * math.pi * BALL_RADIUS * BALL_RADIUS * 0.01 * 0.01
+    # Adaptive stepping only merges steps while every ball is slower than this, in m/s
+    ADAPTIVE_MAX_SPEED = 1.0
+    # The most steps that are merged into one
+    ADAPTIVE_MAX_STEPS = 60
+    # The gap that is left between every ball and whatever it could hit, in m
+    ADAPTIVE_MARGIN = 0.01
+    # The steps that are taken normally after steps could not be merged before trying again
+    ADAPTIVE_RETRY_STEPS = 16
+    ANGULAR_DAMPING = 100000
+    # Used by RealisticAI's coarse to fine search, in degrees
+    COARSE_ANGLE_STEP = 5.0
+    FINEST_ANGLE_STEP = 1.0 / 12
+    FINEST_MAGNITUDE_STEP = 1.0
+    LOG_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "logs")
     
 class Weights:
     TOTAL_COLLISIONS = 0.7
@@ -41,3 +68,18 @@ class Bias:
     TOTAL_COLLISIONS = 1
     COLLISIONS_WITH_TABLE = 3
     POCKETED_BALL_COLLISIONS = 0
+
+# RGB colours of the table and balls. The board keeps the colour of every ball, which
+# the board itself must not need pygame for, so they live here instead of in drawable.py
+class Colors:
+    BILLIARD_GREEN = 39, 107, 64
+    BLACK = 0, 0, 0
+    RED = 255, 0, 0
+    WHITE = 255, 255, 255
+    BROWN = 50, 28, 32
+    YELLOW = 255, 215, 0
+    BLUE = 0, 0, 255
+    PURPLE = 128, 0, 128
+    GREEN = 0, 128, 0
+    BURGUNDY = 128, 0, 32
+    ORANGE = 255, 165, 0
@@ -0,0 +1,230 @@
+import argparse
+import os
+import queue
+import threading
+import time
+from typing import Dict, Iterator, List
+
+import numpy as np
+
+from board import BoardSnapshot, Complexity, PoolBoard
+from constants import Constants
+
+# An append-only log of the decisions AIs make, for analysing searches afterwards
+# without going through what they print. Give an AI a log and every decision it makes
+# is added to it:
+#
+#   player.decision_log = DecisionLog()
+#
+# Decisions are handed to a writer thread, which writes them in chunks of up to
+# chunk_size decisions. A chunk is stored by column, every column being one array of
+# its fixed dtype, so a column of every decision can be read without reading the rest.
+# data.bin holds the chunks one after another and index.bin has the offset, size and
+# time span of every chunk. A chunk is only added to the index once it is written in
+# full, so a log that was cut short by a crash still reads back. read_decision_log
+# memory-maps data.bin and the columns of every chunk are views into it.
+
+DEFAULT_PATH = os.path.join(Constants.LOG_DIRECTORY, "decisions")
+
+# name, dtype and shape of every column, in the order they are written in a chunk.
+# Positions are indexed by ball number, 0 being the cue ball, and pocketed is
+# PoolBoard.pocketed
+COLUMNS = [
+    ("time", "<f8", ()),
+    ("ai", "S16", ()),
+    ("player", "u1", ()),
+    ("turn_number", "<u2", ()),
+    ("positions", "<f4", (16, 2)),
+    ("pocketed", "<u2", ()),
+    ("candidates", "<u4", ()),
+    ("evaluated", "<u4", ()),
+    ("angle", "<f4", ()),
+    ("magnitude", "<f4", ()),
+    ("cue_ball_position", "<f4", (2,)),
+    ("heuristic", "<f8", ()),
+    ("seconds", "<f8", ()),
+    ("total_collisions", "<u4", ()),
+    ("collisions_with_table", "<u4", ()),
+    ("distance_before_contact", "<f4", ()),
+    ("collisions_by_ball", "<u2", (16,)),
+    ("wall_collisions_by_ball", "<u2", (16,)),
+    ("distance_by_ball", "<f4", (16,)),
+    ("outcome_positions", "<f4", (16, 2)),
+    ("outcome_pocketed", "<u2", ()),
+    ("outcome_turn", "u1", ()),
+    ("outcome_state", "u1", ()),
+]
+
+INDEX = np.dtype([
+    ("offset", "<u8"),
+    ("count", "<u4"),
+    ("first_time", "<f8"),
+    ("last_time", "<f8"),
+])
+
+# Columns start on multiples of this many bytes
+ALIGNMENT = 8
+
+# Where every column of a chunk of count decisions starts, relative to the chunk, and
+# how many bytes the chunk takes
+def chunk_layout(count : int):
+    offsets = []
+    size = 0
+    for name, dtype, shape in COLUMNS:
+        offsets.append(size)
+        size += np.dtype(dtype).itemsize * int(np.prod(shape)) * count
+        size += -size % ALIGNMENT
+    return offsets, size
+
+def decision_row(decided : float, ai_name : str, player : int, board : PoolBoard, decision) -> tuple:
+    outcome : PoolBoard = decision.outcome
+    complexity : Complexity = decision.complexity if decision.complexity is not None else Complexity()
+    position = decision.shot.cue_ball_position if decision.shot.cue_ball_position is not None else board.cue_ball.position
+    return (
+        decided,
+        ai_name.encode()[:16],
+        player,
+        board.turn_number,
+        BoardSnapshot.from_board(board).positions,
+        board.pocketed,
+        decision.candidates,
+        decision.evaluated,
+        decision.shot.angle,
+        decision.shot.magnitude,
+        (position[0], position[1]),
+        np.nan if decision.heuristic is None else decision.heuristic,
+        decision.time,
+        complexity.total_collisions,
+        complexity.collisions_with_table,
+        complexity.distance_before_contact,
+        complexity.collisions_by_ball,
+        complexity.wall_collisions_by_ball,
+        complexity.distance_by_ball,
+        BoardSnapshot.from_board(outcome).positions,
+        outcome.pocketed,
+        int(outcome.turn),
+        int(outcome.get_state()),
+    )
+
+class DecisionLog:
+
+    def __init__(self, path : str = DEFAULT_PATH, chunk_size : int = 1024, flush_interval : float = 5.0):
+        self.path = path
+        self.chunk_size = chunk_size
+        # Seconds a decision may wait for its chunk to fill up before it is written anyway
+        self.flush_interval = flush_interval
+        os.makedirs(path, exist_ok=True)
+        self.data = open(os.path.join(path, "data.bin"), "ab")
+        self.index = open(os.path.join(path, "index.bin"), "ab")
+        self.rows = queue.Queue()
+        self.written = 0
+        self.writer = threading.Thread(target=self.write_rows, daemon=True)
+        self.writer.start()
+
+    # Adds a decision ai made on board. Turning it into a row and writing it is left to
+    # the writer thread, so the board and decision must not be changed afterwards
+    def append(self, ai, board : PoolBoard, decision):
+        if self.writer is None:
+            raise ValueError("The decision log is closed")
+        self.rows.put((time.time(), ai.name(), int(ai.player), board, decision))
+
+    # Waits until every decision appended so far is written
+    def flush(self):
+        done = threading.Event()
+        self.rows.put(done)
+        done.wait()
+
+    def close(self):
+        if self.writer is None:
+            return
+        self.rows.put(None)
+        self.writer.join()
+        self.writer = None
+        self.data.close()
+        self.index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write_rows(self):
+        rows = []
+        deadline = None
+        while True:
+            try:
+                timeout = None if deadline is None else max(0.0, deadline - time.time())
+                row = self.rows.get(timeout=timeout)
+            except queue.Empty:
+                row = False
+            if isinstance(row, tuple):
+                rows.append(decision_row(*row))
+                if deadline is None:
+                    deadline = time.time() + self.flush_interval
+                if len(rows) < self.chunk_size:
+                    continue
+            if len(rows) > 0:
+                self.write_chunk(rows)
+                rows = []
+                deadline = None
+            if isinstance(row, threading.Event):
+                row.set()
+            elif row is None:
+                return
+
+    def write_chunk(self, rows : List[tuple]):
+        offset = self.data.tell()
+        offsets, size = chunk_layout(len(rows))
+        chunk = bytearray(size)
+        for i, (name, dtype, shape) in enumerate(COLUMNS):
+            column = np.array([row[i] for row in rows], dtype=dtype).reshape((len(rows),) + shape)
+            data = column.tobytes()
+            chunk[offsets[i]:offsets[i] + len(data)] = data
+        self.data.write(chunk)
+        self.data.flush()
+        entry = np.array([(offset, len(rows), rows[0][0], rows[-1][0])], dtype=INDEX)
+        self.index.write(entry.tobytes())
+        self.index.flush()
+        self.written += len(rows)
+
+# The chunks of a log. Every chunk is a dict from column name to an array that is a
+# view into the memory-mapped data.bin
+def read_chunks(path : str = DEFAULT_PATH, columns : List[str] = None) -> Iterator[Dict[str, np.ndarray]]:
+    index = np.fromfile(os.path.join(path, "index.bin"), dtype=INDEX)
+    if len(index) == 0:
+        return
+    data = np.memmap(os.path.join(path, "data.bin"), dtype=np.uint8, mode="r")
+    for entry in index:
+        count = int(entry["count"])
+        offsets, _ = chunk_layout(count)
+        chunk = {}
+        for (name, dtype, shape), offset in zip(COLUMNS, offsets):
+            if columns is None or name in columns:
+                chunk[name] = np.ndarray((count,) + shape, dtype=dtype, buffer=data, offset=int(entry["offset"]) + offset)
+        yield chunk
+
+# Every decision in a log as one array per column
+def read_decision_log(path : str = DEFAULT_PATH, columns : List[str] = None) -> Dict[str, np.ndarray]:
+    chunks = list(read_chunks(path, columns))
+    names = [name for name, dtype, shape in COLUMNS if columns is None or name in columns]
+    if len(chunks) == 1:
+        return chunks[0]
+    result = {}
+    for name, dtype, shape in COLUMNS:
+        if name in names:
+            result[name] = np.concatenate([chunk[name] for chunk in chunks]) if len(chunks) > 0 else np.zeros((0,) + shape, dtype=dtype)
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarises a decision log")
+    parser.add_argument("path", nargs="?", default=DEFAULT_PATH)
+    args = parser.parse_args()
+
+    log = read_decision_log(args.path, ["ai", "seconds", "candidates", "evaluated", "heuristic"])
+    print(f"{len(log['ai'])} decisions")
+    for ai in np.unique(log["ai"]):
+        mask = log["ai"] == ai
+        print(f"{ai.decode()}: {mask.sum()} decisions, {log['seconds'][mask].mean():.3f} s on average, "
+              f"{log['evaluated'][mask].sum() / max(1, log['candidates'][mask].sum()):.0%} of the candidates evaluated, "
+              f"mean heuristic {np.nanmean(log['heuristic'][mask]):.2f}")
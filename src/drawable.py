@@ -1,17 +1,13 @@
-from ast import Constant
-from asyncio import constants
-from cmath import rect
-from distutils import extension
 from Box2D.Box2D import *
 import math
-from pygame import Rect
 import pygame
 import pygame.display
 import pygame.draw
 from pygame.surface import Surface
 from typing import Callable, Tuple
-from constants import Constants
+from constants import Colors, Constants
 import shot_verifier
+from world import PoolType
 
 class ScreenInfo:
     def __init__(self, screen:Surface, screen_width:int, screen_height:int, offset_x:int, offset_y:int, ppm:float):
@@ -22,20 +18,9 @@ class ScreenInfo:
         self.offset_y = offset_y
         self.ppm = ppm
 
-class Drawable:
-    BILLIARD_GREEN = 39, 107, 64
-    BLACK = 0, 0, 0
-    RED = 255, 0, 0
-    WHITE = 255, 255, 255
-    BROWN = 50, 28, 32
-    YELLOW = 255, 215, 0
-    BLUE = 0, 0, 255
-    PURPLE = 128, 0, 128
-    GREEN = 0, 128, 0
-    BURGUNDY = 128, 0, 32
-    ORANGE = 255, 165, 0
-
-    def __init__(self, body:b2Body, color:Tuple[int, int, int], draw:Callable[[b2Shape, b2Body, Tuple[int, int, int], ScreenInfo, bool, Tuple[int, int, int]], None], outline:bool=True, outline_color:Tuple[int, int, int]=WHITE):
+class Drawable(Colors):
+
+    def __init__(self, body:b2Body, color:Tuple[int, int, int], draw:Callable[[b2Shape, b2Body, Tuple[int, int, int], ScreenInfo, bool, Tuple[int, int, int]], None], outline:bool=True, outline_color:Tuple[int, int, int]=Colors.WHITE):
         self.body = body
         self.color = color
         self.draw_func = draw
@@ -47,6 +32,13 @@ class Drawable:
             for fixture in self.body.fixtures:
                 self.draw_func(fixture.shape, self.body, self.color, screen, self.outline, self.outline_color)
 
+    # Draws a pocket or cushion of PoolWorld.table_bodies
+    @staticmethod
+    def from_table_body(body:b2Body):
+        if body.userData.type == PoolType.POCKET:
+            return Drawable(body, Drawable.BLUE, Drawable.draw_circle, outline_color=Drawable.RED)
+        return Drawable(body, Drawable.BROWN, Drawable.draw_rect, outline_color=(25, 14, 16))
+
     # https://github.com/openai/box2d-py/blob/master/examples/simple/simple_02.py
     # for the draw functions
     @staticmethod
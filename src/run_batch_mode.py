@@ -0,0 +1,112 @@
+import argparse
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+import json
+import multiprocessing
+import os
+import sys
+import time
+from typing import Iterable, Iterator, TextIO, Tuple
+
+from shot_service import AI_TYPES, ShotRecommender
+
+# batch mode recommends a shot for every board in a JSON lines file, instead of the one
+# board written into run_single_production_mode.py. Every line is a board in the same
+# format the shot service takes, and every line written out is the response for one
+# board with the number of the line it came from. The boards are spread across worker
+# processes, and only a few of them are read ahead of the results that are written, so
+# a file of any size can be streamed through.
+
+_recommender : ShotRecommender = None
+
+# Runs once in every worker process
+def _init_worker(ai_type : str, magnitudes, angles):
+    global _recommender
+    # The AIs print their progress, which must not end up between the results
+    sys.stdout = sys.stderr
+    import world
+    world.DEFAULT_WORLD_POOL.fill(1)
+    _recommender = ShotRecommender(ai_type, magnitudes, angles)
+
+def _recommend(number : int, line : str) -> str:
+    data = None
+    try:
+        data = json.loads(line)
+        result = _recommender.recommend(data)
+    except Exception as e:
+        result = {"error": str(e)}
+    if isinstance(data, dict) and "id" in data:
+        result["id"] = data["id"]
+    result["line"] = number
+    return json.dumps(result)
+
+# Yields the line number and text of every line that is not blank
+def read_boards(file : TextIO) -> Iterator[Tuple[int, str]]:
+    for number, line in enumerate(file, 1):
+        if line.strip():
+            yield number, line
+
+# Writes a result for every board in boards to output. With ordered the results are
+# written in the order of the boards, otherwise as soon as they are found
+def run_batch(boards : Iterable[Tuple[int, str]], output : TextIO, workers : int = None, ordered : bool = True, ai_type : str = "simple", magnitudes=[75.0, 100.0, 125.0], angles=range(0, 360, 2)) -> int:
+    workers = workers if workers is not None else os.cpu_count()
+    # Enough boards are queued to keep every worker busy while the oldest one is waited on
+    read_ahead = workers * 2
+    written = 0
+
+    def write(future : Future):
+        nonlocal written
+        output.write(future.result() + "\n")
+        output.flush()
+        written += 1
+
+    # spawn for the same reason as in ParallelShotEvaluator
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(ai_type, magnitudes, angles)
+    ) as executor:
+        if ordered:
+            futures = deque()
+            for number, line in boards:
+                if len(futures) >= read_ahead:
+                    write(futures.popleft())
+                futures.append(executor.submit(_recommend, number, line))
+            while len(futures) > 0:
+                write(futures.popleft())
+        else:
+            futures = set()
+            for number, line in boards:
+                if len(futures) >= read_ahead:
+                    done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        write(future)
+                futures.add(executor.submit(_recommend, number, line))
+            for future in wait(futures).done:
+                write(future)
+    return written
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recommends a shot for every board in a JSON lines file")
+    parser.add_argument("input", nargs="?", default="-", help="boards, one per line, - for stdin")
+    parser.add_argument("-o", "--output", default="-", help="where the results are written, - for stdout")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--unordered", action="store_true", help="write results as soon as they are found instead of in input order")
+    parser.add_argument("--ai", choices=AI_TYPES.keys(), default="simple")
+    parser.add_argument("--magnitudes", type=float, nargs="+", default=[75.0, 100.0, 125.0])
+    parser.add_argument("--angle-step", type=int, default=2, help="degrees between the angles searched")
+    args = parser.parse_args()
+
+    input_file = sys.stdin if args.input == "-" else open(args.input, "r")
+    output_file = sys.stdout if args.output == "-" else open(args.output, "w")
+    t0 = time.time()
+    try:
+        count = run_batch(read_boards(input_file), output_file, args.workers, not args.unordered, args.ai, args.magnitudes, range(0, 360, args.angle_step))
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+        if output_file is not sys.stdout:
+            output_file.close()
+    t1 = time.time()
+    print(f"{count} boards in {t1 - t0:.1f} s, {count / (t1 - t0):.2f} boards/s", file=sys.stderr)
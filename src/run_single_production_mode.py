@@ -1,6 +1,4 @@
-import threading
 from constants import Constants
-# Do not change order of import, ai must be imported before pool
 import ai
 from pool import CueBall, Ball, Pool, PoolPlayer, PoolState, Shot
 
@@ -10,8 +8,6 @@ from pool import CueBall, Ball, Pool, PoolPlayer, PoolState, Shot
 def runSingleProductionMode(balls, cueBall, magnitudes, angles, pool: Pool, turn: PoolPlayer):
         
         player1 = ai.SimpleAI(PoolPlayer.PLAYER1, magnitudes, angles)
-        shot_queue = []
-        ai_thinking = False
         simulating = False
         fast_forward = True
         finalShot = Shot(0,0)
@@ -19,43 +15,40 @@ def runSingleProductionMode(balls, cueBall, magnitudes, angles, pool: Pool, turn
 
         board = pool.generate_board_from_list(balls, cueBall)
         if turn is not None: board.turn = turn
-        Pool.WORLD.load_board(board)
+        pool.world.load_board(board)
         shots = 0
+        still_frames = 0
 
         # game loop
         
         while shots < 2:
        
-            if not simulating and not ai_thinking and len(shot_queue) == 0:
-                target = player1.take_shot
+            if not simulating:
                 if shots < 1:
-                    threading.Thread(target=target, args=(board, shot_queue)).start()
+                    # Without graphics there is nothing to do but wait for the AI
+                    decision = player1.request_shot(board).result()
+                    finalShot, finalTime = decision.shot, decision.time
+                    simulating = True
+                    pool.world.load_board(board)
+                    pool.world.shoot(decision.shot)
                 shots += 1
-                ai_thinking = True
-            elif len(shot_queue) > 0:
-                ai_thinking = False
-                simulating = True
-                shot, time = shot_queue.pop()
-                finalShot, finalTime = shot, time
-                Pool.WORLD.load_board(board)
-                Pool.WORLD.shoot(shot)                
             
             if simulating:
                 for _ in range(5 if fast_forward else 1):
-                    if not Pool.WORLD.update_physics(Constants.TIME_STEP, Constants.VEL_ITERS, Constants.POS_ITERS):
+                    if not pool.world.update_physics(Constants.TIME_STEP, Constants.VEL_ITERS, Constants.POS_ITERS):
                         still_frames += 1
                     else:
                         still_frames = 0
             
                 if still_frames > 3:
-                    board = Pool.WORLD.get_board_state()
+                    board = pool.world.get_board_state()
                     state = board.get_state()
                     if state == PoolState.ONGOING:
                         simulating = False
                     else:
                         board = pool.generate_normal_board()
                         simulating = False
-                    Pool.WORLD.load_board(board)
+                    pool.world.load_board(board)
         print("Done!")   
         print(finalShot)
         print(finalTime)
@@ -0,0 +1,68 @@
+from contextlib import contextmanager, nullcontext
+import time
+from typing import Dict
+
+# Where the time of one decision went. The search adds the seconds spent in each
+# phase and counts what it did:
+#
+#   verify       checking which shots the cue can reach
+#   load_board   putting the board into a world before every shot
+#   physics      stepping the world until the table is at rest, contacts included
+#   contacts     the BeginContact bookkeeping done during physics
+#   board_state  reading the board back out of the world
+#   batch        simulating the shots with the batch simulator
+#   scoring      computing the heuristics of the boards shots came to rest in
+#
+# Counts are shots_considered, shots_rejected, shots_verified, simulations,
+# cache_hits, steps and contacts.
+class SearchProfile:
+
+    enabled = True
+
+    def __init__(self):
+        self.seconds : Dict[str, float] = {}
+        self.counts : Dict[str, int] = {}
+
+    @contextmanager
+    def phase(self, name : str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - t0
+
+    def count(self, name : str, n : int = 1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def steps_per_simulation(self) -> float:
+        simulations = self.counts.get("simulations", 0)
+        return self.counts.get("steps", 0) / simulations if simulations > 0 else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "seconds": dict(self.seconds),
+            "counts": dict(self.counts),
+            "steps_per_simulation": self.steps_per_simulation(),
+        }
+
+    def __str__(self):
+        phases = ", ".join(f"{name} {seconds:.3f} s" for name, seconds in self.seconds.items())
+        counts = ", ".join(f"{name} {count}" for name, count in self.counts.items())
+        return f"SearchProfile: {phases}; {counts}; {self.steps_per_simulation():.1f} steps per simulation"
+
+# Stands in for a SearchProfile when profiling is off, so the search does not have to
+# check whether it is profiled
+class NoProfile:
+
+    enabled = False
+
+    def __init__(self):
+        self.no_phase = nullcontext()
+
+    def phase(self, name : str):
+        return self.no_phase
+
+    def count(self, name : str, n : int = 1):
+        pass
+
+NO_PROFILE = NoProfile()
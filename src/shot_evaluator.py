@@ -0,0 +1,133 @@
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import heapq
+import multiprocessing
+import os
+from typing import List
+
+# Seconds between checks of whether the search waiting on the workers was cancelled
+_CANCEL_CHECK_INTERVAL = 0.05
+
+# Runs once in every worker process. The AIs sent to a worker come without a world,
+# so they check one out of the worker's DEFAULT_WORLD_POOL, which is built here
+# so that the first real request does not pay for it.
+def _init_worker():
+    import ai
+    import world
+    world.DEFAULT_WORLD_POOL.fill(1)
+
+def _warm_up():
+    return os.getpid()
+
+# Returns what search returns with how many candidate shots ai found and evaluated
+# running it. Only the copy of ai in the worker counts them, the evaluator adds them
+# to the AI that asked
+def _counted(ai, search):
+    candidates = ai.shots_candidates
+    evaluated = ai.shots_evaluated
+    result = search()
+    return result, ai.shots_candidates - candidates, ai.shots_evaluated - evaluated
+
+def _search(ai, board, depth, alpha, beta):
+    return _counted(ai, lambda: ai.search(board, depth, alpha, beta))
+
+def _score_chunk(ai, board, shots):
+    return _counted(ai, lambda: ai.score_shots(board, shots))
+
+def _evaluate_chunk(ai, board, shots, length):
+    def evaluate():
+        results = ai.evaluate_shots(board, shots)
+        if length is None:
+            return results
+        # Only the local top length can be part of the merged top length
+        return heapq.nsmallest(length, results)
+    return _counted(ai, evaluate)
+
+# Splits the candidate shots of a search across a warm pool of worker processes
+# and merges the results back into one list of ComparableShots
+class ParallelShotEvaluator:
+
+    def __init__(self, processes : int = None, chunks_per_process : int = 4):
+        self.processes = processes if processes is not None else os.cpu_count()
+        # More chunks than processes keeps every worker busy when some chunks
+        # contain more reachable shots than others
+        self.chunks_per_process = chunks_per_process
+        # spawn is used on every platform, forking a process that is running
+        # the game loop threads is not safe
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker
+        )
+        self.warm_up()
+
+    # Starts every worker process so that the first search does not wait on them
+    def warm_up(self):
+        futures = [self.executor.submit(_warm_up) for _ in range(self.processes)]
+        for future in futures:
+            future.result()
+
+    # The results of futures in order, adding the shots the workers counted to ai. The
+    # workers cannot see ai.cancelled, so once the search is cancelled the chunks that
+    # have not started are dropped and SearchCancelled is raised, while the chunks that
+    # are already running finish in the background
+    def collect(self, ai, futures) -> List:
+        if ai.cancelled is not None:
+            pending = set(futures)
+            try:
+                while len(pending) > 0:
+                    done, pending = wait(pending, _CANCEL_CHECK_INTERVAL, FIRST_COMPLETED)
+                    ai.check_cancelled()
+            except BaseException:
+                for future in pending:
+                    future.cancel()
+                raise
+        results = []
+        for future in futures:
+            result, candidates, evaluated = future.result()
+            ai.shots_candidates += candidates
+            ai.shots_evaluated += evaluated
+            results.append(result)
+        return results
+
+    def split(self, shots : List) -> List[List]:
+        count = max(1, min(len(shots), self.processes * self.chunks_per_process))
+        size = len(shots) // count
+        extra = len(shots) % count
+        chunks = []
+        start = 0
+        for i in range(count):
+            end = start + size + (1 if i < extra else 0)
+            chunks.append(shots[start:end])
+            start = end
+        return chunks
+
+    # Evaluates shots with ai.evaluate_shots in the worker processes. If length is None
+    # every result is returned in the order of shots, otherwise the best length
+    # shots are returned sorted from best to worst
+    def evaluate(self, ai, board, shots : List, length : int = None) -> List:
+        futures = [self.executor.submit(_evaluate_chunk, ai, board, chunk, length) for chunk in self.split(list(shots))]
+        results = [result for chunk in self.collect(ai, futures) for result in chunk]
+        if length is None:
+            return results
+        return heapq.nsmallest(length, results)
+
+    # Scores every shot with ai.score_shots in the worker processes, reachable or not,
+    # and returns the results in the order of shots
+    def score(self, ai, board, shots : List) -> List:
+        futures = [self.executor.submit(_score_chunk, ai, board, chunk) for chunk in self.split(list(shots))]
+        return [result for chunk in self.collect(ai, futures) for result in chunk]
+
+    # Runs ai.search on every board in boards at the same time, one board per worker
+    # process, and returns the values in the order of boards
+    def search(self, ai, boards : List, depth : int, alpha : float, beta : float) -> List[float]:
+        futures = [self.executor.submit(_search, ai, board, depth, alpha, beta) for board in boards]
+        return self.collect(ai, futures)
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
@@ -0,0 +1,361 @@
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import queue
+import sys
+import threading
+import time
+from typing import Callable
+
+import ai
+from board import Ball, CueBall, PoolBoard, PoolPlayer, Shot
+from world import DEFAULT_WORLD_POOL
+from shot_evaluator import ParallelShotEvaluator
+from simulation_cache import SimulationCache
+from decision_log import DecisionLog
+
+# A long running version of run_single_production_mode. The AIs and their worlds are
+# built once, and boards are sent to it as JSON over HTTP or stdin, so every request
+# only waits for its search.
+#
+# A request looks like:
+#   {"id": 1, "balls": [{"number": 1, "position": [2, 2]}, ...], "cue_ball": {"position": [2.5, 2.5]},
+#    "turn": "PLAYER2", "ai": "simple", "magnitudes": [75, 100, 125], "angles": {"start": 0, "stop": 360, "step": 2}}
+# Balls that are not listed are pocketed, everything but the balls is optional. A
+# request is answered with what the AI's decide returns for the board.
+# The response has the best shot, how long the search took and the board the shot is
+# predicted to leave.
+
+AI_TYPES = {
+    "simple": ai.SimpleAI,
+    "realistic": ai.RealisticAI,
+}
+
+class ServiceBusy(Exception):
+    pass
+
+class ShotRequest:
+
+    def __init__(self, data : dict, callback : Callable[["ShotRequest"], None] = None):
+        self.data = data
+        self.received = time.time()
+        self.response : dict = None
+        self.done = threading.Event()
+        # Called by the worker that handled the request once response is set
+        self.callback = callback
+
+# Finds the best shot for boards sent as JSON. The AIs are built the first time a type
+# and player is asked for and then reused, by the service and by run_batch_mode.py.
+# An AI keeps the state of the decision it is making, so every thread that recommends
+# shots has AIs of its own
+class ShotRecommender:
+
+    def __init__(self, ai_type : str = "simple", magnitudes=[75.0, 100.0, 125.0], angles=range(0, 360, 2), evaluator : ParallelShotEvaluator = None, cache : SimulationCache = None, profiling : bool = False, time_budget : float = None, noise : ai.ExecutionNoise = None, decision_log : DecisionLog = None):
+        if ai_type not in AI_TYPES:
+            raise ValueError(f"Unknown AI {ai_type}")
+        self.ai_type = ai_type
+        self.magnitudes = magnitudes
+        self.angles = angles
+        self.evaluator = evaluator
+        self.cache = cache
+        # With profiling on every response says where the time of its search went
+        self.profiling = profiling
+        # Seconds every search may take before it settles on the best shot found so far
+        self.time_budget = time_budget
+        # With noise the best shots are compared by how they do when hit with errors
+        self.noise = noise
+        # Every recommendation is appended to decision_log when it is set
+        self.decision_log = decision_log
+        # One AI per type and player in every thread
+        self.local = threading.local()
+
+    def get_ai(self, ai_type : str, player : PoolPlayer) -> ai.PoolAI:
+        if not hasattr(self.local, "ais"):
+            self.local.ais = {}
+        key = (ai_type, player)
+        if key not in self.local.ais:
+            self.local.ais[key] = AI_TYPES[ai_type](player, self.magnitudes, self.angles, evaluator=self.evaluator, cache=self.cache, profiling=self.profiling, time_budget=self.time_budget, noise=self.noise)
+            self.local.ais[key].decision_log = self.decision_log
+        return self.local.ais[key]
+
+    def recommend(self, data : dict) -> dict:
+        if not isinstance(data, dict):
+            raise ValueError("A request must be a JSON object")
+        board = board_from_json(data)
+        ai_type = data.get("ai", self.ai_type)
+        if ai_type not in AI_TYPES:
+            raise ValueError(f"Unknown AI {ai_type}")
+        magnitudes = [float(magnitude) for magnitude in data.get("magnitudes", self.magnitudes)]
+        angles = angles_from_json(data["angles"]) if "angles" in data else self.angles
+        if len(magnitudes) == 0 or len(angles) == 0:
+            raise ValueError("No shots to search")
+        player = self.get_ai(ai_type, board.turn)
+        # Only this thread uses the AI, so it can search the shots of this request
+        player.magnitudes = magnitudes
+        player.angles = angles
+
+        decision = player.decide(board)
+        response = {
+            "shot": shot_to_json(decision.shot),
+            "heuristic": decision.heuristic,
+            "time": decision.time,
+            "outcome": board_to_json(decision.outcome),
+            "evaluated": decision.evaluated,
+            "candidates": decision.candidates,
+        }
+        if len(player.robust_shots) > 0:
+            response["robustness"] = [robust_shot_to_json(robust) for robust in player.robust_shots]
+        if player.profile.enabled:
+            response["profile"] = player.profile.to_dict()
+        return response
+
+class ShotService:
+
+    def __init__(self, workers : int = 1, max_queue : int = 16, ai_type : str = "simple", magnitudes=[75.0, 100.0, 125.0], angles=range(0, 360, 2), evaluator : ParallelShotEvaluator = None, cache : SimulationCache = None, profiling : bool = False, time_budget : float = None, noise : ai.ExecutionNoise = None, decision_log : DecisionLog = None):
+        self.recommender = ShotRecommender(ai_type, magnitudes, angles, evaluator, cache, profiling, time_budget, noise, decision_log)
+        self.cache = cache
+        # Requests waiting for a worker, a request is turned away when this is full
+        self.requests = queue.Queue(maxsize=max_queue)
+        self.stats_lock = threading.Lock()
+        self.served = 0
+        self.failed = 0
+        self.rejected = 0
+        self.search_time = 0.0
+
+        # Every worker searches in a world of its own
+        DEFAULT_WORLD_POOL.fill(workers)
+        self.workers = [threading.Thread(target=self.work, daemon=True) for _ in range(workers)]
+        for worker in self.workers:
+            worker.start()
+
+    # Queues a request, raises ValueError if data is not a JSON object and ServiceBusy if
+    # the queue is full
+    def submit(self, data : dict, callback : Callable[[ShotRequest], None] = None) -> ShotRequest:
+        if not isinstance(data, dict):
+            raise ValueError("A request must be a JSON object")
+        request = ShotRequest(data, callback)
+        try:
+            self.requests.put_nowait(request)
+        except queue.Full:
+            with self.stats_lock:
+                self.rejected += 1
+            raise ServiceBusy(f"{self.requests.maxsize} requests are already waiting")
+        return request
+
+    # Queues a request and waits for its response
+    def recommend(self, data : dict, timeout : float = None) -> dict:
+        request = self.submit(data)
+        if not request.done.wait(timeout):
+            raise TimeoutError("The request was not answered in time")
+        return request.response
+
+    def work(self):
+        while True:
+            request : ShotRequest = self.requests.get()
+            if request is None:
+                return
+            started = time.time()
+            response = {"error": "The request was not answered"}
+            # Whatever goes wrong the request is answered, so nobody waits for it forever
+            # and the worker carries on with the next one
+            try:
+                response = self.recommender.recommend(request.data)
+                with self.stats_lock:
+                    self.served += 1
+                    self.search_time += response["time"]
+            except Exception as e:
+                response = {"error": str(e)}
+                with self.stats_lock:
+                    self.failed += 1
+            finally:
+                if "id" in request.data:
+                    response["id"] = request.data["id"]
+                response["queue_time"] = started - request.received
+                request.response = response
+                request.done.set()
+            if request.callback is not None:
+                try:
+                    request.callback(request)
+                except Exception as e:
+                    print(f"Answering request failed: {e}", file=sys.stderr)
+
+    def stats(self) -> dict:
+        with self.stats_lock:
+            stats = {
+                "served": self.served,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "waiting": self.requests.qsize(),
+                "mean_search_time": self.search_time / self.served if self.served > 0 else 0.0,
+            }
+        if self.cache is not None:
+            stats["cache_hits"] = self.cache.hits
+            stats["cache_misses"] = self.cache.misses
+        return stats
+
+    def shutdown(self):
+        for _ in self.workers:
+            self.requests.put(None)
+        for worker in self.workers:
+            worker.join()
+
+def board_from_json(data : dict) -> PoolBoard:
+    balls = []
+    for ball in data["balls"]:
+        balls.append(Ball(ball["position"], int(ball["number"]), bool(ball.get("pocketed", False))))
+    # Like Pool.generate_board_from_list, balls that are not listed are pocketed
+    numbers = [ball.number for ball in balls]
+    for i in range(1, 16):
+        if i not in numbers:
+            balls.append(Ball([0, 0], i, True))
+    cue_ball = data.get("cue_ball", {})
+    board = PoolBoard(CueBall(cue_ball.get("position", [0, 0]), bool(cue_ball.get("pocketed", False))), balls)
+    if "turn" in data:
+        turn = data["turn"]
+        board.turn = PoolPlayer[turn] if isinstance(turn, str) else PoolPlayer(turn)
+    # A board is taken to be past the break unless it says otherwise, on the break
+    # RealisticAI takes its fixed break shot instead of searching
+    board.turn_number = int(data.get("turn_number", 1))
+    return board
+
+def angles_from_json(angles):
+    if isinstance(angles, dict):
+        return range(angles.get("start", 0), angles.get("stop", 360), angles.get("step", 1))
+    return [float(angle) for angle in angles]
+
+def shot_to_json(shot : Shot) -> dict:
+    return {
+        "angle": shot.angle,
+        "magnitude": shot.magnitude,
+        "cue_ball_position": [shot.cue_ball_position[0], shot.cue_ball_position[1]],
+    }
+
+def robust_shot_to_json(robust : ai.RobustShot) -> dict:
+    return {
+        "shot": shot_to_json(robust.shot.shot),
+        "heuristic": robust.shot.heuristic,
+        "expected_heuristic": robust.expected_heuristic,
+        "heuristic_deviation": robust.heuristic_deviation,
+        "success_probability": robust.success_probability,
+        "samples": robust.samples,
+    }
+
+def ball_to_json(ball : Ball) -> dict:
+    return {"number": ball.number, "position": [ball.position[0], ball.position[1]], "pocketed": ball.pocketed}
+
+def board_to_json(board : PoolBoard) -> dict:
+    first_hit = board.previous_board.first_hit if board.previous_board is not None else None
+    return {
+        "cue_ball": ball_to_json(board.cue_ball),
+        "balls": [ball_to_json(ball) for ball in board.balls],
+        "first_hit": None if first_hit is None else first_hit.number,
+        "turn": board.turn.name,
+        "state": board.get_state().name,
+    }
+
+class ShotRequestHandler(BaseHTTPRequestHandler):
+
+    service : ShotService = None
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self.send_json(200, self.service.stats())
+        else:
+            self.send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        if self.path != "/shot":
+            self.send_json(404, {"error": "Not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            data = json.loads(self.rfile.read(length))
+        except ValueError as e:
+            self.send_json(400, {"error": str(e)})
+            return
+        try:
+            response = self.service.recommend(data)
+        except ValueError as e:
+            self.send_json(400, {"error": str(e)})
+            return
+        except ServiceBusy as e:
+            self.send_json(503, {"error": str(e)})
+            return
+        self.send_json(500 if "error" in response else 200, response)
+
+    def send_json(self, status : int, data : dict):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def serve_http(service : ShotService, host : str, port : int):
+    ShotRequestHandler.service = service
+    server = ThreadingHTTPServer((host, port), ShotRequestHandler)
+    print(f"Serving shots on http://{host}:{port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+# Reads one request per line from stdin and writes one response per line to output,
+# in the order they finish. Responses carry the id of their request
+def serve_stdio(service : ShotService, output = sys.stdout):
+    lock = threading.Lock()
+    pending = []
+
+    def write(response : dict):
+        with lock:
+            output.write(json.dumps(response) + "\n")
+            output.flush()
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+            pending.append(service.submit(data, lambda request: write(request.response)))
+        except ValueError as e:
+            write({"error": str(e)})
+        except ServiceBusy as e:
+            write({"id": data.get("id"), "error": str(e)})
+    for request in pending:
+        request.done.wait()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recommends shots for the boards it is sent")
+    parser.add_argument("--http", type=int, metavar="PORT", help="serve over HTTP on PORT instead of stdin and stdout")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--workers", type=int, default=1, help="requests searched at the same time")
+    parser.add_argument("--queue", type=int, default=16, help="requests that can wait for a worker")
+    parser.add_argument("--ai", choices=AI_TYPES.keys(), default="simple")
+    parser.add_argument("--processes", type=int, default=0, help="worker processes each search is split across")
+    parser.add_argument("--cache", action="store_true", help="keep simulation results in logs/ between runs")
+    parser.add_argument("--profile", action="store_true", help="say where the time of every search went")
+    parser.add_argument("--time-budget", type=float, metavar="SECONDS", help="answer with the best shot found after SECONDS")
+    parser.add_argument("--log", action="store_true", help="append every recommendation to the decision log in logs/")
+    parser.add_argument("--robustness", type=int, metavar="SAMPLES", help="pick among the best shots by how they do when each is hit SAMPLES times with errors")
+    args = parser.parse_args()
+
+    output = sys.stdout
+    if args.http is None:
+        # The worlds and AIs print their progress, which must not end up between the responses
+        sys.stdout = sys.stderr
+    evaluator = ParallelShotEvaluator(args.processes) if args.processes > 0 else None
+    cache = SimulationCache(persistent=args.cache)
+    decision_log = DecisionLog() if args.log else None
+    service = ShotService(args.workers, args.queue, args.ai, evaluator=evaluator, cache=cache, profiling=args.profile, time_budget=args.time_budget, noise=None if args.robustness is None else ai.ExecutionNoise(args.robustness), decision_log=decision_log)
+    try:
+        if args.http is not None:
+            serve_http(service, args.host, args.http)
+        else:
+            serve_stdio(service, output)
+    finally:
+        service.shutdown()
+        cache.close()
+        if decision_log is not None:
+            decision_log.close()
+        if evaluator is not None:
+            evaluator.shutdown()
@@ -2,9 +2,9 @@ from math import acos, cos, degrees, pi, radians, sin, sqrt, tan
 import math
 from typing import List
 
-from pytest import skip
+import numpy as np
 from constants import Constants
-from pool import Ball, Shot
+from board import Ball, Shot
 
 def verifyShotReachable(shot: Shot, balls: List[Ball]):
     
@@ -44,6 +44,58 @@ def verifyShotReachable(shot: Shot, balls: List[Ball]):
     return True
 
 
+def verifyShotsReachable(cue_ball_pos, balls: List[Ball], angles) -> np.ndarray:
+    # Does what verifyShotReachable does for every shot angle in angles taken
+    # from cue_ball_pos at once, returns a mask of the reachable ones
+    
+    cue_x, cue_y = cue_ball_pos
+    cue_angle = np.mod(np.asarray(angles, dtype=float) + 180, 360)
+    cue_angle *= -1
+
+    # getBodyExtension
+    new_hype = sqrt(pow(Constants.MAX_REACH, 2) + pow(Constants.PLAYER_WIDTH, 2))
+    body_angle = cue_angle - degrees(acos(Constants.MAX_REACH / new_hype))
+    body_angle = np.where(body_angle < 0, 360 + body_angle, body_angle)
+    extension_x = np.round(cue_x + np.cos(np.radians(body_angle)) * new_hype, 2)
+    extension_y = np.round(cue_y - np.sin(np.radians(body_angle)) * new_hype, 2)
+    reachable = ~((extension_x < Constants.TABLE_WIDTH) & (extension_x > 0) &
+                  (extension_y < Constants.TABLE_HEIGHT) & (extension_y > 0))
+
+    # getExtensionPosition
+    stick_extension_x = cue_x + np.cos(np.radians(cue_angle)) * Constants.MAX_REACH
+    stick_extension_y = cue_y - np.sin(np.radians(cue_angle)) * Constants.MAX_REACH
+    reachable &= ~((stick_extension_x < Constants.TABLE_WIDTH) & (stick_extension_x > 0) &
+                   (stick_extension_y < Constants.TABLE_HEIGHT) & (stick_extension_y > 0))
+
+    # checkClearPath, only for the angles that are still reachable
+    indices = np.nonzero(reachable)[0]
+    angle = cue_angle[indices]
+    player_x, player_y = lineRectRayCasts(cue_ball_pos, stick_extension_x[indices], stick_extension_y[indices])
+    # lineSweep, with one row per angle and one column per ray
+    angle_increase = np.arange(16) - 7.5
+    current_angle = angle[:, None] + angle_increase
+    cue_stick_peak = np.sqrt(np.square(player_x - cue_x) + np.square(player_y - cue_y))
+    angle_length = cue_stick_peak[:, None] / np.cos(np.radians(angle_increase))
+    increased_angle = np.radians(current_angle + 180)
+    origin_x = np.cos(increased_angle) * angle_length + player_x[:, None]
+    origin_y = -(np.sin(increased_angle) * angle_length) + player_y[:, None]
+    unit_x = np.cos(np.radians(current_angle))
+    unit_y = -np.sin(np.radians(current_angle))
+
+    clear = np.ones(len(indices), dtype=bool)
+    for ball in balls:
+        if ball.number == 0: continue
+        ball_center_x, ball_center_y = ball.position
+        to_ball_x = ball_center_x - origin_x
+        to_ball_y = ball_center_y - origin_y
+        mag_bal_vector = np.sqrt(np.square(to_ball_x) + np.square(to_ball_y))
+        intersection = unit_x * to_ball_x + unit_y * to_ball_y
+        b = np.sqrt(np.maximum(0.0, np.square(mag_bal_vector) - np.square(intersection)))
+        clear &= ~((intersection >= 0) & (b < Constants.BALL_RADIUS)).any(axis=1)
+    reachable[indices] = clear
+
+    return reachable
+
 def getPlayerPosition(cue_ball_pos, angle):
 
     endPos = getExtensionPosition(
@@ -166,6 +218,35 @@ def lineRectRayCast(startPoint, endPoint):
 
     return finalCord
 
+def lineRectRayCasts(startPoint, endX, endY):
+    # Does what lineRectRayCast does for many end points at once
+    
+    vecB = (endX - startPoint[0], endY - startPoint[1])
+    magB = np.sqrt(np.square(vecB[0]) + np.square(vecB[1]))
+    unitB = (vecB[0] / magB, vecB[1] / magB)
+    
+    # Rays along an axis divide by zero and then multiply inf by zero, which gives NaN.
+    # Those entries are replaced below
+    with np.errstate(divide="ignore", invalid="ignore"):
+        AXDir = (Constants.TABLE_WIDTH - startPoint[0]) / unitB[0]
+        CXDir = (0 - startPoint[0]) / unitB[0]
+        AYDir = (Constants.TABLE_HEIGHT - startPoint[1]) / unitB[1]
+        CYDir = (0 - startPoint[1]) / unitB[1]
+    
+        tMin = np.maximum(np.minimum(AXDir, CXDir), np.minimum(AYDir, CYDir))
+        tMax = np.minimum(np.maximum(AXDir, CXDir), np.maximum(AYDir, CYDir))
+        t = np.where(tMin < 0, tMax, tMin)
+        x = startPoint[0] + t * unitB[0]
+        y = startPoint[1] + t * unitB[1]
+    
+    # rays along an axis
+    x = np.where(unitB[1] == 0, np.where(unitB[0] > 0, Constants.TABLE_WIDTH, 0), x)
+    y = np.where(unitB[1] == 0, startPoint[1], y)
+    x = np.where(unitB[0] == 0, startPoint[0], x)
+    y = np.where(unitB[0] == 0, np.where(unitB[1] > 0, Constants.TABLE_HEIGHT, 0), y)
+
+    return x, y
+
 def getExtensionPosition(cue_ball_pos, cue_angle):
     # Returns the end coordinates of the pool stick
     x = cos(radians(cue_angle)) * Constants.MAX_REACH
@@ -231,7 +312,8 @@ def checkClearPath(cue_bal_pos, angle, balls: List[Ball]):
             if intersection < 0:
                 continue
             
-            b = math.sqrt(pow(mag_bal_vector,2) - pow(intersection, 2)) 
+            # rounding can put a ball that is dead ahead slightly below zero
+            b = math.sqrt(max(0.0, pow(mag_bal_vector,2) - pow(intersection, 2)))
             
             if b < Constants.BALL_RADIUS:
                 return False
@@ -0,0 +1,104 @@
+from collections import OrderedDict
+import copy
+import os
+import shelve
+import threading
+from typing import Tuple
+
+from constants import Constants
+from board import Ball, BoardSnapshot, Complexity, PoolBoard, PreviousBoard, Shot
+
+# Remembers what boards shots came to rest in, so a shot that was already simulated
+# from the same board is answered without simulating it again.
+#
+# Boards and shots are looked up by their quantized positions, angle and magnitude,
+# so layouts that only differ by less than precision share a result. Results are
+# kept as a BoardSnapshot of the balls and the complexity the simulation ended with,
+# and the PoolBoard returned for a hit is rebuilt on top of the board it was asked for, the
+# same as PoolWorld.get_board_state would have done.
+class SimulationCache:
+
+    DEFAULT_PATH = os.path.join(Constants.LOG_DIRECTORY, "simulation_cache")
+
+    def __init__(self, capacity : int = 100000, precision : float = 1e-4, persistent : bool = False, path : str = DEFAULT_PATH):
+        self.capacity = capacity
+        self.precision = precision
+        # Least recently used first
+        self.results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        # Every result is also written to the shelf, which outlives the process
+        self.store = shelve.open(path) if persistent else None
+
+    def key(self, board : PoolBoard, shot : Shot, source) -> tuple:
+        cue_ball = self.quantize_ball(board.cue_ball)
+        balls = tuple(sorted(self.quantize_ball(ball) for ball in board.balls))
+        shot_key = (round(shot.angle / self.precision), round(shot.magnitude / self.precision))
+        if board.cue_ball.pocketed:
+            shot_key += (round(shot.cue_ball_position[0] / self.precision), round(shot.cue_ball_position[1] / self.precision))
+        return (str(source), int(board.turn), cue_ball, balls, shot_key)
+
+    def quantize_ball(self, ball : Ball) -> tuple:
+        return (ball.number, ball.pocketed, round(ball.position[0] / self.precision), round(ball.position[1] / self.precision))
+
+    # Returns the board and complexity shot came to rest in if it is cached, otherwise None.
+    # source tells apart results from simulators that do not agree with each other, for
+    # a PoolWorld it is PoolWorld.settings_key, so results kept on disk are only used by
+    # worlds that would have simulated the same
+    def get(self, board : PoolBoard, shot : Shot, source) -> Tuple[PoolBoard, Complexity]:
+        key = self.key(board, shot, source)
+        with self.lock:
+            result = self.results.get(key)
+            if result is not None:
+                self.results.move_to_end(key)
+            elif self.store is not None:
+                result = self.store.get(repr(key))
+                if result is not None:
+                    self.remember(key, result)
+            if result is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        snapshot, first_hit, complexity = result
+        previous_board = PreviousBoard(board, None if first_hit is None else Ball(*first_hit))
+        return snapshot.to_board(previous_board), copy.deepcopy(complexity)
+
+    # Caches the board and complexity shot came to rest in. Scoring a board changes its
+    # complexity, so this has to be called before it is scored
+    def put(self, board : PoolBoard, shot : Shot, source, current_board : PoolBoard, complexity : Complexity):
+        key = self.key(board, shot, source)
+        first_hit = current_board.previous_board.first_hit
+        result = (
+            BoardSnapshot.from_board(current_board),
+            None if first_hit is None else (tuple(first_hit.position), first_hit.number),
+            copy.deepcopy(complexity)
+        )
+        with self.lock:
+            self.remember(key, result)
+            if self.store is not None:
+                self.store[repr(key)] = result
+
+    def remember(self, key : tuple, result : tuple):
+        self.results[key] = result
+        self.results.move_to_end(key)
+        while len(self.results) > self.capacity:
+            self.results.popitem(last=False)
+
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
+
+    def __str__(self):
+        return f"SimulationCache: {len(self.results)} results, {self.hits} hits, {self.misses} misses"
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,280 @@
+import argparse
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import signal
+import sys
+import time
+import zlib
+from typing import Dict, Iterator, List, Set
+
+import numpy as np
+
+import ai
+from board import PoolPlayer, PoolState
+from constants import Constants
+from pool import Pool
+from world import PoolWorld
+
+# Pits the AIs against each other over full games, without the game loop of
+# Pool.productionMode or any graphics:
+#
+#   python tournament.py --ai random simple realistic --rounds 100 --workers 8
+#
+# Every round each pair of AIs plays two games, one with each of them breaking, from
+# the same rack. A game's rack and the cue ball placements of the AIs follow from its
+# seed, and every game is played in worlds of its own, so a game plays out the same in
+# any worker. The games are spread across worker processes and every finished game is
+# appended to the output as a JSON line. Games already in the output are not played
+# again, so a run that was stopped carries on where it was. The win rates, decision
+# latencies and games per hour are printed at the end.
+
+AI_TYPES = {
+    "random": ai.RandomAI,
+    "simple": ai.SimpleAI,
+    "realistic": ai.RealisticAI,
+    "depth": ai.DepthAI,
+    "nerfed_depth": ai.NerfedDepthAI,
+}
+
+DEFAULT_OUTPUT = os.path.join(Constants.LOG_DIRECTORY, "tournament.jsonl")
+
+# A game is a draw once this many shots were taken without a winner
+DEFAULT_MAX_TURNS = 200
+
+# What one game is played with
+class GameSpec:
+
+    def __init__(self, round : int, player1 : str, player2 : str, seed : int):
+        self.round = round
+        self.player1 = player1
+        self.player2 = player2
+        self.seed = seed
+
+    def game_id(self) -> str:
+        return f"{self.round}:{self.player1}:{self.player2}:{self.seed}"
+
+def round_seed(seed : int, round : int) -> int:
+    return zlib.crc32(f"{seed}:{round}".encode())
+
+# Every game of rounds rounds between the AIs in ais, round by round so a run that is
+# stopped early has played every pair about as often
+def schedule(ais : List[str], rounds : int, seed : int = 0) -> Iterator[GameSpec]:
+    for round in range(rounds):
+        game_seed = round_seed(seed, round)
+        for first, second in itertools.combinations(ais, 2):
+            yield GameSpec(round, first, second, game_seed)
+            yield GameSpec(round, second, first, game_seed)
+
+# Plays spec out and returns its result. Decision latency is the time decide took
+def play_game(spec : GameSpec, magnitudes, angles, time_budget : float = None, max_turns : int = DEFAULT_MAX_TURNS) -> dict:
+    t0 = time.perf_counter()
+    random.seed(spec.seed)
+    np.random.seed(spec.seed % 2**32)
+    # A new game with a world of its own to play the shots out in
+    pool = Pool(graphics=False)
+    board = pool.generate_normal_board()
+    players = {
+        PoolPlayer.PLAYER1: AI_TYPES[spec.player1](PoolPlayer.PLAYER1, magnitudes, angles, world=PoolWorld(reuse_bodies=True), time_budget=time_budget),
+        PoolPlayer.PLAYER2: AI_TYPES[spec.player2](PoolPlayer.PLAYER2, magnitudes, angles, world=PoolWorld(reuse_bodies=True), time_budget=time_budget),
+    }
+    shots = {PoolPlayer.PLAYER1: 0, PoolPlayer.PLAYER2: 0}
+    latency = {PoolPlayer.PLAYER1: 0.0, PoolPlayer.PLAYER2: 0.0}
+    world = pool.world
+    turns = 0
+    while board.get_state() == PoolState.ONGOING and turns < max_turns:
+        turn = board.turn
+        t1 = time.perf_counter()
+        decision = players[turn].decide(board)
+        latency[turn] += time.perf_counter() - t1
+        shots[turn] += 1
+        world.load_board(board)
+        world.shoot(decision.shot)
+        world.simulate_until_still(Constants.TIME_STEP, Constants.VEL_ITERS, Constants.POS_ITERS)
+        board = world.get_board_state()
+        turns += 1
+
+    state = board.get_state()
+    winner = None
+    if state == PoolState.PLAYER1_WIN:
+        winner = spec.player1
+    elif state == PoolState.PLAYER2_WIN:
+        winner = spec.player2
+    return {
+        "game": spec.game_id(),
+        "round": spec.round,
+        "seed": spec.seed,
+        "player1": spec.player1,
+        "player2": spec.player2,
+        "winner": winner,
+        "state": state.name,
+        "turns": turns,
+        "player1_shots": shots[PoolPlayer.PLAYER1],
+        "player2_shots": shots[PoolPlayer.PLAYER2],
+        "player1_seconds": latency[PoolPlayer.PLAYER1],
+        "player2_seconds": latency[PoolPlayer.PLAYER2],
+        "seconds": time.perf_counter() - t0,
+    }
+
+_settings : dict = None
+
+# Runs once in every worker process
+def _init_worker(magnitudes, angles, time_budget : float, max_turns : int):
+    global _settings
+    # Stopping is up to the main process, which lets the games being played finish
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # The AIs print their progress, which would be thousands of lines a game
+    sys.stdout = open(os.devnull, "w")
+    _settings = {"magnitudes": magnitudes, "angles": angles, "time_budget": time_budget, "max_turns": max_turns}
+
+def _play(spec : GameSpec) -> dict:
+    try:
+        return play_game(spec, **_settings)
+    except Exception as e:
+        return {"game": spec.game_id(), "round": spec.round, "seed": spec.seed, "player1": spec.player1, "player2": spec.player2, "error": f"{type(e).__name__}: {e}"}
+
+# Every result in a file written by run_tournament, skipping a last line that was cut
+# short
+def read_results(path : str) -> List[dict]:
+    results = []
+    if not os.path.exists(path):
+        return results
+    with open(path, "r") as file:
+        for line in file:
+            try:
+                results.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return results
+
+# Plays every game in specs that is not in done and appends its result to output.
+# Returns the results of the games played. The first interrupt stops starting games
+# and waits for the ones being played, the second one stops right away
+def run_tournament(specs : Iterator[GameSpec], output : str, done : Set[str] = set(), workers : int = None, magnitudes=[75.0, 100.0, 125.0], angles=range(0, 360, 2), time_budget : float = None, max_turns : int = DEFAULT_MAX_TURNS) -> List[dict]:
+    workers = workers if workers is not None else os.cpu_count()
+    results = []
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    with open(output, "a") as file:
+
+        def write(future : Future):
+            if future.cancelled():
+                return
+            result = future.result()
+            file.write(json.dumps(result) + "\n")
+            file.flush()
+            results.append(result)
+            if "error" in result:
+                print(f"{result['game']}: {result['error']}", file=sys.stderr)
+            else:
+                print(f"{result['game']}: {result['winner'] or 'draw'} after {result['turns']} shots, {result['seconds']:.1f} s", file=sys.stderr)
+
+        # spawn for the same reason as in ParallelShotEvaluator
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(magnitudes, angles, time_budget, max_turns)
+        ) as executor:
+            futures = set()
+            try:
+                for spec in specs:
+                    if spec.game_id() in done:
+                        continue
+                    # Only the games being played are queued, so few are left to wait
+                    # for when the run is stopped
+                    if len(futures) >= workers:
+                        finished, futures = wait(futures, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            write(future)
+                    futures.add(executor.submit(_play, spec))
+                for future in wait(futures).done:
+                    write(future)
+            except KeyboardInterrupt:
+                print("Stopping once the games being played are finished, interrupt again to stop now", file=sys.stderr)
+                for future in futures:
+                    future.cancel()
+                for future in wait(futures).done:
+                    write(future)
+    return results
+
+# Win rates and decision latencies of every AI in results, and how every pair of AIs did
+# against each other
+def summarize(results : List[dict]) -> dict:
+    ais : Dict[str, dict] = {}
+    pairs : Dict[str, dict] = {}
+    for result in results:
+        if "error" in result:
+            continue
+        for seat in ("player1", "player2"):
+            name = result[seat]
+            stats = ais.setdefault(name, {"games": 0, "wins": 0, "losses": 0, "draws": 0, "shots": 0, "seconds": 0.0})
+            stats["games"] += 1
+            if result["winner"] is None:
+                stats["draws"] += 1
+            elif result["winner"] == name:
+                stats["wins"] += 1
+            else:
+                stats["losses"] += 1
+            stats["shots"] += result[f"{seat}_shots"]
+            stats["seconds"] += result[f"{seat}_seconds"]
+        first, second = sorted((result["player1"], result["player2"]))
+        pair = pairs.setdefault(f"{first} vs {second}", {first: 0, second: 0, "draws": 0})
+        if result["winner"] is None:
+            pair["draws"] += 1
+        else:
+            pair[result["winner"]] += 1
+    for stats in ais.values():
+        stats["win_rate"] = stats["wins"] / stats["games"]
+        stats["mean_decision_seconds"] = stats["seconds"] / stats["shots"] if stats["shots"] > 0 else 0.0
+    games = [result for result in results if "error" not in result]
+    return {
+        "games": len(games),
+        "errors": len(results) - len(games),
+        "mean_turns": sum(result["turns"] for result in games) / len(games) if len(games) > 0 else 0.0,
+        "ais": ais,
+        "pairs": pairs,
+    }
+
+def print_summary(summary : dict):
+    print(f"{summary['games']} games, {summary['errors']} errors, {summary['mean_turns']:.1f} shots a game on average")
+    for name, stats in sorted(summary["ais"].items(), key=lambda item: -item[1]["win_rate"]):
+        print(f"{name}: {stats['win_rate']:.1%} won of {stats['games']} games ({stats['wins']} wins, {stats['losses']} losses, {stats['draws']} draws), "
+              f"{stats['mean_decision_seconds']:.3f} s per decision")
+    for pair, wins in summary["pairs"].items():
+        print(f"{pair}: " + ", ".join(f"{name} {count}" for name, count in wins.items()))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Plays the AIs against each other and reports their win rates")
+    parser.add_argument("--ai", nargs="+", choices=AI_TYPES.keys(), default=["random", "simple", "realistic"], help="AIs in the tournament")
+    parser.add_argument("--rounds", type=int, default=10, help="every pair of AIs plays two games a round")
+    parser.add_argument("--seed", type=int, default=0, help="the racks of a run, a run can only be resumed with the same seed")
+    parser.add_argument("-o", "--output", default=DEFAULT_OUTPUT, help="where the results are appended and resumed from")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--magnitudes", type=float, nargs="+", default=[75.0, 100.0, 125.0])
+    parser.add_argument("--angle-step", type=int, default=2, help="degrees between the angles searched")
+    parser.add_argument("--time-budget", type=float, help="seconds an AI may take for a decision")
+    parser.add_argument("--max-turns", type=int, default=DEFAULT_MAX_TURNS, help="shots after which a game is a draw")
+    args = parser.parse_args()
+
+    if len(args.ai) < 2:
+        parser.error("a tournament needs at least two AIs")
+    previous = read_results(args.output)
+    done = set(result["game"] for result in previous if "error" not in result)
+    if len(done) > 0:
+        print(f"Resuming after {len(done)} games in {args.output}", file=sys.stderr)
+
+    t0 = time.time()
+    results = run_tournament(schedule(args.ai, args.rounds, args.seed), args.output, done, args.workers, args.magnitudes, range(0, 360, args.angle_step), args.time_budget, args.max_turns)
+    t1 = time.time()
+
+    played = [result for result in results if "error" not in result]
+    print_summary(summarize([result for result in previous if "error" not in result] + results))
+    if len(played) > 0:
+        print(f"{len(played)} games played in {t1 - t0:.1f} s, {len(played) / (t1 - t0) * 3600:.0f} games per hour "
+              f"({sum(result['seconds'] for result in played) / len(played):.1f} s a game)")
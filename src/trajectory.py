@@ -0,0 +1,204 @@
+import argparse
+import os
+from typing import BinaryIO, Iterator, List
+
+import numpy as np
+
+from board import Shot
+from constants import Constants
+
+# Records where the balls are while a world simulates shots, so shots can be replayed
+# or analysed afterwards instead of only being watched live in testMode. Give a world
+# a recorder and it writes a frame every decimation steps into a buffer that is
+# allocated once:
+#
+#   world.recorder = TrajectoryRecorder(path="../logs/trajectories.bin", decimation=4)
+#
+# Every shot is appended to the file as a header, its frames and the step each frame
+# was taken at. A frame is the x and y of the 16 balls as 32 bit floats indexed by
+# ball number, NaN for balls that are not on the table. read_trajectories memory-maps
+# the file, so reading thousands of shots back does not load or parse them.
+
+MAGIC = b"PTRJ"
+VERSION = 1
+
+HEADER = np.dtype([
+    ("magic", "S4"),
+    ("version", "<u2"),
+    ("decimation", "<u2"),
+    ("frames", "<u4"),
+    ("steps", "<u4"),
+    ("time_step", "<f4"),
+    ("angle", "<f4"),
+    ("magnitude", "<f4"),
+    ("cue_ball_x", "<f4"),
+    ("cue_ball_y", "<f4"),
+])
+
+FRAME = np.dtype(("<f4", (16, 2)))
+
+# One recorded shot. positions is frames by 16 by 2 and frame_steps the step each frame
+# was taken at, both are views into the file when the trajectory was read from one.
+# When a shot had more frames than the recorder could hold only the last ones are kept
+class Trajectory:
+
+    def __init__(self, shot : Shot, positions : np.ndarray, frame_steps : np.ndarray, steps : int, decimation : int, time_step : float):
+        self.shot = shot
+        self.positions = positions
+        self.frame_steps = frame_steps
+        self.steps = steps
+        self.decimation = decimation
+        self.time_step = time_step
+
+    def __len__(self):
+        return len(self.positions)
+
+    def frame_times(self) -> np.ndarray:
+        return self.frame_steps * self.time_step
+
+    # The path of ball number, NaN once it is pocketed
+    def ball_path(self, number : int) -> np.ndarray:
+        return self.positions[:, number]
+
+    def on_table(self, frame : int) -> List[int]:
+        return np.flatnonzero(~np.isnan(self.positions[frame, :, 0])).tolist()
+
+    def header(self) -> np.ndarray:
+        header = np.zeros(1, dtype=HEADER)
+        header["magic"] = MAGIC
+        header["version"] = VERSION
+        header["decimation"] = self.decimation
+        header["frames"] = len(self.positions)
+        header["steps"] = self.steps
+        header["time_step"] = self.time_step
+        header["angle"] = self.shot.angle
+        header["magnitude"] = self.shot.magnitude
+        header["cue_ball_x"] = self.shot.cue_ball_position[0]
+        header["cue_ball_y"] = self.shot.cue_ball_position[1]
+        return header
+
+    def write(self, file : BinaryIO):
+        file.write(self.header().tobytes())
+        file.write(np.ascontiguousarray(self.positions, dtype=FRAME.base).tobytes())
+        file.write(np.ascontiguousarray(self.frame_steps, dtype="<u4").tobytes())
+
+# Keeps the last capacity frames of the shot being simulated. A world calls start when
+# a shot is taken, record after every step and finish once the table is at rest.
+# With a path every finished shot is appended to the file
+class TrajectoryRecorder:
+
+    def __init__(self, capacity : int = 2048, decimation : int = 4, path : str = None, time_step : float = Constants.TIME_STEP):
+        self.capacity = capacity
+        self.decimation = decimation
+        self.time_step = time_step
+        self.positions = np.full((capacity, 16, 2), np.nan, dtype=np.float32)
+        self.frame_steps = np.zeros(capacity, dtype=np.uint32)
+        self.path = path
+        self.file : BinaryIO = None
+        self.shot : Shot = None
+        self.step = 0
+        self.next_frame = 0
+        self.frames = 0
+        self.recorded = 0
+
+    def start(self, world, shot : Shot):
+        if shot.cue_ball_position is None:
+            # The shot is taken from wherever the cue ball is
+            position = world.cue_ball.position
+            shot = Shot(shot.angle, shot.magnitude, (position.x, position.y))
+        self.shot = shot
+        self.step = 0
+        self.next_frame = 0
+        self.frames = 0
+        self.take_frame(world)
+
+    # Called after the world moved steps steps
+    def record(self, world, steps : int = 1):
+        if self.shot is None:
+            return
+        self.step += steps
+        if self.step >= self.next_frame:
+            self.take_frame(world)
+
+    def take_frame(self, world):
+        index = self.frames % self.capacity
+        frame = self.positions[index]
+        frame.fill(np.nan)
+        numbers = []
+        positions = []
+        for body in world.balls:
+            position = body.position
+            numbers.append(body.userData.number)
+            positions.append((position.x, position.y))
+        if len(numbers) > 0:
+            frame[numbers] = positions
+        self.frame_steps[index] = self.step
+        self.frames += 1
+        self.next_frame = self.step - self.step % self.decimation + self.decimation
+
+    # Returns the frames recorded since the last start, oldest first
+    def trajectory(self) -> Trajectory:
+        count = min(self.frames, self.capacity)
+        first = self.frames - count
+        order = [(first + i) % self.capacity for i in range(count)]
+        return Trajectory(self.shot, self.positions[order], self.frame_steps[order], self.step, self.decimation, self.time_step)
+
+    # Takes the frame of the table at rest, and appends the shot to the file if there is one
+    def finish(self, world) -> Trajectory:
+        if self.shot is None:
+            return None
+        if self.frame_steps[(self.frames - 1) % self.capacity] != self.step:
+            self.take_frame(world)
+        trajectory = self.trajectory()
+        if self.path is not None:
+            if self.file is None:
+                self.file = open(self.path, "ab")
+            trajectory.write(self.file)
+            self.recorded += 1
+        self.shot = None
+        return trajectory
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+# Yields every shot in a file written by TrajectoryRecorder, the positions of each are
+# views into the memory-mapped file
+def read_trajectories(path : str) -> Iterator[Trajectory]:
+    if os.path.getsize(path) == 0:
+        return
+    data = np.memmap(path, dtype=np.uint8, mode="r")
+    offset = 0
+    while offset < len(data):
+        header = np.ndarray((), dtype=HEADER, buffer=data, offset=offset)
+        if header["magic"] != MAGIC or header["version"] != VERSION:
+            raise ValueError(f"{path} is not a trajectory file of version {VERSION} at byte {offset}")
+        offset += HEADER.itemsize
+        frames = int(header["frames"])
+        positions = np.ndarray((frames, 16, 2), dtype=FRAME.base, buffer=data, offset=offset)
+        offset += positions.nbytes
+        frame_steps = np.ndarray(frames, dtype="<u4", buffer=data, offset=offset)
+        offset += frame_steps.nbytes
+        shot = Shot(float(header["angle"]), float(header["magnitude"]), (float(header["cue_ball_x"]), float(header["cue_ball_y"])))
+        yield Trajectory(shot, positions, frame_steps, int(header["steps"]), int(header["decimation"]), float(header["time_step"]))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarises a file of recorded shots")
+    parser.add_argument("path")
+    args = parser.parse_args()
+
+    count = 0
+    frames = 0
+    for trajectory in read_trajectories(args.path):
+        count += 1
+        frames += len(trajectory)
+        pocketed = len(trajectory.on_table(0)) - len(trajectory.on_table(-1))
+        print(f"{trajectory.shot}: {len(trajectory)} frames over {trajectory.steps * trajectory.time_step:.2f} s, {pocketed} balls pocketed")
+    print(f"{count} shots, {frames} frames, {os.path.getsize(args.path) / 1e6:.2f} MB")
@@ -0,0 +1,411 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+
+import ai
+from board import Ball, Complexity, CueBall, PoolBoard, PoolPlayer, PoolState, Shot, calc_distance
+from constants import Bias, Constants, Weights
+from world import PoolWorld
+
+# Tunes Weights and Bias without simulating a shot more than once. RealisticAI scores
+# a shot from the board it came to rest in and its Complexity, and neither depends on
+# the weights, so every reachable shot of a corpus of boards is simulated once and the
+# raw features its heuristic is made of are stored:
+#
+#   python weight_tuning.py build --boards 200 --output ../logs/tuning_corpus.npz
+#   python weight_tuning.py search ../logs/tuning_corpus.npz --samples 4096
+#
+# A set of weights is then judged by scoring every candidate of every board with it in
+# NumPy, and seeing how often the shot RealisticAI would pick under it succeeds, that
+# is keeps the turn or wins the game. search tries random weights around the current
+# ones across worker processes and prints the best sets found.
+
+# The weights and biases the heuristics use, in the order of a parameter vector.
+# Weights.TOTAL_DISTANCE and Bias.COLLISIONS_WITH_TABLE are not used by any heuristic
+PARAMETERS = [
+    (Weights, "TOTAL_COLLISIONS"),
+    (Weights, "COLLISIONS_WITH_TABLE"),
+    (Weights, "POCKETED_BALL_COLLISIONS"),
+    (Weights, "DISTANCE_BEFORE_CONTACT"),
+    (Weights, "POSSESION"),
+    (Weights, "POCKETED"),
+    (Weights, "POCKETED_WALL_COLLISIONS"),
+    (Weights, "DISTANCE_PER_BALL"),
+    (Weights, "SCRATCH"),
+    (Weights, "GREAT_SHOT"),
+    (Weights, "GOOD_SHOT"),
+    (Weights, "WALL_EXPONENT"),
+    (Bias, "TOTAL_COLLISIONS"),
+    (Bias, "POCKETED_BALL_COLLISIONS"),
+]
+
+PARAMETER_NAMES = [f"{owner.__name__}.{name}" for owner, name in PARAMETERS]
+
+# The features a heuristic is linear in, with the parameter each is multiplied by and
+# its sign, None for the features that are added as they are. The heuristic is from
+# the shooter's point of view, like ComparableShot.heuristic
+LINEAR_FEATURES = [
+    ("fixed", None, 1.0),
+    ("total_collisions", "Weights.TOTAL_COLLISIONS", -1.0),
+    ("distance_before_contact", "Weights.DISTANCE_BEFORE_CONTACT", -1.0),
+    ("pocketed_ball_collisions", "Weights.POCKETED_BALL_COLLISIONS", -1.0),
+    ("distance_squared", "Weights.DISTANCE_PER_BALL", -1.0),
+    ("possession", "Weights.POSSESION", 1.0),
+    ("pocketed", "Weights.POCKETED", 1.0),
+    ("scratch", "Weights.SCRATCH", -1.0),
+    ("great_shot", "Weights.GREAT_SHOT", 1.0),
+    ("good_shot", "Weights.GOOD_SHOT", 1.0),
+    ("total_collisions_bias", "Bias.TOTAL_COLLISIONS", 1.0),
+    ("pocketed_ball_collisions_bias", "Bias.POCKETED_BALL_COLLISIONS", 2.0),
+]
+
+FEATURE_NAMES = [name for name, parameter, sign in LINEAR_FEATURES]
+
+DEFAULT_CORPUS = os.path.join(Constants.LOG_DIRECTORY, "tuning_corpus.npz")
+
+def current_parameters() -> np.ndarray:
+    return np.array([getattr(owner, name) for owner, name in PARAMETERS], dtype=np.float64)
+
+# Sets the weights and biases to parameters, for every AI in this process
+def apply_parameters(parameters : np.ndarray):
+    for (owner, name), value in zip(PARAMETERS, parameters):
+        setattr(owner, name, float(value))
+
+# What the heuristic of the shot from original_board that came to rest in current_board
+# is made of. Complexity.compute_complexity_heuristic changes the complexity, so this
+# has to be called before the shot is scored. Returns the linear features, the
+# collisions with the table and the wall collisions of every ball that counts as a
+# pocketed ball in compute_complexity_heuristic, NaN for the others
+def shot_features(player : ai.RealisticAI, shot : Shot, original_board : PoolBoard, current_board : PoolBoard, complexity : Complexity, easy_shots : List[float]):
+    shooter = original_board.turn
+    sign = 1.0 if shooter == PoolPlayer.PLAYER1 else -1.0
+    features = dict.fromkeys(FEATURE_NAMES, 0.0)
+    features["total_collisions_bias"] = 1.0
+    features["pocketed_ball_collisions_bias"] = 1.0
+
+    # RealisticAI.compute_heuristic
+    state = current_board.get_state()
+    if state == PoolState.PLAYER1_WIN:
+        features["fixed"] = sign * 1000.0
+    elif state == PoolState.PLAYER2_WIN:
+        features["fixed"] = sign * -1000.0
+    else:
+        pocketed_1 = current_board.player1_pocketed - current_board.previous_board.player1_pocketed
+        pocketed_2 = current_board.player2_pocketed - current_board.previous_board.player2_pocketed
+        if shooter == PoolPlayer.PLAYER1:
+            features["pocketed"] = pow(pocketed_1, 0.5) - pow(pocketed_2, 2)
+        else:
+            features["pocketed"] = -(pow(pocketed_1, 0.5) - pow(pocketed_1, 2))
+        features["possession"] = sign if current_board.turn == PoolPlayer.PLAYER1 else -sign
+        fixed = 0.0
+        for ball in current_board.balls:
+            if ball.number == 8:
+                if current_board.player1_pocketed == 7:
+                    fixed += 1 / player.distance_to_closest_pocket(ball)
+                if current_board.player2_pocketed == 7:
+                    fixed -= 1 / player.distance_to_closest_pocket(ball)
+            else:
+                value = min(1 / player.distance_to_closest_pocket(ball), 1.0)
+                fixed += value if ball.number < 8 else -value
+        features["fixed"] = sign * fixed
+
+    # Complexity.compute_complexity_heuristic, without changing the complexity
+    features["total_collisions"] = complexity.total_collisions
+    features["distance_before_contact"] = complexity.distance_before_contact
+    pocketed_ball_collisions = list(complexity.pocketed_ball_collisions)
+    pocketed_wall_collisions = list(complexity.pocketed_wall_collisions)
+    for ball in current_board.balls:
+        if ball.pocketed and complexity.collisions_by_ball[ball.number] > 0:
+            pocketed_ball_collisions.append(complexity.collisions_by_ball[ball.number])
+            pocketed_wall_collisions.append(complexity.wall_collisions_by_ball[ball.number])
+    features["pocketed_ball_collisions"] = sum(pocketed_ball_collisions)
+    distances = list(complexity.distance_by_ball)
+    for ball in current_board.balls + [current_board.cue_ball]:
+        x1, y1 = ball.position
+        x2, y2 = complexity.prev_pos[ball.number]
+        distances[ball.number] += calc_distance(x1, y1, x2, y2)
+    features["distance_squared"] = sum(distance * distance for distance in distances)
+
+    # RealisticAI.score_shot
+    first_hit = current_board.previous_board.first_hit
+    if shooter == PoolPlayer.PLAYER1:
+        wrong_ball = first_hit is not None and first_hit.number > 7
+    else:
+        wrong_ball = first_hit is not None and first_hit.number < 9
+    features["scratch"] = 1.0 if first_hit is None or wrong_ball or original_board.cue_ball.pocketed else 0.0
+
+    # RealisticAI.add_easy_shot_bonus
+    for easy_angle in easy_shots:
+        if shot.angle > easy_angle - 0.5 and shot.angle < easy_angle + 0.5:
+            features["great_shot"] = 1.0
+            break
+        elif shot.angle > easy_angle - 1 and shot.angle < easy_angle + 1:
+            features["good_shot"] = 1.0
+            break
+
+    walls = np.full(16, np.nan)
+    walls[:len(pocketed_wall_collisions)] = pocketed_wall_collisions
+    return [features[name] for name in FEATURE_NAMES], complexity.collisions_with_table, walls
+
+# The features of every reachable shot of one board, with the heuristic RealisticAI
+# gave it under the weights it was built with and whether it succeeded
+def board_features(board : PoolBoard, magnitudes, angles, world : PoolWorld = None) -> Dict[str, np.ndarray]:
+    player = ai.RealisticAI(board.turn, magnitudes, angles, world=world)
+    player.start_decision()
+    position = player.place_cue_ball(board)
+    shots = player.reachable_shots(board, [Shot(angle, magnitude, position) for angle in angles for magnitude in magnitudes])
+    easy_shots = player.generate_easy_shots(board)
+    rows = {"features": [], "collisions_with_table": [], "pocketed_wall_collisions": [], "heuristic": [], "success": [], "pocketed": [], "angle": [], "magnitude": []}
+    with player.simulation_world() as world:
+        for shot in shots:
+            current_board, complexity = player.simulate_shot(shot, board, world)
+            features, collisions_with_table, walls = shot_features(player, shot, board, current_board, complexity, easy_shots)
+            scored = player.score_shot(shot, board, current_board, complexity)
+            player.add_easy_shot_bonus(scored, easy_shots)
+            if board.turn == PoolPlayer.PLAYER1:
+                pocketed = current_board.player1_pocketed - board.player1_pocketed
+            else:
+                pocketed = current_board.player2_pocketed - board.player2_pocketed
+            rows["features"].append(features)
+            rows["collisions_with_table"].append(collisions_with_table)
+            rows["pocketed_wall_collisions"].append(walls)
+            rows["heuristic"].append(scored.heuristic)
+            rows["success"].append(ai.PoolAI.shot_succeeded(current_board, board.turn))
+            rows["pocketed"].append(pocketed)
+            rows["angle"].append(shot.angle)
+            rows["magnitude"].append(shot.magnitude)
+    return {
+        "features": np.array(rows["features"], dtype=np.float64).reshape(-1, len(FEATURE_NAMES)),
+        "collisions_with_table": np.array(rows["collisions_with_table"], dtype=np.float64),
+        "pocketed_wall_collisions": np.array(rows["pocketed_wall_collisions"], dtype=np.float64).reshape(-1, 16),
+        "heuristic": np.array(rows["heuristic"], dtype=np.float64),
+        "success": np.array(rows["success"], dtype=bool),
+        "pocketed": np.array(rows["pocketed"], dtype=np.int8),
+        "angle": np.array(rows["angle"], dtype=np.float32),
+        "magnitude": np.array(rows["magnitude"], dtype=np.float32),
+    }
+
+# Boards past the break with random balls left and a random cue ball, each board
+# seeded on its own so a corpus can be grown without changing the boards already in it
+def corpus_boards(count : int, seed : int = 0) -> List[PoolBoard]:
+    from benchmark import random_board
+    boards = []
+    margin = Constants.POCKET_RADIUS + Constants.BALL_RADIUS
+    for i in range(count):
+        random.seed(f"{seed}:{i}")
+        numbers = random.sample(range(1, 16), random.randint(2, 15))
+        cue_ball = CueBall([random.uniform(margin, Constants.TABLE_WIDTH - margin), random.uniform(margin, Constants.TABLE_HEIGHT - margin)])
+        board = random_board(numbers, cue_ball)
+        board.turn = random.choice([PoolPlayer.PLAYER1, PoolPlayer.PLAYER2])
+        boards.append(board)
+    return boards
+
+# The boards the decisions in a decision log were made on
+def decision_log_boards(path : str) -> List[PoolBoard]:
+    from decision_log import read_decision_log
+    log = read_decision_log(path, ["player", "turn_number", "positions", "pocketed"])
+    boards = []
+    for player, turn_number, positions, pocketed in zip(log["player"], log["turn_number"], log["positions"], log["pocketed"]):
+        balls = [Ball([float(x), float(y)], number, bool(pocketed >> number & 1)) for number, (x, y) in enumerate(positions) if number > 0]
+        x, y = positions[0]
+        board = PoolBoard(CueBall([float(x), float(y)], bool(pocketed & 1)), balls)
+        board.turn = PoolPlayer(int(player))
+        board.turn_number = int(turn_number)
+        boards.append(board)
+    return boards
+
+# The features of every reachable shot of a number of boards. board is the board a
+# shot was taken from, and the shots of board i are offsets[i] to offsets[i + 1]
+class FeatureCorpus:
+
+    def __init__(self, arrays : Dict[str, np.ndarray], parameters : np.ndarray):
+        self.features : np.ndarray = arrays["features"]
+        self.collisions_with_table : np.ndarray = arrays["collisions_with_table"]
+        self.pocketed_wall_collisions : np.ndarray = arrays["pocketed_wall_collisions"]
+        self.heuristic : np.ndarray = arrays["heuristic"]
+        self.success : np.ndarray = arrays["success"]
+        self.pocketed : np.ndarray = arrays["pocketed"]
+        self.angle : np.ndarray = arrays["angle"]
+        self.magnitude : np.ndarray = arrays["magnitude"]
+        self.offsets : np.ndarray = arrays["offsets"]
+        # The parameters heuristic was computed with
+        self.parameters = parameters
+        boards = len(self.offsets) - 1
+        counts = np.diff(self.offsets)
+        self.board = np.repeat(np.arange(boards), counts)
+        # The shots of every board as one row padded with -1, for picking the best shot
+        # of every board at once
+        self.padded = np.full((boards, counts.max() if boards > 0 else 0), -1, dtype=np.int64)
+        columns = np.arange(len(self.board)) - self.offsets[self.board]
+        self.padded[self.board, columns] = np.arange(len(self.board))
+        # Which of the wall collisions are there, see shot_features
+        self.wall_mask = ~np.isnan(self.pocketed_wall_collisions)
+        self.walls = np.where(self.wall_mask, self.pocketed_wall_collisions, 0.0)
+
+    def boards(self) -> int:
+        return len(self.offsets) - 1
+
+    def __len__(self):
+        return len(self.heuristic)
+
+    @staticmethod
+    def from_boards(boards : List[Dict[str, np.ndarray]], parameters : np.ndarray) -> "FeatureCorpus":
+        names = ["features", "collisions_with_table", "pocketed_wall_collisions", "heuristic", "success", "pocketed", "angle", "magnitude"]
+        arrays = {name: np.concatenate([board[name] for board in boards]) for name in names}
+        arrays["offsets"] = np.concatenate([[0], np.cumsum([len(board["heuristic"]) for board in boards])]).astype(np.int64)
+        return FeatureCorpus(arrays, parameters)
+
+    def save(self, path : str):
+        np.savez(path, features=self.features, collisions_with_table=self.collisions_with_table, pocketed_wall_collisions=self.pocketed_wall_collisions,
+                 heuristic=self.heuristic, success=self.success, pocketed=self.pocketed, angle=self.angle, magnitude=self.magnitude,
+                 offsets=self.offsets, parameters=self.parameters, feature_names=np.array(FEATURE_NAMES), parameter_names=np.array(PARAMETER_NAMES))
+
+    @staticmethod
+    def load(path : str) -> "FeatureCorpus":
+        with np.load(path) as data:
+            if list(data["feature_names"]) != FEATURE_NAMES or list(data["parameter_names"]) != PARAMETER_NAMES:
+                raise ValueError(f"{path} was built with other features, it has to be built again")
+            return FeatureCorpus({name: data[name] for name in data.files}, data["parameters"])
+
+    # The heuristic of every shot under every set of parameters, shots by sets
+    def heuristics(self, parameters : np.ndarray) -> np.ndarray:
+        parameters = np.atleast_2d(parameters)
+        coefficients = np.empty((len(parameters), len(LINEAR_FEATURES)))
+        for i, (name, parameter, sign) in enumerate(LINEAR_FEATURES):
+            coefficients[:, i] = sign if parameter is None else sign * parameters[:, PARAMETER_NAMES.index(parameter)]
+        heuristics = self.features @ coefficients.T
+        exponents = parameters[:, PARAMETER_NAMES.index("Weights.WALL_EXPONENT")]
+        table = parameters[:, PARAMETER_NAMES.index("Weights.COLLISIONS_WITH_TABLE")]
+        pocketed_walls = parameters[:, PARAMETER_NAMES.index("Weights.POCKETED_WALL_COLLISIONS")]
+        for i, exponent in enumerate(exponents):
+            heuristics[:, i] -= np.power(self.collisions_with_table, exponent) * table[i]
+            walls = np.where(self.wall_mask, np.power(self.walls, exponent), 0.0).sum(axis=1)
+            heuristics[:, i] -= walls * pocketed_walls[i]
+        return heuristics
+
+    # The shot RealisticAI would pick on every board under every set of parameters,
+    # boards by sets. Of shots with the same heuristic the first one is picked, like
+    # heapq.nsmallest does
+    def best_shots(self, parameters : np.ndarray) -> np.ndarray:
+        heuristics = self.heuristics(parameters)
+        padded = np.where(self.padded[:, :, None] >= 0, heuristics[self.padded], -np.inf)
+        best = padded.argmax(axis=1)
+        return np.take_along_axis(self.padded, best, axis=1)
+
+    # How often the shots picked under every set of parameters succeed, and how many of
+    # their balls they pocket on average. Boards without a reachable shot are left out
+    def evaluate(self, parameters : np.ndarray) -> Dict[str, np.ndarray]:
+        best = self.best_shots(parameters)
+        best = best[(best >= 0).all(axis=1)]
+        return {
+            "success_rate": self.success[best].mean(axis=0),
+            "mean_pocketed": self.pocketed[best].mean(axis=0),
+        }
+
+def _features_of(board : PoolBoard, magnitudes, angles) -> Dict[str, np.ndarray]:
+    # The AIs print their progress
+    sys.stdout = sys.stderr
+    # Every board is simulated in a world of its own, so a corpus does not depend on
+    # how its boards were spread across the workers
+    return board_features(board, magnitudes, angles, PoolWorld(reuse_bodies=True))
+
+# Simulates every reachable shot of every board once, across worker processes
+def build_corpus(boards : List[PoolBoard], magnitudes=[75.0, 100.0, 125.0], angles=range(0, 360), workers : int = None) -> FeatureCorpus:
+    workers = workers if workers is not None else os.cpu_count()
+    results = []
+    # spawn for the same reason as in ParallelShotEvaluator
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = [executor.submit(_features_of, board, magnitudes, angles) for board in boards]
+        for i, future in enumerate(futures):
+            results.append(future.result())
+            print(f"Board {i + 1}/{len(boards)}: {len(results[-1]['heuristic'])} shots", file=sys.stderr)
+    return FeatureCorpus.from_boards(results, current_parameters())
+
+_corpus : FeatureCorpus = None
+
+# Runs once in every worker process
+def _load_corpus(path : str):
+    global _corpus
+    _corpus = FeatureCorpus.load(path)
+
+def _evaluate(parameters : np.ndarray) -> Dict[str, np.ndarray]:
+    return _corpus.evaluate(parameters)
+
+# Random parameters around parameters, every one of them scaled by a factor whose
+# logarithm is normally distributed with standard deviation spread. Scaling cannot
+# move a parameter that is 0, so those are normally distributed around 0 with
+# standard deviation zero_spread instead. The first set is parameters itself
+def sample_parameters(parameters : np.ndarray, samples : int, spread : float = 0.5, seed : int = 0, zero_spread : float = 1.0) -> np.ndarray:
+    generator = np.random.default_rng(seed)
+    factors = np.exp(generator.normal(0.0, spread, (samples, len(parameters))))
+    sampled = parameters * factors
+    zero = parameters == 0
+    sampled[:, zero] = generator.normal(0.0, zero_spread, (samples, np.count_nonzero(zero)))
+    sampled[0] = parameters
+    return sampled
+
+# Evaluates every set of parameters on the corpus at path, batch_size sets at a time
+# across worker processes
+def search_parameters(path : str, parameters : np.ndarray, workers : int = None, batch_size : int = 32) -> Dict[str, np.ndarray]:
+    workers = workers if workers is not None else os.cpu_count()
+    batches = [parameters[i:i + batch_size] for i in range(0, len(parameters), batch_size)]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"), initializer=_load_corpus, initargs=(path,)) as executor:
+        results = list(executor.map(_evaluate, batches))
+    return {name: np.concatenate([result[name] for result in results]) for name in results[0]}
+
+def parameters_to_json(parameters : np.ndarray) -> dict:
+    return {name: float(value) for name, value in zip(PARAMETER_NAMES, parameters)}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tunes Weights and Bias on stored shot features")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="simulates the shots of a corpus of boards and stores their features")
+    build.add_argument("--boards", type=int, default=100, help="random boards in the corpus")
+    build.add_argument("--log", help="use the boards of this decision log instead of random ones")
+    build.add_argument("--seed", type=int, default=0)
+    build.add_argument("--magnitudes", type=float, nargs="+", default=[75.0, 100.0, 125.0])
+    build.add_argument("--angle-step", type=float, default=1.0, help="degrees between the angles simulated")
+    build.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    build.add_argument("-o", "--output", default=DEFAULT_CORPUS)
+    search = commands.add_parser("search", help="tries random weights on a corpus")
+    search.add_argument("corpus", nargs="?", default=DEFAULT_CORPUS)
+    search.add_argument("--samples", type=int, default=1024, help="sets of weights tried")
+    search.add_argument("--spread", type=float, default=0.5, help="standard deviation of the log of the factors the weights are scaled by")
+    search.add_argument("--zero-spread", type=float, default=1.0, help="standard deviation of the weights that are 0 now")
+    search.add_argument("--seed", type=int, default=0)
+    search.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    search.add_argument("--top", type=int, default=5, help="sets of weights printed")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        boards = decision_log_boards(args.log) if args.log is not None else corpus_boards(args.boards, args.seed)
+        angles = [i * args.angle_step for i in range(math.ceil(360 / args.angle_step))]
+        t0 = time.time()
+        corpus = build_corpus(boards, args.magnitudes, angles, args.workers)
+        directory = os.path.dirname(args.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        corpus.save(args.output)
+        print(f"{len(corpus)} shots of {corpus.boards()} boards in {time.time() - t0:.1f} s, written to {args.output}")
+    else:
+        corpus = FeatureCorpus.load(args.corpus)
+        error = np.abs(corpus.heuristics(corpus.parameters)[:, 0] - corpus.heuristic).max() if len(corpus) > 0 else 0.0
+        print(f"{len(corpus)} shots of {corpus.boards()} boards, largest difference to the stored heuristics {error:.2e}")
+        parameters = sample_parameters(corpus.parameters, args.samples, args.spread, args.seed, args.zero_spread)
+        t0 = time.time()
+        results = search_parameters(args.corpus, parameters, args.workers)
+        t1 = time.time()
+        print(f"{len(parameters)} sets of weights in {t1 - t0:.2f} s, {len(parameters) * len(corpus) / (t1 - t0) / 1e6:.1f} million shots scored per second")
+        print(f"Corpus weights: {results['success_rate'][0]:.1%} of the picked shots succeed, {results['mean_pocketed'][0]:.2f} balls pocketed on average")
+        order = np.lexsort((-results["mean_pocketed"], -results["success_rate"]))
+        for i in order[:args.top]:
+            print(json.dumps({"success_rate": float(results["success_rate"][i]), "mean_pocketed": float(results["mean_pocketed"][i]), "parameters": parameters_to_json(parameters[i])}))
@@ -0,0 +1,627 @@
+import Box2D
+from Box2D.Box2D import *
+from collections import deque
+from contextlib import contextmanager
+import copy
+from enum import IntEnum
+import math
+import numpy as np
+import threading
+from typing import Dict, List, Set, Tuple
+from board import Ball, Complexity, CueBall, Point, PoolBoard, Shot, calc_distance
+from constants import Constants
+from search_profile import NO_PROFILE
+from trajectory import TrajectoryRecorder
+
+# The physics of a pool table. Like board.py this only imports Box2D, the game in
+# pool.py draws a world through get_graphics when it has graphics.
+
+# Used in userData
+class PoolType(IntEnum):
+    BALL = 1
+    POCKET = 2
+    WALL = 3
+
+# userData Classes
+class PoolData:
+
+    def __init__(self, type : PoolType):
+        self.type = type
+
+class BallData(PoolData):
+
+    def __init__(self, number : int, pocketed : bool):
+        super().__init__(PoolType.BALL)
+        self.number = number
+        self.pocketed = pocketed  
+
+# Step counts of the simulations run by a PoolWorld
+class SimulationStats:
+    def __init__(self):
+        self.simulations = 0
+        self.total_steps = 0
+        self.max_steps = 0
+        # Simulations that were stopped by max_seconds before the table came to rest
+        self.capped = 0
+        self.last_steps = 0
+        self.total_contacts = 0
+
+    def record(self, steps : int, capped : bool):
+        self.simulations += 1
+        self.total_steps += steps
+        self.max_steps = max(self.max_steps, steps)
+        self.capped += capped
+        self.last_steps = steps
+
+    def mean_steps(self) -> float:
+        return self.total_steps / self.simulations if self.simulations > 0 else 0.0
+
+    def __str__(self):
+        return f"{self.simulations} simulations, {self.mean_steps():.1f} steps on average, {self.max_steps} at most, {self.capped} capped"
+
+# This can be used to simulate a given shot constructed from a PoolBoard
+class PoolWorld(b2ContactListener):
+
+    def __init__(self, reuse_bodies : bool = False, adaptive_stepping : bool = False):
+        super().__init__()
+        # Using a deque as a linked list improves performance
+        # Due to needing multiple remove() calls
+        print("velocity threshold: " + str(b2_velocityThreshold))
+        #b2.b2_velocityThreshold = 0
+        
+        
+        self.complexity = Complexity()
+        # Records every shot the world simulates when set
+        self.recorder : TrajectoryRecorder = None
+        self.cue_ball_collisions = 0
+        self.balls : deque[b2Body] = deque()
+        self.pocketed_balls : List[Ball] = []
+        # The pockets and cushions, drawn by a Pool that has graphics
+        self.table_bodies : List[b2Body] = []
+        self.pockets = PoolWorld.create_pockets()
+    
+        self.to_remove : Set[b2Body] = set()
+
+        self.board : PoolBoard = None
+        self.cue_ball : b2Body = None
+
+        self.world = b2World(gravity=(0, 0), doSleep=True)
+        self.world.autoClearForces = True
+        self.world.contactListener = self
+        
+        # Create the pocket fixtures which are sensors
+        # The radius is such that a collision only occurs when the center of the ball
+        # overlaps with the edge of the pocket
+        pocket_fd = b2FixtureDef(shape=b2CircleShape(radius=Constants.POCKET_RADIUS - Constants.BALL_RADIUS))
+        pocket_fd.isSensor = True
+        for pocket in self.pockets:
+            body:b2Body = self.world.CreateStaticBody(
+                position=pocket.to_tuple(),
+                fixtures=pocket_fd
+            )
+            body.userData = PoolData(PoolType.POCKET)
+            self.table_bodies.append(body)
+
+        # Create the edges of the pool table
+        walls = PoolWorld.create_walls(self.pockets)
+        for vertices in walls:
+            self.create_boundary_wall(vertices)
+
+        # When bodies are reused every ball number keeps one body for the life of the
+        # world. load_board moves it into place and pocketing deactivates it, instead
+        # of a body being created and destroyed for every simulation
+        self.reuse_bodies = reuse_bodies
+        self.ball_bodies : Dict[int, b2Body] = {}
+        self.stats = SimulationStats()
+        # The SearchProfile of the search using the world, which times the contacts
+        self.profile = NO_PROFILE
+
+        # With adaptive stepping, the slow tail of a shot is advanced several steps at
+        # a time whenever no ball can reach another ball, a cushion or a pocket before
+        # the end of them. Nothing can touch in those steps, so the only thing Box2D
+        # would do is damp and move every ball, which is done here directly
+        self.adaptive_stepping = adaptive_stepping
+        segments = [(start, end) for vertices in walls for start, end in zip(vertices, vertices[1:])]
+        self.wall_starts = np.array([start for start, end in segments])
+        self.wall_directions = np.array([(end[0] - start[0], end[1] - start[1]) for start, end in segments])
+        self.pocket_positions = np.array([pocket.to_tuple() for pocket in self.pockets])
+
+    def BeginContact(self, contact:b2Contact):
+        self.stats.total_contacts += 1
+        if self.profile.enabled:
+            with self.profile.phase("contacts"):
+                self.record_contact(contact)
+        else:
+            self.record_contact(contact)
+
+    def record_contact(self, contact:b2Contact):
+        body1 : b2Body = contact.fixtureA.body
+        body2 : b2Body = contact.fixtureB.body
+        data1 : BallData = body1.userData
+        data2 : BallData = body2.userData
+        type1 = data1.type
+        type2 = data2.type
+        
+        # update complexity system
+        if ( abs(body1.linearVelocity.x != 0) or
+             abs(body1.linearVelocity.y != 0) or
+             abs(body2.linearVelocity.x != 0) or
+             abs(body2.linearVelocity.y != 0)
+        ):
+            if data1.type != PoolType.POCKET and data2.type != PoolType.POCKET:     
+                self.complexity.total_collisions += 1
+            if type1 == PoolType.BALL:
+                self.complexity.collisions_by_ball[data1.number] += 1
+                x1, y1 = body1.position
+                x2, y2 = self.complexity.prev_pos[data1.number]
+                self.complexity.prev_pos[data1.number] = (x1, y1)
+                distance = calc_distance(x1, y1, x2, y2)
+                self.complexity.distance_by_ball[data1.number] += distance
+                
+            if type2 == PoolType.BALL:
+                self.complexity.collisions_by_ball[data2.number] += 1
+                x1, y1 = body2.position
+                x2, y2 = self.complexity.prev_pos[data2.number]
+                self.complexity.prev_pos[data2.number] = (x1, y1)
+                distance = calc_distance(x1, y1, x2, y2)
+                self.complexity.distance_by_ball[data2.number] += distance
+                
+            # Wall hit
+            if ((type1 == PoolType.BALL or type2 == PoolType.BALL) and
+                    (type1 == PoolType.WALL or type2 == PoolType.WALL)
+                ):
+                    if type1 == PoolType.BALL:
+                        if (body1.linearVelocity.length < 1.1):
+                            
+                            if body1.linearVelocity.x < 0:
+                                body1.linearVelocity.x -= 0.1
+                            else:
+                                body1.linearVelocity.x += 0.1
+                            
+                            if body1.linearVelocity.y < 0:
+                                body1.linearVelocity.y -= 0.1
+                            else:
+                                body1.linearVelocity.y += 0.1              
+                    else:
+                        if body2.linearVelocity.x < 0:
+                            body2.linearVelocity.x -= 0.1
+                        else:
+                            body2.linearVelocity.x += 0.1
+                        
+                        if body2.linearVelocity.y < 0:
+                            body2.linearVelocity.y -= 0.1
+                        else:
+                            body2.linearVelocity.y += 0.1
+
+                            
+                    if type1 == PoolType.BALL and data1.number != 0:
+                        self.complexity.wall_collisions_by_ball[data1.number] += 1
+                    elif type2 == PoolType.BALL and data2.number != 0:
+                        self.complexity.wall_collisions_by_ball[data2.number] += 1
+                    
+            if self.board.first_hit is None:
+                if ((type1 == PoolType.BALL or type2 == PoolType.BALL) and
+                    (type1 == PoolType.WALL or type2 == PoolType.WALL)
+                ):
+                    self.complexity.collisions_with_table += 1
+
+        # Pocket the ball if it comes into contact with a pocket
+        
+        if type1 == PoolType.BALL and type2 == PoolType.POCKET:
+            data1.pocketed = True
+            self.to_remove.add(body1)
+        elif type2 == PoolType.BALL and type1 == PoolType.POCKET:
+            data2.pocketed = True
+            self.to_remove.add(body2)
+        elif self.board.first_hit is None and (type1 == PoolType.BALL and type2 == PoolType.BALL):
+            if data1.number == Constants.CUE_BALL:
+                # calculate the distance before the first hit
+                x1, y1 = body1.position
+                x2, y2 = self.complexity.initial_cue_ball_pos[0], self.complexity.initial_cue_ball_pos[1]
+                self.complexity.distance_before_contact = calc_distance(x1, y1, x2, y2)
+                
+                self.board.first_hit = Ball.from_b2_body(body2)
+
+            elif data2.number == Constants.CUE_BALL:
+                # calculate the distance before the first hit
+                x1, y1 = body1.position
+                x2, y2 = self.complexity.initial_cue_ball_pos[0], self.complexity.initial_cue_ball_pos[1]
+                self.complexity.distance_before_contact = calc_distance(x1, y1, x2, y2)
+
+                self.board.first_hit = Ball.from_b2_body(body1)
+
+    def load_board(self, board : PoolBoard):
+        self.complexity = Complexity(board.cue_ball.position.x, board.cue_ball.position.y)
+        self.complexity.set_ball_pos(board)
+        # The board is copied so that first_hit is recorded for this simulation only,
+        # the same board may be loaded into other worlds at the same time
+        self.board = copy.copy(board)
+        for ball in self.balls:
+            self.remove_body(ball)
+        self.balls = deque()
+        self.pocketed_balls = []
+        if not board.cue_ball.pocketed:
+            self.cue_ball = self.create_ball(board.cue_ball)
+        else: 
+            self.cue_ball = None
+            self.pocketed_balls.append(board.cue_ball)
+
+        for b in board.balls:
+            if not b.pocketed:
+                ball = self.create_ball(b)
+            else:
+                self.pocketed_balls.append(b)
+        
+        self.first_hit = None
+
+    def shoot(self, shot:Shot):
+        self.board.first_hit = None
+        if self.cue_ball is None:
+            self.cue_ball = self.create_ball(CueBall(shot.cue_ball_position))
+            self.pocketed_balls.remove(self.board.cue_ball)
+        self.cue_ball.ApplyForce(shot.calculate_force(), self.cue_ball.localCenter, True)
+        if self.recorder is not None:
+            self.recorder.start(self, shot)
+
+    def create_ball(self, b:Ball) -> b2Body:
+        if self.reuse_bodies and b.number in self.ball_bodies:
+            return self.reset_ball(self.ball_bodies[b.number], b)
+        # constants taken from here:
+        # https://github.com/agarwl/eight-ball-pool/blob/master/src/dominos.cpp
+        ball_fd = b2FixtureDef(shape=b2CircleShape(radius=Constants.BALL_RADIUS))
+        ball_fd.density = Constants.BALL_DENSITY
+        ball_fd.restitution = Constants.BALL_RESTITUTION
+        
+        
+    
+        ball:b2Body = self.world.CreateDynamicBody(position=b.position, angle=b.angle, fixtures=ball_fd)
+        ball.bullet = True
+        ball.linearDamping = Constants.LINEAR_DAMPING
+        ball.angularDamping = Constants.ANGULAR_DAMPING
+        ball.userData = BallData(b.number, False)
+        self.balls.append(ball)
+        if self.reuse_bodies:
+            self.ball_bodies[b.number] = ball
+        return ball
+
+    # Puts a reused body back on the table as it would be if it was just created
+    def reset_ball(self, ball:b2Body, b:Ball) -> b2Body:
+        ball.transform = (b.position, b.angle)
+        ball.linearVelocity = (0, 0)
+        ball.angularVelocity = 0
+        ball.userData = BallData(b.number, False)
+        ball.active = True
+        # Falling asleep and waking up again restarts the body's sleep timer
+        ball.awake = False
+        ball.awake = True
+        self.balls.append(ball)
+        return ball
+
+    # Takes a ball off the table. Deactivating a body also destroys its contacts, so
+    # a reused body starts the next simulation without any
+    def remove_body(self, ball:b2Body):
+        if self.reuse_bodies:
+            ball.active = False
+        else:
+            self.world.DestroyBody(ball)
+
+    def create_boundary_wall(self, vertices:List[Tuple[float, float]]):
+        fixture = b2FixtureDef(shape=b2ChainShape(vertices_chain=vertices))
+     
+        fixture.density = 1
+        fixture.restitution = Constants.WALL_RESTITUTION
+  
+        body:b2Body = self.world.CreateStaticBody(fixtures=fixture)
+        body.userData = PoolData(PoolType.WALL)
+        self.table_bodies.append(body)
+
+    def update_physics(self, time_step, vel_iters, pos_iters):
+        # Make Box2D simulate the physics of our world for one step.
+        self.world.Step(time_step, vel_iters, pos_iters)
+
+        moving = False
+        for ball in self.balls:
+            if ball.linearVelocity.x > 0.001 or ball.linearVelocity.x < -0.001 or ball.linearVelocity.y > 0.001 or ball.linearVelocity.y < -0.001:
+                moving = True
+                break
+        self.remove_pocketed_balls()
+        if self.recorder is not None:
+            self.recorder.record(self)
+            if not moving:
+                self.recorder.finish(self)
+        return moving
+
+    def remove_pocketed_balls(self):
+        for ball in self.to_remove:
+            self.pocketed_balls.append(Ball.from_b2_body(ball))
+            self.balls.remove(ball)
+            self.remove_body(ball)
+        self.to_remove.clear()
+
+    # Steps the world until the table is at rest, which is when every ball is asleep
+    # or the balls that are awake have less than rest_energy of kinetic energy left
+    def simulate_until_still(self, time_step, vel_iters, pos_iters, max_seconds=15, rest_energy=Constants.REST_ENERGY):
+        steps = 0
+        max_steps = int(max_seconds / time_step)
+        if not self.adaptive_stepping:
+            while steps < max_steps:
+                self.world.Step(time_step, vel_iters, pos_iters)
+                self.remove_pocketed_balls()
+                steps += 1
+                if self.recorder is not None:
+                    self.recorder.record(self)
+                if self.at_rest(rest_energy):
+                    break
+            self.stats.record(steps, steps >= max_steps)
+            if self.recorder is not None:
+                self.recorder.finish(self)
+            return
+
+        # Checking whether steps can be merged costs about as much as a few steps, so
+        # after a check fails the next one waits twice as long as the last did. The
+        # force of the shot is only applied by the first step
+        limit = 2 * rest_energy / (Constants.BALL_DENSITY * math.pi * Constants.BALL_RADIUS * Constants.BALL_RADIUS)
+        next_merge = 1
+        retry = Constants.ADAPTIVE_RETRY_STEPS
+        while steps < max_steps:
+            merged = 0
+            if steps >= next_merge:
+                merged = self.steps_without_contact(time_step, max_steps - steps, limit)
+                if merged < 2:
+                    merged = 0
+                    next_merge = steps + retry
+                    retry *= 2
+                else:
+                    retry = Constants.ADAPTIVE_RETRY_STEPS
+            if merged > 0:
+                self.advance(time_step, merged)
+                steps += merged
+            else:
+                self.world.Step(time_step, vel_iters, pos_iters)
+                self.remove_pocketed_balls()
+                steps += 1
+            if self.recorder is not None:
+                self.recorder.record(self, merged if merged > 0 else 1)
+            if self.at_rest(rest_energy):
+                break
+        self.stats.record(steps, steps >= max_steps)
+        if self.recorder is not None:
+            self.recorder.finish(self)
+
+    # Returns how many steps of time_step, at most max_steps, every ball can take
+    # without being able to reach another ball, a cushion or a pocket. Balls only slow
+    # down until they touch something, so their current speeds bound how far they go.
+    # No more steps are returned than it takes for the sum of the squared speeds of the
+    # balls to drop below limit
+    def steps_without_contact(self, time_step, max_steps, limit) -> int:
+        positions = []
+        velocities = []
+        fastest = 0.0
+        for ball in self.balls:
+            positions.append(tuple(ball.position))
+            if ball.awake:
+                x, y = ball.linearVelocity
+                velocities.append((x, y))
+                fastest = max(fastest, x * x + y * y)
+            else:
+                velocities.append((0.0, 0.0))
+        if fastest == 0.0 or fastest > Constants.ADAPTIVE_MAX_SPEED * Constants.ADAPTIVE_MAX_SPEED:
+            return 0
+        positions = np.array(positions)
+        velocities = np.array(velocities)
+        speeds = np.sqrt((velocities * velocities).sum(axis=1))
+        rolling = speeds > 0
+        radius = Constants.BALL_RADIUS
+        margin = Constants.ADAPTIVE_MARGIN
+        # Only the rolling balls can start a contact. Something a ball is not moving
+        # towards can never get closer to it, as long as it moves in a straight line
+        position = positions[rolling]
+        velocity = velocities[rolling]
+        speed = speeds[rolling]
+
+        # Two balls close the gap between them at most as fast as their relative speed
+        offsets = positions[None, :, :] - position[:, None, :]
+        relative = velocity[:, None, :] - velocities[None, :, :]
+        gaps = np.sqrt((offsets * offsets).sum(axis=2)) - 2 * radius - margin
+        approaching = (offsets * relative).sum(axis=2) > 0
+        times = gaps[approaching] / np.sqrt((relative * relative).sum(axis=2))[approaching]
+
+        # Cushions are chains of edges with Box2D's polygon skin around them
+        to_ball = position[:, None, :] - self.wall_starts[None, :, :]
+        along = (to_ball * self.wall_directions).sum(axis=2) / (self.wall_directions * self.wall_directions).sum(axis=1)
+        closest = to_ball - np.clip(along, 0.0, 1.0)[:, :, None] * self.wall_directions
+        wall_gaps = np.sqrt((closest * closest).sum(axis=2)) - radius - b2_polygonRadius - margin
+        approaching = (closest * velocity[:, None, :]).sum(axis=2) < 0
+        wall_times = wall_gaps / speed[:, None]
+        # A ball is pocketed as soon as it overlaps a pocket's sensor
+        to_pocket = position[:, None, :] - self.pocket_positions[None, :, :]
+        pocket_gaps = np.sqrt((to_pocket * to_pocket).sum(axis=2)) - Constants.POCKET_RADIUS - margin
+        pocket_approaching = (to_pocket * velocity[:, None, :]).sum(axis=2) < 0
+        pocket_times = pocket_gaps / speed[:, None]
+        times = np.concatenate((times, wall_times[approaching], pocket_times[pocket_approaching]))
+
+        steps = min(max_steps, Constants.ADAPTIVE_MAX_STEPS)
+        if len(times) > 0:
+            steps = min(steps, int(max(0.0, times.min()) // time_step))
+        # Every step damps the squared speeds by the same factor
+        total = (speed * speed).sum()
+        if steps > 0 and total > limit:
+            damping = 1 / (1 + time_step * Constants.LINEAR_DAMPING)
+            steps = min(steps, math.ceil(math.log(limit / total) / (2 * math.log(damping))))
+        return steps
+
+    # Moves and damps every ball the way Box2D would over steps steps of time_step in
+    # which nothing touches: each step the velocity is damped by 1 / (1 + h * c) and
+    # then the ball moves by h times the damped velocity
+    def advance(self, time_step, steps):
+        for ball in self.balls:
+            if not ball.awake:
+                continue
+            damping = 1 / (1 + time_step * ball.linearDamping)
+            scale = damping ** steps
+            distance = time_step * damping * (1 - scale) / (1 - damping)
+            x, y = ball.linearVelocity
+            px, py = ball.position
+            ball.transform = ((px + x * distance, py + y * distance), ball.angle)
+            ball.linearVelocity = (x * scale, y * scale)
+
+    def at_rest(self, rest_energy) -> bool:
+        # Every ball has the same mass, so the energy is compared as a sum of squared speeds
+        limit = 2 * rest_energy / (Constants.BALL_DENSITY * math.pi * Constants.BALL_RADIUS * Constants.BALL_RADIUS)
+        total = 0.0
+        for ball in self.balls:
+            if ball.awake:
+                x, y = ball.linearVelocity
+                total += x * x + y * y
+                if total > limit:
+                    return False
+        return True
+
+    # Tells apart worlds whose simulations can end differently, for the simulation cache.
+    # It covers the settings of the world, the Box2D version and the constants a
+    # simulation depends on
+    def settings_key(self) -> str:
+        return (f"box2d={Box2D.__version__}:reuse={int(self.reuse_bodies)}:adaptive={int(self.adaptive_stepping)}"
+                f":step={Constants.TIME_STEP!r}:iters={Constants.VEL_ITERS},{Constants.POS_ITERS}:rest={Constants.REST_ENERGY!r}"
+                f":ball={Constants.BALL_RADIUS!r},{Constants.BALL_DENSITY!r},{Constants.BALL_RESTITUTION!r},{Constants.LINEAR_DAMPING!r},{Constants.ANGULAR_DAMPING!r}"
+                f":wall={Constants.WALL_RESTITUTION!r},{Constants.FRICTION!r}:pocket={Constants.POCKET_RADIUS!r}")
+
+    def get_board_state(self):
+        cue_ball = None
+        balls = []
+        for ball in self.pocketed_balls:
+            if ball.number == Constants.CUE_BALL:
+                cue_ball = ball
+            else:
+                balls.append(ball)
+        for ball in self.balls:
+            if ball.userData.number == Constants.CUE_BALL:
+                cue_ball = Ball.from_b2_body(ball)
+            else:
+                balls.append(Ball.from_b2_body(ball))
+        if cue_ball is None:
+            raise Exception("Cue ball doesn't exist")
+        return PoolBoard(cue_ball, balls, self.board)
+
+    def get_graphics(self):
+        return PoolGraphics(self.pockets, self.pocketed_balls, [Ball.from_b2_body(body) for body in self.balls], self.board)
+
+    # Returns the closed chain of vertices for each cushion of the table
+    @staticmethod
+    def create_walls(pockets : List[Point]) -> List[List[Tuple[float, float]]]:
+        top_left = pockets[0]
+        top_middle = pockets[1]
+        top_right = pockets[2]
+        bottom_left = pockets[3]
+        bottom_middle = pockets[4]
+        bottom_right = pockets[5]
+        
+        thickness = Constants.POCKET_RADIUS
+        return [
+            PoolWorld.wall_vertices(top_left, top_middle, True),
+            PoolWorld.wall_vertices(Point(top_middle.x, top_middle.y + 0.1), top_right, True),
+            PoolWorld.wall_vertices(top_right, bottom_right, False),
+            PoolWorld.wall_vertices(Point(top_left.x - thickness, top_left.y), Point(bottom_left.x - thickness, bottom_left.y), False),
+            PoolWorld.wall_vertices(Point(bottom_left.x, bottom_left.y + thickness), Point(bottom_middle.x, bottom_middle.y + thickness), True),
+            PoolWorld.wall_vertices(Point(bottom_middle.x, bottom_middle.y + thickness - 0.1), Point(bottom_right.x, bottom_right.y + thickness), True),
+        ]
+
+    @staticmethod
+    def wall_vertices(pocket1:Point, pocket2:Point, horizontal:bool) -> List[Tuple[float, float]]:
+        vertices = []
+        diff = Constants.POCKET_RADIUS + 0.05
+        thickness = Constants.POCKET_RADIUS
+        if horizontal:
+            vertices.append((pocket1.x + diff, pocket1.y))
+            vertices.append((pocket2.x - diff, pocket1.y))
+            vertices.append((pocket2.x - diff, pocket1.y - thickness))
+            vertices.append((pocket1.x + diff, pocket1.y - thickness))
+        else:
+            vertices.append((pocket1.x, pocket1.y + diff))
+            vertices.append((pocket1.x, pocket2.y - diff))
+            vertices.append((pocket1.x + thickness, pocket2.y - diff))
+            vertices.append((pocket1.x + thickness, pocket1.y + diff))
+        vertices.append(vertices[0])
+        return vertices
+
+    @staticmethod
+    def create_pockets() -> List[Point]:
+        pockets = []
+        for i in range(6):
+            n = i % 3
+            if n == 0:
+                x = Constants.POCKET_RADIUS
+            elif n == 1:
+                x = Constants.TABLE_WIDTH / 2
+            else:
+                x = Constants.TABLE_WIDTH - Constants.POCKET_RADIUS
+            if i == 1:
+                y = Constants.POCKET_RADIUS - 0.1
+            elif i == 4:
+                y = Constants.TABLE_HEIGHT - Constants.POCKET_RADIUS + 0.1
+            else:
+                y = Constants.POCKET_RADIUS if i <= 2 else Constants.TABLE_HEIGHT - Constants.POCKET_RADIUS
+            pockets.append(Point(x, y))
+        return pockets
+
+# A thread safe pool of PoolWorlds. Each search or game checks a world out for as long as
+# it needs it, which lets several of them run in one process at the same time.
+class WorldPool:
+
+    def __init__(self, size : int = None, prebuilt : int = 0, reuse_bodies : bool = True, adaptive_stepping : bool = False):
+        # size is the most worlds that will ever be created, None means no limit
+        self.size = size
+        # Worlds in a pool load thousands of boards, so by default they reuse their bodies
+        self.reuse_bodies = reuse_bodies
+        self.adaptive_stepping = adaptive_stepping
+        self.created = 0
+        self.idle : List[PoolWorld] = []
+        self.condition = threading.Condition()
+        self.fill(prebuilt)
+
+    # Builds worlds ahead of time until count of them are idle
+    def fill(self, count : int):
+        while True:
+            with self.condition:
+                if len(self.idle) >= count or (self.size is not None and self.created >= self.size):
+                    return
+                self.created += 1
+            world = PoolWorld(reuse_bodies=self.reuse_bodies, adaptive_stepping=self.adaptive_stepping)
+            with self.condition:
+                self.idle.append(world)
+                self.condition.notify()
+
+    def acquire(self, timeout : float = None) -> PoolWorld:
+        with self.condition:
+            while len(self.idle) == 0:
+                if self.size is None or self.created < self.size:
+                    self.created += 1
+                    break
+                if not self.condition.wait(timeout):
+                    raise TimeoutError("No PoolWorld was released in time")
+            else:
+                return self.idle.pop()
+        return PoolWorld(reuse_bodies=self.reuse_bodies, adaptive_stepping=self.adaptive_stepping)
+
+    def release(self, world : PoolWorld):
+        with self.condition:
+            self.idle.append(world)
+            self.condition.notify()
+
+    @contextmanager
+    def checkout(self, timeout : float = None):
+        world = self.acquire(timeout)
+        try:
+            yield world
+        finally:
+            self.release(world)
+
+# Worlds used by AIs that were not given a world of their own
+DEFAULT_WORLD_POOL = WorldPool()
+
+class PoolGraphics:
+    def __init__(self, pockets : List[Point], pocketed_balls : List[Ball], unpocketed_balls : List[Ball], board : PoolBoard):
+        self.pockets = pockets
+        self.pocketed_balls = pocketed_balls
+        self.unpocketed_balls = unpocketed_balls
+        self.board = board